@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+AI Common Platform - RAG 检索性能基准
+
+按 SAMPLE_DOCUMENTS 的分类、句式和标签生成合成的中文企业文档，在独立的临时数据库中
+建立索引并回放查询集，统计每种检索模式的延迟（p50/p95/p99）、QPS、召回率，
+以及索引构建耗时与内存占用，结果写入 JSON，便于不同提交之间对比。
+
+每个规模在单独的子进程中运行（rag_service 的数据库路径在导入时确定），不会影响服务的数据。
+
+用法:
+    python scripts/benchmark_rag.py --docs 10000,100000 --queries 500 --output bench.json
+    python scripts/benchmark_rag.py --docs 10000 --compare bench_old.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+RAG_SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "rag_service")
+
+ALL_MODES = ["keyword", "bm25", "fts", "vector", "hybrid"]
+INSERT_BATCH_SIZE = 1000
+
+# 合成文档的标题后缀与来源系统
+TITLE_SUFFIXES = ["", "（修订版）", "（2024年）", "（2025年）", "补充说明", "执行细则", "常见问题", "月度更新", "第二版"]
+SOURCES = ["internal", "wiki", "erp_system", "crm_system", "hr_system", "oa_system"]
+_CLAUSE = re.compile(r"[^。；！？]+[。；！？]?")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+class CorpusGenerator:
+    """以样本文档为模板：同一分类内随机组合句子并替换数字，标题与标签取自同分类样本"""
+
+    def __init__(self, samples, seed: int = 42):
+        self.rng = random.Random(seed)
+        self.by_category: Dict[str, Dict[str, List]] = {}
+        for doc in samples:
+            pool = self.by_category.setdefault(doc.category, {"titles": [], "clauses": [], "tags": []})
+            pool["titles"].append(doc.title)
+            pool["clauses"].extend(clause for clause in _CLAUSE.findall(doc.content) if clause.strip())
+            pool["tags"].extend(doc.tags)
+        self.categories = sorted(self.by_category)
+
+    def _vary(self, text: str) -> str:
+        return _NUMBER.sub(lambda m: str(self.rng.randint(1, 9999)), text)
+
+    def document(self, n: int) -> Dict[str, Any]:
+        category = self.categories[n % len(self.categories)]
+        pool = self.by_category[category]
+        clauses = self.rng.sample(pool["clauses"], min(len(pool["clauses"]), self.rng.randint(3, 8)))
+        return {
+            "id": f"bench_{n:07d}",
+            "title": self.rng.choice(pool["titles"]) + self.rng.choice(TITLE_SUFFIXES),
+            "content": "".join(self._vary(clause) for clause in clauses),
+            "category": category,
+            "tags": self.rng.sample(pool["tags"], min(len(pool["tags"]), 3)),
+            "source": self.rng.choice(SOURCES),
+        }
+
+    def query(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """已知目标文档的查询：标题，或内容中的一段原文（可能带分类过滤）"""
+        if self.rng.random() < 0.3:
+            text = doc["title"]
+        else:
+            length = self.rng.randint(4, 16)
+            start = self.rng.randint(0, max(0, len(doc["content"]) - length))
+            text = doc["content"][start:start + length]
+        return {
+            "query": text,
+            "category": doc["category"] if self.rng.random() < 0.3 else None,
+            "target": doc["id"],
+        }
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def rss_mb() -> float:
+    """当前进程常驻内存（MB）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_scale(config: Dict[str, Any], workdir: str) -> Dict[str, Any]:
+    """在子进程中运行一个规模：生成语料、建索引、回放查询"""
+    os.environ["RAG_DB_PATH"] = os.path.join(workdir, "vector_store.db")
+    os.environ.setdefault("RAG_QUERY_CACHE_SIZE", "0")
+    sys.path.insert(0, RAG_SERVICE_DIR)
+    import logging
+    logging.disable(logging.INFO)
+    import heapq
+    import main
+    from snapshot import DeltaLog
+
+    n_docs, top_k = config["docs"], config["top_k"]
+    generator = CorpusGenerator(main.SAMPLE_DOCUMENTS, config["seed"])
+    result: Dict[str, Any] = {"docs": n_docs, "build": {}, "memory": {}, "modes": {}}
+    rss_start = rss_mb()
+
+    main.init_db()
+    main.delta_log = DeltaLog(main.SNAPSHOT_DIR)
+
+    # 1. 写入（SQLite + 倒排索引 + 向量 + 近重复签名），keep 策略避免近重复检测改变语料
+    print(f"📝 [{n_docs}] 生成并写入文档...", flush=True)
+    start = time.time()
+    sample_docs = []
+    stride = max(1, n_docs // (config["queries"] * 4))
+    for batch_start in range(0, n_docs, INSERT_BATCH_SIZE):
+        batch = [generator.document(n) for n in range(batch_start, min(n_docs, batch_start + INSERT_BATCH_SIZE))]
+        sample_docs.extend(doc for i, doc in enumerate(batch, batch_start) if i % stride == 0)
+        main.insert_documents([main.Document(**doc) for doc in batch], "keep")
+    result["build"]["insert_seconds"] = round(time.time() - start, 3)
+    result["build"]["insert_docs_per_second"] = round(n_docs / max(result["build"]["insert_seconds"], 1e-9), 1)
+
+    # 2. 快照：冻结为只读段，再从快照 mmap 加载（服务重启后的稳态）
+    start = time.time()
+    main.save_snapshot({})
+    result["build"]["snapshot_seconds"] = round(time.time() - start, 3)
+    start = time.time()
+    main.restore_from_snapshot()
+    result["build"]["restore_seconds"] = round(time.time() - start, 3)
+
+    # 3. ANN（IVF）索引
+    if config["ann"]:
+        start = time.time()
+        main.train_ann({"processed": 0})
+        result["build"]["ann_train_seconds"] = round(time.time() - start, 3)
+
+    base = main.text_index.base
+    result["memory"] = {
+        "rss_mb": round(rss_mb(), 1),
+        "rss_growth_mb": round(rss_mb() - rss_start, 1),
+        "text_base_mb": round(base.nbytes / 1024 / 1024, 1) if base is not None else 0.0,
+        "vectors_mb": round(main.vector_index.nbytes / 1024 / 1024, 1),
+        "db_mb": round(os.path.getsize(main.DB_PATH) / 1024 / 1024, 1),
+    }
+
+    queries = [generator.query(doc) for doc in generator.rng.sample(sample_docs, min(len(sample_docs), config["queries"]))]
+
+    # 精确（不剪枝、不走 ANN）的基线，用于计算 recall@k
+    def exact_bm25(q):
+        index = main.index_for(q["category"])
+        scores = index.bm25_scores(main.segmenter.tokenize(q["query"]), main.index_filter(index, q["category"]), main.text_index)
+        hits = heapq.nlargest(
+            top_k, ((docno, score) for docno, score in scores.items() if score >= main.BM25_MIN_SCORE),
+            key=lambda item: (item[1], -item[0])
+        )
+        return [index.doc_id(docno) for docno, score in hits]
+
+    exact_vectors = main.vector_index
+    if main.vector_index.quantized:
+        # 量化存储时以 float32 原始向量的暴力检索为基线（在内存统计之后加载，不计入内存占用）
+        exact_vectors = main.VectorIndex(main.VECTOR_DIM)
+        conn = main.get_db_connection()
+        rows = conn.execute('''
+        SELECT d.id, d.category, v.vector FROM documents d JOIN document_vectors v ON v.id = d.id
+        WHERE v.model = ? ORDER BY d.rowid
+        ''', (main.embedder.model_name,)).fetchall()
+        conn.close()
+        exact_vectors.add_batch(
+            [row["id"] for row in rows],
+            main.np.frombuffer(b"".join(row["vector"] for row in rows), dtype=main.np.float32).reshape(len(rows), -1),
+            [row["category"] for row in rows],
+        )
+
+    def exact_vector(q, limit=top_k):
+        hits = exact_vectors.search(main.embedder.embed(q["query"]), limit, q["category"])
+        return [doc_id for doc_id, score in hits if score >= main.VECTOR_MIN_SCORE]
+
+    def exact_hybrid(q):
+        limit = main.hybrid_candidates(top_k)
+        index = main.index_for(q["category"])
+        scores = index.bm25_scores(main.segmenter.tokenize(q["query"]), main.index_filter(index, q["category"]), main.text_index)
+        lexical = heapq.nlargest(
+            limit, ((docno, score) for docno, score in scores.items() if score >= main.BM25_MIN_SCORE),
+            key=lambda item: (item[1], -item[0])
+        )
+        return main.reciprocal_rank_fusion(
+            [[index.doc_id(docno) for docno, score in lexical], exact_vector(q, limit)], top_k
+        )
+
+    baselines = {"bm25": exact_bm25, "vector": exact_vector, "hybrid": exact_hybrid}
+
+    for mode in config["modes"]:
+        if mode == "fts" and not main.FTS_ENABLED:
+            print(f"⚠️  [{n_docs}] FTS5 不可用，跳过 fts 模式")
+            continue
+        search = main.SEARCH_MODES[mode]
+        latencies, hits, recalls = [], 0, []
+        # keyword 模式的调试输出写入 stderr，计时期间丢弃
+        with contextlib.redirect_stderr(io.StringIO()):
+            for q in queries[:config["warmup"]]:
+                search(main.SearchQuery(query=q["query"], top_k=top_k, category=q["category"], mode=mode))
+            wall_start = time.time()
+            for q in queries:
+                query = main.SearchQuery(query=q["query"], top_k=top_k, category=q["category"], mode=mode)
+                start = time.perf_counter()
+                docs = search(query)
+                latencies.append((time.perf_counter() - start) * 1000)
+                ids = [doc.id for doc in docs]
+                hits += q["target"] in ids
+                if mode in baselines:
+                    expected = baselines[mode](q)
+                    if expected:
+                        recalls.append(len(set(ids) & set(expected)) / len(expected))
+            wall = time.time() - wall_start
+        result["modes"][mode] = {
+            "queries": len(queries),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(sum(latencies) / max(len(latencies), 1), 3),
+            "qps": round(len(queries) / max(wall, 1e-9), 1),
+            # 与精确检索结果的重合率；keyword / fts 没有近似路径，不计算
+            "recall_at_k": round(sum(recalls) / len(recalls), 4) if recalls else None,
+            # 查询来源文档出现在 top_k 中的比例
+            "hit_at_k": round(hits / max(len(queries), 1), 4),
+        }
+        stats = result["modes"][mode]
+        print(
+            f"✅ [{n_docs}] {mode:8s} p50={stats['p50_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms "
+            f"p99={stats['p99_ms']:.2f}ms qps={stats['qps']:.0f} recall@{top_k}={stats['recall_at_k']} "
+            f"hit@{top_k}={stats['hit_at_k']}",
+            flush=True
+        )
+    return result
+
+
+def _scale_worker(config: Dict[str, Any], workdir: str, queue):
+    try:
+        queue.put(("ok", run_scale(config, workdir)))
+    except Exception as e:
+        queue.put(("error", f"{type(e).__name__}: {str(e)}"))
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAG_SERVICE_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline_path: str):
+    """与之前的结果对比 p95 延迟、QPS 与召回率"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {scale["docs"]: scale for scale in baseline.get("scales", [])}
+    print("\n" + "=" * 60)
+    print(f"对比: {baseline.get('commit')} -> {current.get('commit')}")
+    print("=" * 60)
+    for scale in current["scales"]:
+        old = previous.get(scale["docs"])
+        if old is None:
+            continue
+        for mode, stats in scale["modes"].items():
+            old_stats = old["modes"].get(mode)
+            if old_stats is None:
+                continue
+            p95_change = (stats["p95_ms"] / old_stats["p95_ms"] - 1) * 100 if old_stats["p95_ms"] else 0.0
+            recall_drop = (old_stats["recall_at_k"] or 0) - (stats["recall_at_k"] or 0)
+            flag = "⚠️ " if p95_change > 10 or recall_drop > 0.01 else "  "
+            print(
+                f"{flag}[{scale['docs']}] {mode:8s} p95 {old_stats['p95_ms']:.2f} -> {stats['p95_ms']:.2f}ms "
+                f"({p95_change:+.1f}%), qps {old_stats['qps']:.0f} -> {stats['qps']:.0f}, "
+                f"recall {old_stats['recall_at_k']} -> {stats['recall_at_k']}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG 检索性能基准")
+    parser.add_argument("--docs", default="10000", help="文档规模，逗号分隔（如 10000,100000,1000000）")
+    parser.add_argument("--queries", type=int, default=500, help="每种模式回放的查询数")
+    parser.add_argument("--warmup", type=int, default=20, help="计时前的预热查询数")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--modes", default=",".join(ALL_MODES), help="检索模式，逗号分隔")
+    parser.add_argument("--no-ann", action="store_true", help="不训练 IVF 索引（vector 模式暴力检索）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default=None, help="临时数据库目录（默认系统临时目录，结束后删除）")
+    parser.add_argument("--output", default="benchmark_rag.json")
+    parser.add_argument("--compare", default=None, help="与之前的结果 JSON 对比")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in modes if mode not in ALL_MODES]
+    if unknown:
+        parser.error(f"未知的检索模式: {', '.join(unknown)}")
+
+    print("\n" + "=" * 60)
+    print("RAG 检索性能基准")
+    print("=" * 60)
+
+    report: Dict[str, Any] = {
+        "commit": git_commit(),
+        "created_at": datetime.now().isoformat(),
+        "config": {
+            "queries": args.queries,
+            "top_k": args.top_k,
+            "modes": modes,
+            "ann": not args.no_ann,
+            "seed": args.seed,
+            "env": {key: value for key, value in os.environ.items() if key.startswith("RAG_")},
+        },
+        "scales": [],
+    }
+    context = multiprocessing.get_context("spawn")
+    for n_docs in [int(value) for value in args.docs.split(",") if value.strip()]:
+        config = dict(report["config"], docs=n_docs, warmup=args.warmup)
+        workdir = tempfile.mkdtemp(prefix=f"rag_bench_{n_docs}_", dir=args.workdir)
+        queue = context.Queue()
+        process = context.Process(target=_scale_worker, args=(config, workdir, queue))
+        process.start()
+        status, payload = queue.get()
+        process.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+        if status != "ok":
+            print(f"❌ [{n_docs}] 基准运行失败: {payload}")
+            continue
+        report["scales"].append(payload)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n📊 结果已写入 {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,12 @@ class Settings(BaseSettings):
     rag_timeout: int = 20
     llm_timeout: int = 60
     
+    # RAG 检索结果只返回与问题相关的片段，所有文档片段总长不超过该值（字符）
+    rag_max_snippet_chars: int = 900
+    # RAG 检索模式。默认 keyword：非空结果会被视为找到了上下文，而 vector / hybrid 对无关问题也会返回
+    # 相似度略高于阈值的文档（哈希向量的低相似度基本是噪声），在向量命中有可靠的门槛之前不作为默认值
+    rag_search_mode: str = "keyword"
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
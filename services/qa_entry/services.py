@@ -204,7 +204,9 @@ class QAProcessor:
                     "query": question,
                     "top_k": 3,
                     "category": category,
-                    "threshold": 0.5
+                    "mode": self.settings.rag_search_mode,
+                    "threshold": 0.5,
+                    "max_snippet_chars": self.settings.rag_max_snippet_chars
                 }
                 
                 async with session.post(
@@ -234,8 +236,11 @@ class QAProcessor:
                             "search_hint": "尝试使用不同的关键词或查看FAQ部分"
                         }
                     
-                    # 提取文档内容
-                    contents = [doc.get("content", "") for doc in documents if isinstance(doc, dict)]
+                    # 提取文档内容：优先使用与问题相关的片段，旧版 RAG 服务没有 snippets 时用全文
+                    contents = [
+                        "…".join(s.get("text", "") for s in doc["snippets"]) if doc.get("snippets") else doc.get("content", "")
+                        for doc in documents if isinstance(doc, dict)
+                    ]
                     sources = [doc.get("source", "") for doc in documents if isinstance(doc, dict)]
                     
                     combined_content = "\n".join(contents[:2])  # 最多取2个文档
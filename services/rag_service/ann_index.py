@@ -0,0 +1,128 @@
+"""
+近似最近邻索引 - IVF（倒排文件）
+
+用球面 k-means 把向量划分为 nlist 个簇，查询时只在与查询最相近的 nprobe 个簇内精确打分。
+nprobe 越大召回越高、延迟越高；nprobe >= nlist 时等价于暴力检索。
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+ASSIGN_BATCH_SIZE = 16384
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """球面 k-means（向量已归一化，按内积分配簇）"""
+    rng = np.random.default_rng(seed)
+    nlist = max(1, min(nlist, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = assign_lists(centroids, vectors)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=nlist)
+        # 空簇重新随机选点
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = _normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+def assign_lists(centroids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """分批计算每个向量所属的簇"""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BATCH_SIZE):
+        batch = vectors[start:start + ASSIGN_BATCH_SIZE]
+        assignment[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assignment
+
+
+class IVFIndex:
+    """IVF 索引：保存簇中心和每个簇内的文档 id，向量本身仍由 VectorIndex 持有"""
+
+    def __init__(self, model: str, centroids: np.ndarray, nprobe: int = 8):
+        self.model = model
+        self.centroids = centroids.astype(np.float32)
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._lists: List[Set[str]] = [set() for _ in range(len(centroids))]
+        self._assignment: Dict[str, int] = {}
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self._assignment)
+
+    def clear(self):
+        with self._lock:
+            for ids in self._lists:
+                ids.clear()
+            self._assignment.clear()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._assignment
+
+    def add_batch(self, doc_ids: Sequence[str], vectors: np.ndarray):
+        lists = assign_lists(self.centroids, vectors)
+        with self._lock:
+            for doc_id, list_no in zip(doc_ids, lists):
+                self._remove_locked(doc_id)
+                self._lists[list_no].add(doc_id)
+                self._assignment[doc_id] = int(list_no)
+
+    def remove(self, doc_id: str) -> bool:
+        with self._lock:
+            return self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: str) -> bool:
+        list_no = self._assignment.pop(doc_id, None)
+        if list_no is None:
+            return False
+        self._lists[list_no].discard(doc_id)
+        return True
+
+    def probe(self, query_vector: np.ndarray, nprobe: Optional[int] = None) -> List[str]:
+        """返回与查询最相近的 nprobe 个簇内的所有文档 id"""
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+        scores = self.centroids @ query_vector
+        if nprobe < self.nlist:
+            probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.nlist)
+        with self._lock:
+            return [doc_id for list_no in probes for doc_id in self._lists[list_no]]
+
+    def list_sizes(self) -> List[int]:
+        with self._lock:
+            return [len(ids) for ids in self._lists]
+
+    def save(self, path: str):
+        """保存到 .npz 文件（先写临时文件再替换，避免读到半截文件）"""
+        with self._lock:
+            doc_ids = list(self._assignment)
+            lists = np.fromiter((self._assignment[d] for d in doc_ids), dtype=np.int32, count=len(doc_ids))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, model=np.array(self.model), centroids=self.centroids,
+                     doc_ids=np.array(doc_ids, dtype=str), lists=lists)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = 8) -> "IVFIndex":
+        with np.load(path) as data:
+            index = cls(str(data["model"]), data["centroids"], nprobe)
+            for doc_id, list_no in zip(data["doc_ids"].tolist(), data["lists"].tolist()):
+                index._lists[list_no].add(doc_id)
+                index._assignment[doc_id] = list_no
+        return index
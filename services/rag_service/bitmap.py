@@ -0,0 +1,228 @@
+"""
+压缩位图 - Roaring 风格，存放文档编号集合
+
+编号按高 16 位分桶，每桶一个容器：
+- 数组容器：桶内元素不超过 ARRAY_MAX_SIZE 个时，存为有序的 uint16 数组；
+- 位集容器：元素较多时，存为 65536 位的 uint8 位集（8KB）。
+稀疏集合按元素数占用内存，稠密集合每个编号只占 1 位；交、并、差逐桶计算，
+只有两侧都存在的桶才需要运算，代价与集合大小成正比而不是与全部编号范围成正比。
+
+容器可以是快照文件 mmap 出来的只读数组，修改时先复制（写时复制）。
+"""
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+ARRAY_MAX_SIZE = 4096
+BITSET_BYTES = 1 << 13  # 65536 位
+ARRAY, BITSET = 0, 1
+
+
+def _is_bitset(container: np.ndarray) -> bool:
+    return container.dtype == np.uint8
+
+
+def _to_bitset(values: np.ndarray) -> np.ndarray:
+    bits = np.zeros(BITSET_BYTES, dtype=np.uint8)
+    values = values.astype(np.int64)
+    np.bitwise_or.at(bits, values >> 3, (1 << (values & 7)).astype(np.uint8))
+    return bits
+
+
+def _bitset_values(bits: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(bits, bitorder="little")).astype(np.uint16)
+
+
+def _bitset_count(bits: np.ndarray) -> int:
+    return int(np.unpackbits(bits).sum())
+
+
+def _compact(container: np.ndarray) -> Optional[np.ndarray]:
+    """运算结果的规范形式：空桶为 None，元素不多的位集转为数组"""
+    if _is_bitset(container):
+        if _bitset_count(container) > ARRAY_MAX_SIZE:
+            return container
+        container = _bitset_values(container)
+    if len(container) == 0:
+        return None
+    return container if len(container) <= ARRAY_MAX_SIZE else _to_bitset(container)
+
+
+def _shared(containers: Dict[int, np.ndarray]) -> Dict[int, np.ndarray]:
+    """容器被多个位图共用时标记为只读，之后谁修改谁复制"""
+    for container in containers.values():
+        container.flags.writeable = False
+    return dict(containers)
+
+
+def _bitset_contains(bits: np.ndarray, values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.int64)
+    return (bits[values >> 3] >> (values & 7).astype(np.uint8)) & 1 == 1
+
+
+class Bitmap:
+    """压缩位图（非负整数集合）"""
+
+    __slots__ = ("_containers",)
+
+    def __init__(self, containers: Optional[Dict[int, np.ndarray]] = None):
+        self._containers: Dict[int, np.ndarray] = containers if containers is not None else {}
+
+    @classmethod
+    def from_array(cls, values: Iterable[int]) -> "Bitmap":
+        """从整数序列构建（可无序、可重复）"""
+        values = np.unique(np.asarray(values if isinstance(values, np.ndarray) else list(values), dtype=np.int64))
+        containers: Dict[int, np.ndarray] = {}
+        if len(values):
+            highs = values >> 16
+            bounds = np.flatnonzero(np.diff(highs)) + 1
+            for chunk in np.split(values, bounds):
+                lows = (chunk & 0xFFFF).astype(np.uint16)
+                containers[int(chunk[0] >> 16)] = lows if len(lows) <= ARRAY_MAX_SIZE else _to_bitset(lows)
+        return cls(containers)
+
+    @classmethod
+    def from_range(cls, stop: int) -> "Bitmap":
+        """[0, stop) 的全部整数"""
+        return cls.from_array(np.arange(stop, dtype=np.int64))
+
+    def copy(self) -> "Bitmap":
+        """浅拷贝：容器共享，修改时各自复制"""
+        return Bitmap(_shared(self._containers))
+
+    def __len__(self) -> int:
+        return sum(_bitset_count(c) if _is_bitset(c) else len(c) for c in self._containers.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._containers)
+
+    def __contains__(self, value: int) -> bool:
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if _is_bitset(container):
+            return bool(container[low >> 3] >> (low & 7) & 1)
+        i = int(np.searchsorted(container, low))
+        return i < len(container) and container[i] == low
+
+    def add(self, value: int):
+        key, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(key)
+        if container is None:
+            self._containers[key] = np.array([low], dtype=np.uint16)
+        elif _is_bitset(container):
+            if not container.flags.writeable:
+                container = self._containers[key] = container.copy()
+            container[low >> 3] |= np.uint8(1 << (low & 7))
+        else:
+            i = int(np.searchsorted(container, low))
+            if i < len(container) and container[i] == low:
+                return
+            container = np.insert(container, i, low)
+            self._containers[key] = container if len(container) <= ARRAY_MAX_SIZE else _to_bitset(container)
+
+    def discard(self, value: int):
+        key, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(key)
+        if container is None:
+            return
+        if _is_bitset(container):
+            if not container.flags.writeable:
+                container = self._containers[key] = container.copy()
+            container[low >> 3] &= np.uint8(~(1 << (low & 7)) & 0xFF)
+            if _bitset_count(container) <= ARRAY_MAX_SIZE:
+                compacted = _compact(container)
+                if compacted is None:
+                    del self._containers[key]
+                else:
+                    self._containers[key] = compacted
+            return
+        i = int(np.searchsorted(container, low))
+        if i < len(container) and container[i] == low:
+            if len(container) == 1:
+                del self._containers[key]
+            else:
+                self._containers[key] = np.delete(container, i)
+
+    def to_array(self) -> np.ndarray:
+        """全部元素，升序 int64 数组"""
+        parts = [
+            (_bitset_values(c) if _is_bitset(c) else c).astype(np.int64) + (key << 16)
+            for key, c in sorted(self._containers.items())
+        ]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def contains_many(self, values: np.ndarray) -> np.ndarray:
+        """values 中每个元素是否在集合中（布尔数组）"""
+        values = np.asarray(values, dtype=np.int64)
+        result = np.zeros(len(values), dtype=bool)
+        if not len(values) or not self._containers:
+            return result
+        highs = values >> 16
+        for key in np.unique(highs).tolist():
+            container = self._containers.get(key)
+            if container is None:
+                continue
+            positions = np.flatnonzero(highs == key)
+            lows = values[positions] & 0xFFFF
+            if _is_bitset(container):
+                result[positions] = _bitset_contains(container, lows)
+            else:
+                i = np.minimum(np.searchsorted(container, lows), len(container) - 1)
+                result[positions] = container[i] == lows
+        return result
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        containers = {}
+        for key in self._containers.keys() & other._containers.keys():
+            a, b = self._containers[key], other._containers[key]
+            if _is_bitset(a) and _is_bitset(b):
+                result = _compact(a & b)
+            elif _is_bitset(a) or _is_bitset(b):
+                bits, array = (a, b) if _is_bitset(a) else (b, a)
+                result = array[_bitset_contains(bits, array)]
+            else:
+                result = np.intersect1d(a, b, assume_unique=True)
+            if result is not None and len(result):
+                containers[key] = result
+        return Bitmap(containers)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        containers = _shared(self._containers)
+        for key, b in other._containers.items():
+            a = containers.get(key)
+            if a is None:
+                b.flags.writeable = False
+                containers[key] = b
+            elif _is_bitset(a) or _is_bitset(b):
+                containers[key] = (a if _is_bitset(a) else _to_bitset(a)) | (b if _is_bitset(b) else _to_bitset(b))
+            else:
+                merged = np.union1d(a, b)
+                containers[key] = merged if len(merged) <= ARRAY_MAX_SIZE else _to_bitset(merged)
+        return Bitmap(containers)
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        containers = _shared(self._containers)
+        for key in self._containers.keys() & other._containers.keys():
+            a, b = self._containers[key], other._containers[key]
+            if _is_bitset(a):
+                result = _compact(a & ~(b if _is_bitset(b) else _to_bitset(b)))
+            elif _is_bitset(b):
+                result = a[~_bitset_contains(b, a)]
+            else:
+                result = np.setdiff1d(a, b, assume_unique=True)
+            if result is None or not len(result):
+                del containers[key]
+            else:
+                containers[key] = result
+        return Bitmap(containers)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self._containers.values())
+
+    def containers(self) -> Iterable[Tuple[int, int, np.ndarray]]:
+        """按桶号升序返回 (桶号, 容器类型, 容器数组)，供序列化使用"""
+        for key, container in sorted(self._containers.items()):
+            yield key, BITSET if _is_bitset(container) else ARRAY, container
@@ -0,0 +1,84 @@
+"""
+文档分段 - 按句子边界把长文档切分为有重叠的段落
+
+切分器是增量式的：feed() 可以逐块喂入文本（例如请求体的流式分块），
+每次只返回已经完整的段落，内存中最多保留一个段落加一个未结束的句子。
+"""
+import re
+from typing import List
+
+# 句子结束符（中英文句号、叹号、问号）及换行
+SENTENCE_END = re.compile(r"[^。！？!?\n]*[。！？!?\n]+")
+
+
+class PassageSplitter:
+    """增量式段落切分：段落不超过 max_chars，相邻段落重叠不超过 overlap 个字符的完整句子"""
+
+    def __init__(self, max_chars: int = 500, overlap: int = 100):
+        if max_chars <= 0:
+            raise ValueError("max_chars must be positive")
+        if not 0 <= overlap < max_chars:
+            raise ValueError("overlap must be between 0 and max_chars - 1")
+        self.max_chars = max_chars
+        self.overlap = overlap
+        self._tail = ""
+        self._sentences: List[str] = []
+        self._length = 0
+        # 当前段落中是否有上一段没有包含的新句子
+        self._fresh = False
+
+    def feed(self, text: str) -> List[str]:
+        """喂入一段文本，返回因此而完整的段落"""
+        self._tail += text
+        passages: List[str] = []
+        end = 0
+        for match in SENTENCE_END.finditer(self._tail):
+            passages.extend(self._add_sentence(match.group()))
+            end = match.end()
+        self._tail = self._tail[end:]
+        # 很长且没有句子边界的文本按长度强制切分
+        while len(self._tail) > self.max_chars:
+            passages.extend(self._add_sentence(self._tail[:self.max_chars]))
+            self._tail = self._tail[self.max_chars:]
+        return passages
+
+    def flush(self) -> List[str]:
+        """输入结束，返回剩余的段落"""
+        passages = self._add_sentence(self._tail) if self._tail else []
+        self._tail = ""
+        if self._fresh:
+            passages.extend(self._emit())
+        self._sentences, self._length, self._fresh = [], 0, False
+        return passages
+
+    def _add_sentence(self, sentence: str) -> List[str]:
+        passages: List[str] = []
+        for start in range(0, len(sentence), self.max_chars):
+            piece = sentence[start:start + self.max_chars]
+            if self._fresh and self._length + len(piece) > self.max_chars:
+                passages.extend(self._emit())
+                self._keep_overlap()
+            # 重叠部分加上新句子仍超长时，丢弃重叠
+            while self._sentences and self._length + len(piece) > self.max_chars:
+                self._length -= len(self._sentences.pop(0))
+            self._sentences.append(piece)
+            self._length += len(piece)
+            self._fresh = self._fresh or bool(piece.strip())
+        return passages
+
+    def _emit(self) -> List[str]:
+        passage = "".join(self._sentences).strip()
+        self._fresh = False
+        return [passage] if passage else []
+
+    def _keep_overlap(self):
+        """保留末尾总长不超过 overlap 的完整句子作为下一段的开头"""
+        kept: List[str] = []
+        length = 0
+        for sentence in reversed(self._sentences):
+            if length + len(sentence) > self.overlap:
+                break
+            kept.insert(0, sentence)
+            length += len(sentence)
+        self._sentences, self._length = kept, length
+
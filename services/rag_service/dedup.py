@@ -0,0 +1,154 @@
+"""
+近重复检测 - MinHash 签名 + LSH 分桶
+
+每个文档按字符 k-gram（去除空白）取 MinHash 签名，两个签名相同位置取值相等的比例即 Jaccard 相似度的估计。
+签名切分为 bands 段，每段 rows 个值作为一个桶键；只要有一段完全相同就成为候选，
+查询只访问签名所在的 bands 个桶，不随语料规模线性增长。
+相似度为 s 的两个文档成为候选的概率为 1 - (1 - s^rows)^bands，默认 8 x 8 时阈值约 0.77。
+"""
+import re
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+MERSENNE_PRIME = (1 << 31) - 1
+HASH_BATCH_SIZE = 4096
+_WHITESPACE = re.compile(r"\s+")
+
+
+class MinHasher:
+    """num_perm 个随机线性哈希 (a * h + b) mod p，签名为各哈希在全部 k-gram 上的最小值"""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> Set[str]:
+        text = _WHITESPACE.sub("", text)
+        if len(text) <= self.shingle_size:
+            return {text} if text else set()
+        return {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+
+    def signature(self, text: str) -> np.ndarray:
+        """uint32 签名；空文本的签名全部为最大值（与任何非空文本都不相似）"""
+        signature = np.full(self.num_perm, MERSENNE_PRIME, dtype=np.uint64)
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) & MERSENNE_PRIME for shingle in self.shingles(text)),
+            dtype=np.uint64
+        )
+        # 分批计算，长文档不会生成 k-gram 数 x num_perm 的大矩阵
+        for start in range(0, len(hashes), HASH_BATCH_SIZE):
+            batch = hashes[start:start + HASH_BATCH_SIZE]
+            values = (np.outer(batch, self._a) + self._b) % MERSENNE_PRIME
+            np.minimum(signature, values.min(axis=0), out=signature)
+        return signature.astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """由两个签名估计 Jaccard 相似度"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class LSHIndex:
+    """签名分段分桶：桶键为 (段号, 该段取值)，桶内为文档 id"""
+
+    def __init__(self, bands: int = 8, rows: int = 8):
+        self.bands = bands
+        self.rows = rows
+        self._lock = threading.RLock()
+        self._buckets: List[Dict[bytes, Set[str]]] = [defaultdict(set) for _ in range(bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._signatures
+
+    def _keys(self, signature: np.ndarray) -> List[bytes]:
+        if len(signature) != self.bands * self.rows:
+            raise ValueError(f"signature length {len(signature)} != {self.bands} bands x {self.rows} rows")
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, doc_id: str, signature: np.ndarray):
+        with self._lock:
+            self.remove(doc_id)
+            self._signatures[doc_id] = signature
+            for buckets, key in zip(self._buckets, self._keys(signature)):
+                buckets[key].add(doc_id)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            signature = self._signatures.pop(doc_id, None)
+            if signature is None:
+                return
+            for buckets, key in zip(self._buckets, self._keys(signature)):
+                bucket = buckets[key]
+                bucket.discard(doc_id)
+                if not bucket:
+                    del buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets = [defaultdict(set) for _ in range(self.bands)]
+            self._signatures.clear()
+
+    def signature(self, doc_id: str) -> Optional[np.ndarray]:
+        return self._signatures.get(doc_id)
+
+    def query(self, signature: np.ndarray, threshold: float, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """与签名相似度不低于 threshold 的文档 [(id, 相似度)]，按相似度降序（同分按 id）"""
+        with self._lock:
+            candidates: Set[str] = set()
+            for buckets, key in zip(self._buckets, self._keys(signature)):
+                candidates.update(buckets.get(key, ()))
+            candidates.discard(exclude)
+            matches = [(doc_id, similarity(signature, self._signatures[doc_id])) for doc_id in candidates]
+        return sorted(((doc_id, score) for doc_id, score in matches if score >= threshold), key=lambda m: (-m[1], m[0]))
+
+    def clusters(self, threshold: float) -> List[List[str]]:
+        """
+        全部近重复簇（每簇至少两个文档，簇内 id 排序，按簇大小降序）
+
+        只比较同桶的候选对，相似度达到阈值的两个文档并入同一簇（并查集，传递闭包）。
+        """
+        parent: Dict[str, str] = {}
+
+        def find(doc_id: str) -> str:
+            root = doc_id
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while doc_id != root:
+                parent[doc_id], doc_id = root, parent.get(doc_id, doc_id)
+            return root
+
+        with self._lock:
+            compared: Set[Tuple[str, str]] = set()
+            for buckets in self._buckets:
+                for bucket in buckets.values():
+                    if len(bucket) < 2:
+                        continue
+                    members = sorted(bucket)
+                    for i, a in enumerate(members):
+                        for b in members[i + 1:]:
+                            if (a, b) in compared or find(a) == find(b):
+                                continue
+                            compared.add((a, b))
+                            if similarity(self._signatures[a], self._signatures[b]) >= threshold:
+                                parent.setdefault(a, a)
+                                parent.setdefault(b, b)
+                                parent[find(b)] = find(a)
+
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for doc_id in parent:
+            groups[find(doc_id)].append(doc_id)
+        return sorted(
+            (sorted(members) for members in groups.values() if len(members) > 1),
+            key=lambda members: (-len(members), members[0])
+        )
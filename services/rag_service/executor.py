@@ -0,0 +1,79 @@
+"""
+检索线程池 / 进程池 - 把阻塞的检索（SQLite 查询、打分）移出事件循环
+
+每个池限制排队深度：执行中加排队的任务数达到 workers + max_queue 时直接拒绝，
+由接口返回 503 + Retry-After，而不是让请求在事件循环里无限堆积，导致 /health 探针超时。
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class ExecutorSaturated(Exception):
+    """线程池已满"""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} executor is saturated")
+        self.retry_after = retry_after
+
+
+class SearchExecutor:
+    """
+    带排队深度限制的线程池
+
+    processes=True 时改用进程池（spawn 启动，子进程不继承主进程的索引内存），
+    initializer 在每个子进程启动时执行；提交的函数与参数需可 pickle。
+    """
+
+    def __init__(self, name: str, workers: int = 4, max_queue: int = 64, retry_after: int = 1,
+                 processes: bool = False, initializer: Optional[Callable[[], None]] = None):
+        if workers <= 0:
+            raise ValueError("workers must be positive")
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.processes = processes
+        if processes:
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=initializer
+            )
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """在线程池中执行 fn(*args)，已满时抛出 ExecutorSaturated"""
+        with self._lock:
+            if self.pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(self.name, self.retry_after)
+            self.pending += 1
+        future = self._pool.submit(fn, *args)
+        # 任务真正结束（或排队中被取消）时才释放名额；客户端断开后已在执行的任务仍占用线程
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
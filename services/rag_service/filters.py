@@ -0,0 +1,379 @@
+"""
+过滤表达式与位图过滤索引 - 按分类、来源、标签的组合过滤检索范围
+
+表达式语法（关键字不区分大小写，取值可加单引号或双引号）：
+
+    source = hr_system AND tag IN (政策, 待遇)
+    category = hr AND NOT tag = 草稿
+    (source = wiki OR source = "hr_system") AND tag != 过期
+
+字段：category、source、tag（文档的任一标签等于该值即匹配）；
+运算：=、!=、IN (...)、NOT IN (...)、AND、OR、NOT 与括号，AND 优先于 OR。
+
+解析结果为由元组组成的语法树（可哈希、可跨进程传递）：
+("eq", 字段, 值) / ("in", 字段, (值, ...)) / ("not", 子树) / ("and", (子树, ...)) / ("or", (子树, ...))。
+
+FilterIndex 为每个 (字段, 值) 维护一个压缩位图，检索前按语法树做位图交并差，
+得到允许的文档编号集合，打分只在该集合内进行。
+"""
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bitmap import ARRAY, Bitmap
+from storage import StringTable, load_array, save_array
+
+FILTER_FIELDS = ("category", "source", "tag")
+MAX_FILTER_VALUES = 64  # 一个表达式中的取值总数上限
+# 序列化时 (字段, 值) 的分隔符；第 0 个位图为全部文档
+_KEY_SEP = "\x1f"
+
+_TOKEN = re.compile(r"""\s*(?:(?P<op>!=|=|\(|\)|,)|'(?P<sq>(?:[^']|'')*)'|"(?P<dq>(?:[^"]|"")*)"|(?P<word>[^\s=!(),'"]+))""")
+_KEYWORDS = {"and", "or", "not", "in"}
+
+FilterNode = tuple
+
+
+class FilterSyntaxError(ValueError):
+    """过滤表达式无法解析"""
+
+
+def _tokenize(text: str) -> List[Tuple[str, str]]:
+    """切分为 [(类型, 文本)]，类型为 op / keyword / value"""
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None:
+            raise FilterSyntaxError(f"unexpected character at position {pos}: {text[pos]!r}")
+        pos = match.end()
+        if match.group("op"):
+            tokens.append(("op", match.group("op")))
+        elif match.group("sq") is not None:
+            tokens.append(("value", match.group("sq").replace("''", "'")))
+        elif match.group("dq") is not None:
+            tokens.append(("value", match.group("dq").replace('""', '"')))
+        else:
+            word = match.group("word")
+            tokens.append(("keyword", word.lower()) if word.lower() in _KEYWORDS else ("value", word))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens: List[Tuple[str, str]]):
+        self.tokens = tokens
+        self.pos = 0
+        self.values = 0
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def accept(self, kind: str, text: Optional[str] = None) -> bool:
+        token = self.peek()
+        if token is not None and token[0] == kind and (text is None or token[1] == text):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, kind: str, text: Optional[str] = None) -> str:
+        token = self.peek()
+        if token is None or token[0] != kind or (text is not None and token[1] != text):
+            found = "end of expression" if token is None else repr(token[1])
+            raise FilterSyntaxError(f"expected {text or kind}, found {found}")
+        self.pos += 1
+        return token[1]
+
+    def parse(self) -> FilterNode:
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise FilterSyntaxError(f"unexpected {self.peek()[1]!r}")
+        return node
+
+    def parse_or(self) -> FilterNode:
+        children = [self.parse_and()]
+        while self.accept("keyword", "or"):
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else ("or", tuple(children))
+
+    def parse_and(self) -> FilterNode:
+        children = [self.parse_unary()]
+        while self.accept("keyword", "and"):
+            children.append(self.parse_unary())
+        return children[0] if len(children) == 1 else ("and", tuple(children))
+
+    def parse_unary(self) -> FilterNode:
+        if self.accept("keyword", "not"):
+            return ("not", self.parse_unary())
+        if self.accept("op", "("):
+            node = self.parse_or()
+            self.expect("op", ")")
+            return node
+        return self.parse_condition()
+
+    def value(self) -> str:
+        self.values += 1
+        if self.values > MAX_FILTER_VALUES:
+            raise FilterSyntaxError(f"too many values (max {MAX_FILTER_VALUES})")
+        return self.expect("value")
+
+    def parse_condition(self) -> FilterNode:
+        field = self.expect("value").lower()
+        if field not in FILTER_FIELDS:
+            raise FilterSyntaxError(f"unknown field {field!r}, expected one of {', '.join(FILTER_FIELDS)}")
+        if self.accept("op", "="):
+            return ("eq", field, self.value())
+        if self.accept("op", "!="):
+            return ("not", ("eq", field, self.value()))
+        negate = self.accept("keyword", "not")
+        self.expect("keyword", "in")
+        self.expect("op", "(")
+        values = [self.value()]
+        while self.accept("op", ","):
+            values.append(self.value())
+        self.expect("op", ")")
+        node = ("in", field, tuple(dict.fromkeys(values)))
+        return ("not", node) if negate else node
+
+
+@lru_cache(maxsize=1024)
+def parse_filter(text: str) -> FilterNode:
+    """解析过滤表达式，语法错误时抛出 FilterSyntaxError"""
+    tokens = _tokenize(text)
+    if not tokens:
+        raise FilterSyntaxError("empty filter expression")
+    return _Parser(tokens).parse()
+
+
+def with_category(node: Optional[FilterNode], category: Optional[str]) -> Optional[FilterNode]:
+    """把单独的分类条件并入过滤表达式"""
+    if not category:
+        return node
+    condition = ("eq", "category", category)
+    return condition if node is None else ("and", (condition, node))
+
+
+_SQL_COLUMNS = {"category": "{alias}.category", "source": "{alias}.source"}
+
+
+def filter_sql(node: FilterNode, alias: str = "d") -> Tuple[str, List[str]]:
+    """编译为 SQL 条件（documents 表别名为 alias），返回 (条件, 参数)"""
+    op = node[0]
+    if op in ("eq", "in"):
+        field = node[1]
+        values = [node[2]] if op == "eq" else list(node[2])
+        placeholders = "?" if op == "eq" else "(" + ",".join("?" * len(values)) + ")"
+        comparison = "=" if op == "eq" else "IN"
+        if field == "tag":
+            return f"EXISTS (SELECT 1 FROM json_each({alias}.tags) WHERE json_each.value {comparison} {placeholders})", values
+        return f"{_SQL_COLUMNS[field].format(alias=alias)} {comparison} {placeholders}", values
+    if op == "not":
+        sql, params = filter_sql(node[1], alias)
+        return f"NOT ({sql})", params
+    parts = [filter_sql(child, alias) for child in node[1]]
+    joiner = " AND " if op == "and" else " OR "
+    return joiner.join(f"({sql})" for sql, _ in parts), [param for _, params in parts for param in params]
+
+
+def document_values(category: str, source: str, tags: Iterable[str]) -> Tuple[Tuple[str, str], ...]:
+    """文档的 (字段, 值) 列表"""
+    return (("category", category), ("source", source)) + tuple(("tag", tag) for tag in dict.fromkeys(tags))
+
+
+class FilterIndex:
+    """
+    (字段, 值) -> 文档编号位图，另有全部文档的位图（NOT 的全集）
+
+    文档编号由调用方分配；通过 add 加入的文档记录其取值，删除时清除对应的位。
+    从快照加载的文档不记录取值，删除时只从全集中去掉，求值结果最后与全集求交。
+    新加入的编号先追加到各值的待合并列表，读取前再整批并入位图，避免逐个插入有序容器。
+    """
+
+    def __init__(self, bitmaps: Optional[Dict[Tuple[str, str], Bitmap]] = None, universe: Optional[Bitmap] = None):
+        self._lock = threading.Lock()
+        self._bitmaps: Dict[Tuple[str, str], Bitmap] = bitmaps if bitmaps is not None else {}
+        self._all = universe if universe is not None else Bitmap()
+        self._values: Dict[int, Tuple[Tuple[str, str], ...]] = {}
+        # 待合并的编号：(字段, 值) -> [docno]，None 对应全集
+        self._pending: Dict[Optional[Tuple[str, str]], List[int]] = {}
+
+    def _flush(self):
+        """把待合并的编号并入位图（调用方持有 _lock）"""
+        for key, docnos in self._pending.items():
+            added = Bitmap.from_array(docnos)
+            if key is None:
+                self._all = self._all | added
+            else:
+                bitmap = self._bitmaps.get(key)
+                self._bitmaps[key] = bitmap | added if bitmap is not None else added
+        self._pending.clear()
+
+    def copy(self) -> "FilterIndex":
+        """拷贝（位图容器共享，修改时各自复制）"""
+        with self._lock:
+            self._flush()
+            index = FilterIndex({key: bitmap.copy() for key, bitmap in self._bitmaps.items()}, self._all.copy())
+            index._values = dict(self._values)
+        return index
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._flush()
+            return len(self._all)
+
+    def add(self, docno: int, values: Sequence[Tuple[str, str]]):
+        with self._lock:
+            for key in values:
+                self._pending.setdefault(key, []).append(docno)
+            self._pending.setdefault(None, []).append(docno)
+            self._values[docno] = tuple(values)
+
+    def remove(self, docno: int):
+        with self._lock:
+            self._flush()
+            for key in self._values.pop(docno, ()):
+                bitmap = self._bitmaps.get(key)
+                if bitmap is not None:
+                    bitmap.discard(docno)
+                    if not bitmap:
+                        del self._bitmaps[key]
+            self._all.discard(docno)
+
+    def keys(self) -> List[Tuple[str, str]]:
+        with self._lock:
+            self._flush()
+            return list(self._bitmaps)
+
+    def bitmap(self, field: str, value: str) -> Bitmap:
+        return self._bitmaps.get((field, value)) or Bitmap()
+
+    def evaluate(self, node: FilterNode) -> Bitmap:
+        """求满足表达式的文档编号"""
+        with self._lock:
+            self._flush()
+            return self._evaluate(node) & self._all
+
+    def _evaluate(self, node: FilterNode) -> Bitmap:
+        op = node[0]
+        if op == "eq":
+            return self.bitmap(node[1], node[2])
+        if op == "in":
+            result = Bitmap()
+            for value in node[2]:
+                result = result | self.bitmap(node[1], value)
+            return result
+        if op == "not":
+            return self._all - self._evaluate(node[1])
+        if op == "or":
+            result = Bitmap()
+            for child in node[1]:
+                result = result | self._evaluate(child)
+            return result
+        # AND：先求肯定条件的交集（从最小的开始），否定条件改为做差，不必先对全集取补
+        positives = [self._evaluate(child) for child in node[1] if child[0] != "not"]
+        negatives = [child[1] for child in node[1] if child[0] == "not"]
+        if positives:
+            positives.sort(key=len)
+            result = positives[0]
+            for bitmap in positives[1:]:
+                if not result:
+                    break
+                result = result & bitmap
+        else:
+            result = self._all
+        for child in negatives:
+            if not result:
+                break
+            result = result - self._evaluate(child)
+        return result
+
+    def remap(self, mapping: np.ndarray) -> "FilterIndex":
+        """
+        按 mapping（旧编号 -> 新编号，-1 表示丢弃）重新编号，返回新的索引（不记录取值）
+
+        mapping 需保持相对顺序（单调递增），重新编号后的各位图仍然有序。
+        """
+        with self._lock:
+            self._flush()
+            bitmaps = {key: bitmap.copy() for key, bitmap in self._bitmaps.items()}
+            universe = self._all.copy()
+
+        def remap_bitmap(bitmap: Bitmap) -> Bitmap:
+            docnos = bitmap.to_array()
+            docnos = docnos[docnos < len(mapping)]
+            mapped = mapping[docnos]
+            return Bitmap.from_array(mapped[mapped >= 0])
+
+        universe = remap_bitmap(universe)
+        remapped_bitmaps = {}
+        for key, bitmap in bitmaps.items():
+            remapped = remap_bitmap(bitmap) & universe
+            if remapped:
+                remapped_bitmaps[key] = remapped
+        return FilterIndex(remapped_bitmaps, universe)
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            self._flush()
+            return self._all.nbytes + sum(bitmap.nbytes for bitmap in self._bitmaps.values())
+
+    def save(self, directory: str):
+        with self._lock:
+            self._flush()
+            keys = [""] + [field + _KEY_SEP + value for field, value in self._bitmaps]
+            bitmaps = [self._all] + list(self._bitmaps.values())
+        bitmap_offsets = [0]
+        container_keys, kinds, starts, sizes = [], [], [], []
+        arrays, bitsets = [np.zeros(0, dtype=np.uint16)], [np.zeros(0, dtype=np.uint8)]
+        array_size = bitset_size = 0
+        for bitmap in bitmaps:
+            for key, kind, container in bitmap.containers():
+                container_keys.append(key)
+                kinds.append(kind)
+                sizes.append(len(container))
+                if kind == ARRAY:
+                    starts.append(array_size)
+                    arrays.append(container)
+                    array_size += len(container)
+                else:
+                    starts.append(bitset_size)
+                    bitsets.append(container)
+                    bitset_size += len(container)
+            bitmap_offsets.append(len(container_keys))
+        StringTable.from_strings(keys).save(directory, "filter_keys")
+        save_array(directory, "filter_bitmap_offsets", np.array(bitmap_offsets, dtype=np.int64))
+        save_array(directory, "filter_container_keys", np.array(container_keys, dtype=np.int64))
+        save_array(directory, "filter_container_kinds", np.array(kinds, dtype=np.uint8))
+        save_array(directory, "filter_container_starts", np.array(starts, dtype=np.int64))
+        save_array(directory, "filter_container_sizes", np.array(sizes, dtype=np.int64))
+        save_array(directory, "filter_arrays", np.concatenate(arrays))
+        save_array(directory, "filter_bitsets", np.concatenate(bitsets))
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = "r") -> "FilterIndex":
+        """加载位图，容器为 mmap 数组的只读视图"""
+        keys = StringTable.load(directory, "filter_keys", None).tolist()
+        bitmap_offsets = load_array(directory, "filter_bitmap_offsets", None).tolist()
+        container_keys = load_array(directory, "filter_container_keys", None).tolist()
+        kinds = load_array(directory, "filter_container_kinds", None).tolist()
+        starts = load_array(directory, "filter_container_starts", None).tolist()
+        sizes = load_array(directory, "filter_container_sizes", None).tolist()
+        arrays = load_array(directory, "filter_arrays", mmap_mode)
+        bitsets = load_array(directory, "filter_bitsets", mmap_mode)
+        bitmaps = []
+        for i in range(len(keys)):
+            containers = {}
+            for j in range(bitmap_offsets[i], bitmap_offsets[i + 1]):
+                data = arrays if kinds[j] == ARRAY else bitsets
+                container = data[starts[j]:starts[j] + sizes[j]]
+                container.flags.writeable = False
+                containers[container_keys[j]] = container
+            bitmaps.append(Bitmap(containers))
+        return cls(
+            {tuple(key.split(_KEY_SEP, 1)): bitmap for key, bitmap in zip(keys[1:], bitmaps[1:])},
+            bitmaps[0]
+        )
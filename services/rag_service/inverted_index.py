@@ -0,0 +1,631 @@
+"""
+倒排索引 - 按分词得到的词项建立 posting list
+
+每个词项对应一个 posting list: {文档内部编号: (标题词频, 内容词频, 标签词频)}，
+检索时只需访问查询词项对应的 posting list，而不必逐个文档做子串扫描。
+文档与查询使用同一个分词器（segmenter.Segmenter）切分。
+
+索引由两部分组成：
+- 基础段（FrozenSegment）：只读的 CSR 数组，可从快照文件直接 mmap，段内文档被删除时只记录墓碑；
+- 增量部分：基础段之后新增的文档，保存在 dict 中。
+
+另外按分类、来源、标签维护位图过滤索引（filters.FilterIndex），带过滤条件的检索
+先求出允许的文档编号位图（subset），posting 只保留其中的文档。
+
+检索与写入可能在不同线程并发执行：写入在 _lock 内修改增量部分，读取（posting 查找、打分、短语候选）
+同样持有 _lock，不会遍历到正在修改的 dict。
+"""
+import heapq
+import math
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from bitmap import Bitmap
+from filters import FilterIndex, FilterNode, document_values
+from segmenter import Segmenter
+from storage import StringTable, load_array, save_array
+
+# 字段顺序与 posting 中词频元组的下标一致
+FIELDS = ("title", "content", "tags")
+TITLE, CONTENT, TAGS = 0, 1, 2
+
+# BM25F 参数：字段权重（标题、内容、标签）、词频饱和度 k1、长度归一化 b
+BM25_FIELD_WEIGHTS = (3.0, 1.0, 2.0)
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 剪枝比较时给得分上界留的余量，避免浮点求和顺序不同导致误剪
+PRUNE_EPSILON = 1e-9
+# 过滤集合小于 posting 长度的 1/该值 时，改为在 posting 中二分查找过滤集合中的文档
+SUBSET_PROBE_RATIO = 8
+
+
+class FrozenSegment:
+    """只读段：按字节序排列的词项表 + CSR 格式的 posting 数组，全部可 mmap"""
+
+    def __init__(self, terms: StringTable, term_offsets: np.ndarray, post_docnos: np.ndarray,
+                 post_tfs: np.ndarray, doc_ids: StringTable, doc_id_order: np.ndarray,
+                 category_codes: np.ndarray, category_names: List[str], field_lengths: np.ndarray,
+                 filters: FilterIndex):
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.post_docnos = post_docnos
+        self.post_tfs = post_tfs
+        self.doc_ids = doc_ids
+        self.doc_id_order = doc_id_order
+        self.category_codes = category_codes
+        self.category_names = category_names
+        self.field_lengths = field_lengths
+        self.filters = filters
+        self._category_lookup = {name: code for code, name in enumerate(category_names)}
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.terms.data, self.terms.offsets, self.term_offsets, self.post_docnos, self.post_tfs,
+                  self.doc_ids.data, self.doc_ids.offsets, self.doc_id_order, self.category_codes,
+                  self.field_lengths)
+        return sum(array.nbytes for array in arrays) + self.filters.nbytes
+
+    def total_lengths(self) -> List[int]:
+        if len(self) == 0:
+            return [0, 0, 0]
+        return [int(total) for total in self.field_lengths.sum(axis=0)]
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """返回 (docnos, tfs) 数组切片，词项不存在时返回 None"""
+        i = self.terms.find(term)
+        if i is None:
+            return None
+        start, end = int(self.term_offsets[i]), int(self.term_offsets[i + 1])
+        return self.post_docnos[start:end], self.post_tfs[start:end]
+
+    def docno(self, doc_id: str) -> Optional[int]:
+        return self.doc_ids.find(doc_id, self.doc_id_order)
+
+    def doc_id(self, docno: int) -> str:
+        return self.doc_ids[docno]
+
+    def category(self, docno: int) -> str:
+        return self.category_names[self.category_codes[docno]]
+
+    def category_code(self, category: str) -> Optional[int]:
+        return self._category_lookup.get(category)
+
+    def save(self, directory: str):
+        self.terms.save(directory, "terms")
+        save_array(directory, "term_offsets", self.term_offsets)
+        save_array(directory, "post_docnos", self.post_docnos)
+        save_array(directory, "post_tfs", self.post_tfs)
+        self.doc_ids.save(directory, "doc_ids")
+        save_array(directory, "doc_id_order", self.doc_id_order)
+        save_array(directory, "category_codes", self.category_codes)
+        StringTable.from_strings(self.category_names).save(directory, "category_names")
+        save_array(directory, "field_lengths", self.field_lengths)
+        self.filters.save(directory)
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = "r") -> "FrozenSegment":
+        return cls(
+            StringTable.load(directory, "terms", mmap_mode),
+            load_array(directory, "term_offsets", mmap_mode),
+            load_array(directory, "post_docnos", mmap_mode),
+            load_array(directory, "post_tfs", mmap_mode),
+            StringTable.load(directory, "doc_ids", mmap_mode),
+            load_array(directory, "doc_id_order", mmap_mode),
+            load_array(directory, "category_codes", mmap_mode),
+            StringTable.load(directory, "category_names", None).tolist(),
+            load_array(directory, "field_lengths", mmap_mode),
+            FilterIndex.load(directory, mmap_mode),
+        )
+
+
+class InvertedIndex:
+    """倒排索引：只读基础段 + 内存增量部分（词项 -> {docno: (title_tf, content_tf, tags_tf)}）"""
+
+    def __init__(self, segmenter: Segmenter, base: Optional[FrozenSegment] = None):
+        self.segmenter = segmenter
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[int, Tuple[int, int, int]]] = {}
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self._doc_ids: Dict[int, str] = {}
+        self._docnos: Dict[str, int] = {}
+        self._categories: Dict[int, str] = {}
+        # 每个文档各字段的词项数，以及全部文档的字段长度之和（用于 BM25 平均长度）
+        self._field_lengths: Dict[int, Tuple[int, int, int]] = {}
+        self.load_base(base)
+
+    def load_base(self, base: Optional[FrozenSegment]):
+        """用基础段替换索引全部内容（增量部分清空）"""
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_ids.clear()
+            self._docnos.clear()
+            self._categories.clear()
+            self._field_lengths.clear()
+            # 基础段文档的过滤位图共享基础段的容器，增量文档与墓碑在拷贝上修改
+            self._filters = base.filters.copy() if base is not None else FilterIndex()
+            # 基础段文档编号为 0..B-1，增量文档从 B 开始编号
+            self._base = base
+            self._base_count = len(base) if base is not None else 0
+            self._base_deleted: Set[int] = set()
+            self._base_deleted_array: Optional[np.ndarray] = None
+            self._total_lengths = base.total_lengths() if base is not None else [0, 0, 0]
+            self._next_docno = self._base_count
+
+    def __len__(self) -> int:
+        return self._base_count - len(self._base_deleted) + len(self._docnos)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self.docno(doc_id) is not None
+
+    @property
+    def base(self) -> Optional[FrozenSegment]:
+        return self._base
+
+    def clear(self):
+        self.load_base(None)
+
+    def add(self, doc_id: str, title: str, content: str, tags: Sequence[str], category: str, source: str = ""):
+        """添加（或替换）一个文档"""
+        tokenize = self.segmenter.tokenize
+        counters = [Counter(tokenize(title)), Counter(tokenize(content)), Counter(tokenize(" ".join(tags)))]
+        terms = set().union(*counters)
+
+        with self._lock:
+            self._remove_locked(doc_id)
+
+            docno = self._next_docno
+            self._next_docno += 1
+            for term in terms:
+                self._postings.setdefault(term, {})[docno] = (
+                    counters[TITLE][term], counters[CONTENT][term], counters[TAGS][term]
+                )
+
+            self._doc_terms[docno] = tuple(terms)
+            self._doc_ids[docno] = doc_id
+            self._docnos[doc_id] = docno
+            self._categories[docno] = category
+            self._filters.add(docno, document_values(category, source, tags))
+
+            lengths = tuple(sum(counter.values()) for counter in counters)
+            self._field_lengths[docno] = lengths
+            for i, length in enumerate(lengths):
+                self._total_lengths[i] += length
+
+    def add_batch(self, docs: Iterable[Tuple[str, str, str, Sequence[str], str, str]]):
+        """批量添加 (doc_id, title, content, tags, category, source)，整批只加一次锁"""
+        with self._lock:
+            for doc in docs:
+                self.add(*doc)
+
+    def remove(self, doc_id: str) -> bool:
+        """删除文档，返回是否存在"""
+        with self._lock:
+            return self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: str) -> bool:
+        docno = self._docnos.pop(doc_id, None)
+        if docno is None:
+            return self._remove_base(doc_id)
+
+        for term in self._doc_terms.pop(docno):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(docno, None)
+            if not posting:
+                del self._postings[term]
+
+        del self._doc_ids[docno]
+        del self._categories[docno]
+        self._filters.remove(docno)
+        for i, length in enumerate(self._field_lengths.pop(docno)):
+            self._total_lengths[i] -= length
+        return True
+
+    def _remove_base(self, doc_id: str) -> bool:
+        """基础段只读，删除时只记录墓碑"""
+        if self._base is None:
+            return False
+        docno = self._base.docno(doc_id)
+        if docno is None or docno in self._base_deleted:
+            return False
+        self._base_deleted.add(docno)
+        self._base_deleted_array = None
+        self._filters.remove(docno)
+        for i, length in enumerate(self._base.field_lengths[docno]):
+            self._total_lengths[i] -= int(length)
+        return True
+
+    def docno(self, doc_id: str) -> Optional[int]:
+        docno = self._docnos.get(doc_id)
+        if docno is None and self._base is not None:
+            docno = self._base.docno(doc_id)
+            if docno in self._base_deleted:
+                return None
+        return docno
+
+    def doc_id(self, docno: int) -> str:
+        if docno < self._base_count:
+            return self._base.doc_id(docno)
+        return self._doc_ids[docno]
+
+    def doc_ids(self, docnos: Iterable[int]) -> Dict[int, str]:
+        """检索结果的 {docno: doc_id}（保持顺序），检索之后被删除的文档不在其中"""
+        with self._lock:
+            result = {}
+            for docno in docnos:
+                if docno < self._base_count:
+                    if docno not in self._base_deleted:
+                        result[docno] = self._base.doc_id(docno)
+                elif docno in self._doc_ids:
+                    result[docno] = self._doc_ids[docno]
+            return result
+
+    def category(self, docno: int) -> str:
+        if docno < self._base_count:
+            return self._base.category(docno)
+        return self._categories[docno]
+
+    def _deleted_docnos(self) -> np.ndarray:
+        if self._base_deleted_array is None:
+            self._base_deleted_array = np.fromiter(self._base_deleted, dtype=np.int64, count=len(self._base_deleted))
+        return self._base_deleted_array
+
+    def select(self, node: FilterNode) -> Bitmap:
+        """满足过滤表达式的文档编号位图（已去除删除的文档）"""
+        return self._filters.evaluate(node)
+
+    def filter_stats(self) -> dict:
+        return {"values": len(self._filters.keys()), "bytes": self._filters.nbytes}
+
+    def _restrict(self, docnos: np.ndarray, subset: Bitmap) -> np.ndarray:
+        """
+        有序的 docnos 中属于 subset 的下标
+
+        subset 比 posting 小得多时逐个在 posting 中二分查找 subset 的文档，代价与过滤后的集合大小成正比；
+        否则逐个判断 posting 中的文档是否在位图中。
+        """
+        if len(subset) * SUBSET_PROBE_RATIO < len(docnos):
+            wanted = subset.to_array()
+            positions = np.minimum(np.searchsorted(docnos, wanted), len(docnos) - 1)
+            return positions[docnos[positions] == wanted]
+        return np.flatnonzero(subset.contains_many(docnos))
+
+    def _live_items(self, posting: Dict[int, Tuple[int, int, int]], subset: Optional[Bitmap]):
+        """增量 posting 中属于 subset 的 (docno, tfs)"""
+        if subset is None:
+            return posting.items()
+        if len(subset) < len(posting):
+            wanted = subset.to_array()
+            wanted = wanted[np.searchsorted(wanted, self._base_count):].tolist()
+            return ((docno, posting[docno]) for docno in wanted if docno in posting)
+        docnos = np.fromiter(posting, dtype=np.int64, count=len(posting))
+        return ((docno, posting[docno]) for docno in docnos[subset.contains_many(docnos)].tolist())
+
+    def _base_postings(self, term: str, subset: Optional[Bitmap] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """基础段中词项的 posting（去除墓碑，可限定在 subset 内）"""
+        if self._base is None:
+            return None
+        hit = self._base.postings(term)
+        if hit is None:
+            return None
+        docnos, tfs = hit
+        if subset is not None:
+            # subset 来自过滤位图，不含已删除的文档
+            keep = self._restrict(docnos, subset)
+            return docnos[keep], tfs[keep]
+        if self._base_deleted:
+            mask = ~np.isin(docnos, self._deleted_docnos())
+            docnos, tfs = docnos[mask], tfs[mask]
+        return docnos, tfs
+
+    def postings(self, term: str, subset: Optional[Bitmap] = None) -> Dict[int, Tuple[int, int, int]]:
+        """获取词项的 posting list（基础段 + 增量部分），可限定在 subset 内"""
+        with self._lock:
+            posting: Dict[int, Tuple[int, int, int]] = {}
+            base = self._base_postings(term, subset)
+            if base is not None:
+                docnos, tfs = base
+                posting.update(zip(docnos.tolist(), map(tuple, tfs.tolist())))
+            live = self._postings.get(term)
+            if live:
+                posting.update(self._live_items(live, subset))
+            return posting
+
+    def document_frequency(self, term: str) -> int:
+        with self._lock:
+            df = len(self._postings.get(term, ()))
+            base = self._base_postings(term)
+            if base is not None:
+                df += len(base[0])
+            return df
+
+    def average_field_lengths(self) -> Tuple[float, ...]:
+        with self._lock:
+            doc_count = max(len(self), 1)
+            return tuple(max(total / doc_count, 1.0) for total in self._total_lengths)
+
+    def idf(self, term: str) -> float:
+        """BM25 idf（加 1 保证非负）"""
+        with self._lock:
+            df = self.document_frequency(term)
+            return math.log(1.0 + max(len(self) - df + 0.5, 0.0) / (df + 0.5))
+
+    def bm25_scores(self, terms: Iterable[str], subset: Optional[Bitmap] = None,
+                    stats: Optional["InvertedIndex"] = None) -> Dict[int, float]:
+        """
+        BM25F 打分：各字段词频先按字段长度归一化并加权求和，再统一做词频饱和
+
+        只访问查询词项的 posting list，返回 {docno: score}。基础段的 posting 按数组整体计算。
+        subset 为过滤后允许的文档编号（None 表示不过滤）。
+        stats 为提供 idf 与平均字段长度的索引（分类分片使用全局统计，得分与全局索引一致），默认为自身。
+        """
+        return self.bm25_scores_batch([terms], subset, stats)[0]
+
+    def bm25_scores_batch(self, term_lists: Iterable[Iterable[str]], subset: Optional[Bitmap] = None,
+                          stats: Optional["InvertedIndex"] = None) -> List[Dict[int, float]]:
+        """多个查询一起打分：各查询共有的词项只访问一次 posting list"""
+        with self._lock:
+            return self._bm25_scores_batch(term_lists, subset, stats or self)
+
+    def _bm25_scores_batch(self, term_lists: Iterable[Iterable[str]], subset: Optional[Bitmap],
+                           stats: "InvertedIndex") -> List[Dict[int, float]]:
+        avg_lengths = stats.average_field_lengths()
+        contributions_by_term: Dict[str, List[Tuple[int, float]]] = {}
+        results = []
+        for terms in term_lists:
+            scores: Dict[int, float] = {}
+            for term in set(terms):
+                contributions = contributions_by_term.get(term)
+                if contributions is None:
+                    contributions = self._bm25_term(term, subset, stats, avg_lengths)
+                    contributions_by_term[term] = contributions
+                for docno, contribution in contributions:
+                    scores[docno] = scores.get(docno, 0.0) + contribution
+            results.append(scores)
+        return results
+
+    def _bm25_term(self, term: str, subset: Optional[Bitmap], stats: "InvertedIndex",
+                   avg_lengths: Tuple[float, ...], idf: Optional[float] = None,
+                   candidates: Optional[Set[int]] = None) -> List[Tuple[int, float]]:
+        """单个词项对各文档的得分贡献 [(docno, contribution)]；指定 candidates 时只计算这些文档"""
+        if idf is None:
+            idf = stats.idf(term)
+        contributions: List[Tuple[int, float]] = []
+
+        base = self._base_postings(term, subset)
+        if base is not None and len(base[0]):
+            docnos, tfs = base
+            if candidates is not None:
+                mask = np.isin(docnos, np.fromiter(candidates, dtype=np.int64, count=len(candidates)))
+                docnos, tfs = docnos[mask], tfs[mask]
+            norms = 1.0 - BM25_B + BM25_B * self._base.field_lengths[docnos] / np.array(avg_lengths)
+            weighted_tf = (tfs * np.array(BM25_FIELD_WEIGHTS) / norms).sum(axis=1)
+            values = idf * weighted_tf / (BM25_K1 + weighted_tf)
+            contributions.extend(zip(docnos.tolist(), values.tolist()))
+
+        posting = self._postings.get(term)
+        if not posting:
+            return contributions
+        if candidates is None:
+            items = self._live_items(posting, subset)
+        elif len(candidates) < len(posting):
+            # 候选来自已过滤的得分，不必再判断 subset
+            items = ((docno, posting[docno]) for docno in candidates if docno in posting)
+        else:
+            items = ((docno, tfs) for docno, tfs in posting.items() if docno in candidates)
+        for docno, tfs in items:
+            lengths = self._field_lengths[docno]
+            weighted_tf = 0.0
+            for i in range(len(FIELDS)):
+                if tfs[i]:
+                    norm = 1.0 - BM25_B + BM25_B * lengths[i] / avg_lengths[i]
+                    weighted_tf += BM25_FIELD_WEIGHTS[i] * tfs[i] / norm
+            contributions.append((docno, idf * weighted_tf / (BM25_K1 + weighted_tf)))
+        return contributions
+
+    def search_bm25(self, terms: Iterable[str], top_k: int, subset: Optional[Bitmap] = None,
+                    min_score: float = 0.0, stats: Optional["InvertedIndex"] = None) -> List[Tuple[int, float]]:
+        """返回 BM25 得分最高的 top_k 个 (docno, score)"""
+        return self.search_bm25_batch([terms], [top_k], subset, min_score, stats)[0]
+
+    def search_bm25_batch(self, term_lists: List[Iterable[str]], top_ks: List[int], subset: Optional[Bitmap] = None,
+                          min_score: float = 0.0, stats: Optional["InvertedIndex"] = None) -> List[List[Tuple[int, float]]]:
+        """批量 BM25 检索，top_ks 为各查询的返回数量；各查询共有的词项只完整计算一次"""
+        with self._lock:
+            return self._search_bm25_batch(term_lists, top_ks, subset, min_score, stats or self)
+
+    def _search_bm25_batch(self, term_lists: List[Iterable[str]], top_ks: List[int], subset: Optional[Bitmap],
+                           min_score: float, stats: "InvertedIndex") -> List[List[Tuple[int, float]]]:
+        avg_lengths = stats.average_field_lengths()
+        contributions_by_term: Dict[str, List[Tuple[int, float]]] = {}
+        results = []
+        for terms, top_k in zip(term_lists, top_ks):
+            scores = self._bm25_maxscore(set(terms), top_k, subset, min_score, stats, avg_lengths, contributions_by_term)
+            results.append(heapq.nlargest(
+                top_k,
+                ((docno, score) for docno, score in scores.items() if score >= min_score),
+                key=lambda item: (item[1], -item[0])
+            ))
+        return results
+
+    def _bm25_maxscore(self, terms: Set[str], top_k: int, subset: Optional[Bitmap], min_score: float,
+                       stats: "InvertedIndex", avg_lengths: Tuple[float, ...],
+                       contributions_by_term: Dict[str, List[Tuple[int, float]]]) -> Dict[int, float]:
+        """
+        MaxScore 剪枝打分，返回可能进入 top_k 的文档的完整得分
+
+        BM25 中 tf / (k1 + tf) < 1，单个词项的得分贡献不超过其 idf。词项按 idf 降序处理，
+        当剩余词项的上界之和低于当前门槛（第 top_k 名的已累计得分与 min_score 的较大者）时，
+        尚未出现的文档不可能进入结果：之后的词项只为已有候选补分，
+        候选的已累计得分加剩余上界也低于门槛时直接淘汰。
+        """
+        idfs = {term: stats.idf(term) for term in terms}
+        order = sorted(terms, key=lambda term: (-idfs[term], term))
+        remaining = [0.0] * (len(order) + 1)
+        for i in range(len(order) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + idfs[order[i]]
+
+        scores: Dict[int, float] = {}
+        candidates: Optional[Set[int]] = None
+        for i, term in enumerate(order):
+            if candidates is None:
+                contributions = contributions_by_term.get(term)
+                if contributions is None:
+                    contributions = self._bm25_term(term, subset, stats, avg_lengths, idfs[term])
+                    contributions_by_term[term] = contributions
+                for docno, contribution in contributions:
+                    scores[docno] = scores.get(docno, 0.0) + contribution
+            else:
+                if not candidates:
+                    break
+                contributions = contributions_by_term.get(term)
+                if contributions is None:
+                    contributions = self._bm25_term(term, subset, stats, avg_lengths, idfs[term], candidates)
+                for docno, contribution in contributions:
+                    if docno in candidates:
+                        scores[docno] += contribution
+
+            bound = remaining[i + 1] + PRUNE_EPSILON
+            threshold = min_score
+            # 已累计得分不超过已处理词项的上界之和，该和不大于剩余上界时不必求第 top_k 名
+            if len(scores) >= top_k > 0 and remaining[0] - remaining[i + 1] > bound:
+                threshold = max(threshold, heapq.nlargest(top_k, scores.values())[-1])
+            if bound < threshold:
+                candidates = {docno for docno, score in scores.items() if score + bound >= threshold}
+                scores = {docno: scores[docno] for docno in candidates}
+        return scores
+
+    def phrase_terms(self, phrase: str) -> Set[str]:
+        return set(self.segmenter.tokenize(phrase))
+
+    def phrase_candidates(self, phrase: str, subset: Optional[Bitmap] = None) -> Dict[int, List[bool]]:
+        """
+        查找可能包含整个短语的文档
+
+        返回 {docno: [标题可能包含, 内容可能包含, 标签可能包含]}，即短语切分出的词项都出现的文档。
+        短语本身就是一个词项时直接取它的 posting，结果是精确的；否则调用方需要再用原文校验。
+        短语切分不出词项（如单字）时无法使用索引，返回空字典。
+        """
+        terms = self.phrase_terms(phrase)
+        with self._lock:
+            return self._phrase_candidates(phrase, terms, subset)
+
+    def _phrase_candidates(self, phrase: str, terms: Set[str], subset: Optional[Bitmap]) -> Dict[int, List[bool]]:
+        if phrase in terms:
+            return {docno: [tf > 0 for tf in tfs] for docno, tfs in self.postings(phrase, subset).items()}
+        # 从最短的 posting list 开始求交集
+        terms = sorted(terms, key=self.document_frequency)
+        candidates: Optional[Dict[int, List[bool]]] = None
+        for term in terms:
+            posting = self.postings(term, subset)
+            if not posting:
+                return {}
+            if candidates is None:
+                candidates = {docno: [tf > 0 for tf in tfs] for docno, tfs in posting.items()}
+                continue
+            for docno in list(candidates):
+                tfs = posting.get(docno)
+                if tfs is None:
+                    del candidates[docno]
+                    continue
+                fields = candidates[docno]
+                for i in range(len(FIELDS)):
+                    fields[i] = fields[i] and tfs[i] > 0
+            if not candidates:
+                return {}
+        return candidates or {}
+
+    def freeze(self) -> FrozenSegment:
+        """
+        把基础段（去除墓碑）与增量部分合并为一个新的只读段
+
+        文档重新连续编号，基础段文档在前、增量文档按加入顺序在后，入库顺序保持不变。
+        """
+        with self._lock:
+            base = self._base
+            live_docnos = sorted(self._doc_ids)
+            doc_ids: List[str] = []
+            category_codes: List[int] = []
+            category_lookup: Dict[str, int] = {}
+            field_lengths = [np.zeros((0, 3), dtype=np.int32)]
+            term_parts, docno_parts, tf_parts = [], [], []
+
+            base_terms: List[str] = []
+            if base is not None:
+                keep = np.ones(self._base_count, dtype=bool)
+                keep[self._deleted_docnos()] = False
+                kept = np.flatnonzero(keep)
+                base_map = np.full(self._base_count, -1, dtype=np.int64)
+                base_map[kept] = np.arange(len(kept))
+
+                doc_ids.extend(base.doc_id(int(docno)) for docno in kept)
+                category_lookup.update((name, code) for code, name in enumerate(base.category_names))
+                category_codes.extend(base.category_codes[kept].tolist())
+                field_lengths.append(np.asarray(base.field_lengths[kept], dtype=np.int32))
+                base_terms = base.terms.tolist()
+
+            for docno in live_docnos:
+                doc_ids.append(self._doc_ids[docno])
+                category = self._categories[docno]
+                category_codes.append(category_lookup.setdefault(category, len(category_lookup)))
+            field_lengths.append(np.array([self._field_lengths[d] for d in live_docnos], dtype=np.int32).reshape(-1, 3))
+            live_map = {docno: len(doc_ids) - len(live_docnos) + i for i, docno in enumerate(live_docnos)}
+
+            # 过滤位图按同样的编号映射重排
+            docno_map = np.full(self._next_docno, -1, dtype=np.int64)
+            if base is not None:
+                docno_map[:self._base_count] = base_map
+            docno_map[np.array(live_docnos, dtype=np.int64)] = np.array([live_map[d] for d in live_docnos], dtype=np.int64)
+            filters = self._filters.remap(docno_map)
+
+            # Python 字符串按码点排序，与 UTF-8 字节序一致，可直接二分查找
+            all_terms = sorted(set(base_terms).union(self._postings))
+            term_lookup = {term: i for i, term in enumerate(all_terms)}
+
+            # 以 (词项, 文档, 词频) 三元组合并两部分，再排序为 CSR
+            if base_terms:
+                base_term_ids = np.array([term_lookup[term] for term in base_terms], dtype=np.int64)
+                mapped = base_map[base.post_docnos]
+                valid = mapped >= 0
+                term_parts.append(np.repeat(base_term_ids, np.diff(base.term_offsets))[valid])
+                docno_parts.append(mapped[valid])
+                tf_parts.append(np.asarray(base.post_tfs, dtype=np.int64)[valid])
+
+            live_terms, live_docs, live_tfs = [], [], []
+            for term, posting in self._postings.items():
+                term_id = term_lookup[term]
+                for docno, tfs in posting.items():
+                    live_terms.append(term_id)
+                    live_docs.append(live_map[docno])
+                    live_tfs.append(tfs)
+            term_parts.append(np.array(live_terms, dtype=np.int64))
+            docno_parts.append(np.array(live_docs, dtype=np.int64))
+            tf_parts.append(np.array(live_tfs, dtype=np.int64).reshape(-1, 3))
+
+        term_ids = np.concatenate(term_parts)
+        docnos = np.concatenate(docno_parts)
+        tfs = np.concatenate(tf_parts)
+        order = np.lexsort((docnos, term_ids))
+        term_offsets = np.zeros(len(all_terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(all_terms)), out=term_offsets[1:])
+
+        return FrozenSegment(
+            StringTable.from_strings(all_terms),
+            term_offsets,
+            docnos[order].astype(np.int32),
+            np.minimum(tfs[order], np.iinfo(np.uint16).max).astype(np.uint16),
+            StringTable.from_strings(doc_ids),
+            np.array(sorted(range(len(doc_ids)), key=doc_ids.__getitem__), dtype=np.int64),
+            np.array(category_codes, dtype=np.int32),
+            sorted(category_lookup, key=category_lookup.get),
+            np.concatenate(field_lengths),
+            filters,
+        )
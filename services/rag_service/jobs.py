@@ -0,0 +1,54 @@
+"""
+后台任务 - 同一时间只运行一个实例的长任务（向量生成、索引训练等）
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundJob:
+    """
+    单实例后台任务
+
+    target(state, *args) 在后台线程中执行，可通过 state 字典汇报进度
+    （processed/total 等），state 直接由状态接口返回。
+    """
+
+    def __init__(self, name: str, target: Callable[..., Any]):
+        self.name = name
+        self._target = target
+        self._lock = threading.Lock()
+        self.state: Dict[str, Any] = {"status": "idle", "processed": 0, "total": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def start(self, *args) -> bool:
+        """启动任务，已有任务在运行时返回 False"""
+        if not self._lock.acquire(blocking=False):
+            return False
+        self.state = {
+            "status": "running",
+            "processed": 0,
+            "total": 0,
+            "started_at": datetime.now().isoformat(),
+            "error": None
+        }
+        threading.Thread(target=self._run, args=args, name=self.name, daemon=True).start()
+        return True
+
+    def _run(self, *args):
+        try:
+            self._target(self.state, *args)
+            self.state["status"] = "completed"
+            logger.info(f"后台任务 {self.name} 完成: {self.state['processed']}/{self.state['total']}")
+        except Exception as e:
+            self.state.update(status="failed", error=str(e))
+            logger.error(f"后台任务 {self.name} 失败: {str(e)}")
+        finally:
+            self.state["finished_at"] = datetime.now().isoformat()
+            self._lock.release()
@@ -1,20 +1,54 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
+from collections import defaultdict
+import asyncio
 import time
+import re
 import sqlite3
 import json
 import os
 import logging
 from pathlib import Path
 
+import math
+import threading
+
+import numpy as np
+
+import codecs
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from ann_index import ASSIGN_BATCH_SIZE, IVFIndex, train_centroids
+from chunking import PassageSplitter
+from dedup import LSHIndex, MinHasher
+from executor import ExecutorSaturated, SearchExecutor
+from filters import FilterNode, FilterSyntaxError, filter_sql, parse_filter, with_category
+from bitmap import Bitmap
+from inverted_index import FrozenSegment, InvertedIndex
+from matcher import KeywordMatcher
+from jobs import BackgroundJob
+from query_cache import QueryCache, normalize_query
+from shards import CategoryShards
+from snippets import extract_snippets, query_matcher
+from segmenter import Segmenter
+from snapshot import DeltaLog, current_snapshot, read_manifest, write_snapshot
+from vector_store import HashingEmbedder, VectorIndex
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="RAG Service Lite", version="2.0.0")
 
+class Snippet(BaseModel):
+    text: str
+    start: int  # 在原文 content 中的字符偏移 [start, end)
+    end: int
+
 class Document(BaseModel):
     id: Optional[str] = None
     title: str
@@ -23,24 +57,55 @@ class Document(BaseModel):
     tags: List[str] = []
     source: str = "internal"
     created_at: Optional[datetime] = None
+    parent_id: Optional[str] = None  # 分段导入的段落所属的原文档 id
+    snippets: Optional[List[Snippet]] = None  # 检索时指定 max_snippet_chars 才返回，此时 content 为空
+
+# 单个查询最多返回的文档数
+SEARCH_MAX_TOP_K = int(os.getenv("RAG_SEARCH_MAX_TOP_K", "1000"))
 
 class SearchQuery(BaseModel):
     query: str
-    top_k: int = 5
+    top_k: int = Field(5, gt=0, le=SEARCH_MAX_TOP_K)
     category: Optional[str] = None
+    filter: Optional[str] = None  # 过滤表达式，如 source = hr_system AND tag IN (政策, 待遇)，见 filters.py
+    mode: str = "keyword"  # keyword: 倒排索引词项匹配; bm25: 倒排索引 BM25F; fts: SQLite FTS5 + bm25; vector: 向量相似度; hybrid: BM25 + 向量 RRF 融合
+    nprobe: Optional[int] = None  # vector / hybrid 模式下 IVF 探测的簇数，越大召回越高、越慢
+    max_snippet_chars: Optional[int] = None  # 指定时只返回与查询相关的片段，所有结果的片段总长不超过该值
 
 class SearchResult(BaseModel):
     documents: List[Document]
     total: int
     search_time: float
 
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchQuery]
+
+class BatchSearchResult(BaseModel):
+    results: List[SearchResult]  # 与 queries 一一对应
+    total: int
+    search_time: float
+
+class ReembedRequest(BaseModel):
+    full: bool = False  # False: 只为缺少向量的文档生成; True: 全部重新生成
+
+class RebuildRequest(BaseModel):
+    reload_dictionary: bool = False  # True: 重新读取分词词典文件，按修改后的词典重建倒排索引
+
+class AnnTrainRequest(BaseModel):
+    nlist: Optional[int] = None  # 簇数，默认 4 * sqrt(向量数)
+    iterations: int = 10
+
+class QuantizationReportRequest(BaseModel):
+    sample: int = Field(200, gt=0)  # 抽样查询数（以抽样文档的标题作为查询）
+    top_k: int = Field(10, gt=0, le=SEARCH_MAX_TOP_K)
+
 # 向量数据库配置
-DB_PATH = "/app/data/vector_store.db"
+DB_PATH = os.getenv("RAG_DB_PATH", "/app/data/vector_store.db")
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 def init_db():
     """初始化向量数据库"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -54,179 +119,1519 @@ def init_db():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     ''')
-    
+
+    # 文档向量（float32 BLOB），model 记录生成向量的嵌入模型
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS document_vectors (
+        id TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        vector BLOB NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS document_vectors_ad AFTER DELETE ON documents BEGIN
+        DELETE FROM document_vectors WHERE id = old.id;
+    END
+    ''')
+
+    # 文档 id 序列：从已有 doc_NNN 的最大编号开始，避免与已有文档冲突
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS id_sequences (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    INSERT OR IGNORE INTO id_sequences (name, value)
+    SELECT 'documents', COALESCE(MAX(CAST(substr(id, 5) AS INTEGER)), 0)
+    FROM documents WHERE id GLOB 'doc_[0-9]*'
+    ''')
+
+    # 分段导入：段落作为普通文档行存储，parent_id 指向 parent_documents 中的原文档
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(documents)')]
+    if 'parent_id' not in columns:
+        cursor.execute('ALTER TABLE documents ADD COLUMN parent_id TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_parent_id ON documents(parent_id)')
+    # 分类过滤与分类分片构建
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_category ON documents(category)')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS parent_documents (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        category TEXT NOT NULL,
+        tags TEXT,
+        source TEXT,
+        passages INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    # 文档内容 zlib 压缩后单独存放，documents.content 留空；检索打分只用内存索引，
+    # 只有最终返回的 top_k 文档才读取并解压内容
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS document_contents (
+        id TEXT PRIMARY KEY,
+        data BLOB NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS document_contents_ad AFTER DELETE ON documents BEGIN
+        DELETE FROM document_contents WHERE id = old.id;
+    END
+    ''')
+    migrate_contents(conn)
+
+    # 近重复检测的 MinHash 签名（uint32 BLOB）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS document_signatures (
+        id TEXT PRIMARY KEY,
+        signature BLOB NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS document_signatures_ad AFTER DELETE ON documents BEGIN
+        DELETE FROM document_signatures WHERE id = old.id;
+    END
+    ''')
+
     conn.commit()
+    init_fts(conn)
     conn.close()
 
+CONTENT_COMPRESS_LEVEL = int(os.getenv("RAG_CONTENT_COMPRESS_LEVEL", "6"))
+MIGRATE_BATCH_SIZE = 1000
+# 旧版全文索引的同步触发器（直接读取 documents.content）
+LEGACY_FTS_TRIGGERS = ("documents_fts_ai", "documents_fts_ad", "documents_fts_au")
+
+def compress_content(content: str) -> bytes:
+    return zlib.compress(content.encode("utf-8"), CONTENT_COMPRESS_LEVEL)
+
+def decompress_content(data: Optional[bytes]) -> str:
+    """SQL 函数 decompress()：document_contents.data -> 文本"""
+    return zlib.decompress(data).decode("utf-8") if data is not None else ""
+
+def migrate_contents(conn: sqlite3.Connection):
+    """把旧数据库 documents.content 中的原文压缩转存到 document_contents"""
+    pending = conn.execute("SELECT COUNT(*) FROM documents WHERE content != ''").fetchone()[0]
+    if not pending:
+        return
+    start_time = time.time()
+    # 旧触发器会在清空 content 时同步删除全文索引内容，先删除；全文索引随后由 init_fts 重建
+    for trigger in LEGACY_FTS_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    last_rowid = 0
+    while True:
+        rows = conn.execute(
+            "SELECT rowid, id, content FROM documents WHERE rowid > ? AND content != '' ORDER BY rowid LIMIT ?",
+            (last_rowid, MIGRATE_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            'INSERT OR REPLACE INTO document_contents (id, data) VALUES (?, ?)',
+            [(row['id'], compress_content(row['content'])) for row in rows]
+        )
+        last_rowid = rows[-1]['rowid']
+    conn.execute("UPDATE documents SET content = '' WHERE content != ''")
+    conn.commit()
+    logger.info(f"文档内容压缩迁移完成: {pending} 个文档, 耗时 {time.time() - start_time:.2f}s")
+
+# 标签在 documents 表中以 JSON 存储，写入全文索引前由 SQL 函数 tags_text() 展开为空格分隔的文本
+# （FTS5 外部内容视图中不能使用 json_each 相关子查询）
+FTS_TAGS_SQL = "tags_text({}.tags)"
+# bm25 字段权重：标题、内容、标签
+FTS_FIELD_WEIGHTS = (10.0, 1.0, 5.0)
+FTS_ENABLED = False
+
+def init_fts(conn: sqlite3.Connection):
+    """
+    创建 FTS5 全文索引（trigram 分词，适配中文）及同步触发器
+
+    外部内容表为视图 documents_fts_source（标题、解压后的内容、标签）。文档写入顺序为先 documents
+    后 document_contents：删除 documents 行之前（含 INSERT OR REPLACE 替换旧行）从全文索引删除，
+    写入 document_contents 后加入全文索引。
+    """
+    global FTS_ENABLED
+    cursor = conn.cursor()
+    existing = cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'documents_fts'"
+    ).fetchone()
+    if existing is not None and 'documents_fts_source' not in existing[0]:
+        # 旧版全文索引以 documents 表为外部内容，内容移到 document_contents 后重建
+        for trigger in LEGACY_FTS_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        cursor.execute('DROP TABLE documents_fts')
+        existing = None
+
+    cursor.execute(f'''
+    CREATE VIEW IF NOT EXISTS documents_fts_source AS
+    SELECT d.rowid AS doc_rowid, d.title AS title, decompress(c.data) AS content, {FTS_TAGS_SQL.format("d")} AS tags
+    FROM documents d JOIN document_contents c ON c.id = d.id
+    ''')
+    try:
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+            title, content, tags,
+            content='documents_fts_source', content_rowid='doc_rowid', tokenize='trigram'
+        )
+        ''')
+    except sqlite3.OperationalError as e:
+        logger.warning(f"SQLite 不支持 FTS5 trigram 分词，fts 检索模式不可用: {str(e)}")
+        return
+
+    new_tags = FTS_TAGS_SQL.format("new")
+    old_tags = FTS_TAGS_SQL.format("old")
+    cursor.executescript(f'''
+    CREATE TRIGGER IF NOT EXISTS documents_fts_bd BEFORE DELETE ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, title, content, tags)
+        SELECT 'delete', old.rowid, old.title, decompress(c.data), {old_tags}
+        FROM document_contents c WHERE c.id = old.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS documents_fts_bu BEFORE UPDATE ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, title, content, tags)
+        SELECT 'delete', old.rowid, old.title, decompress(c.data), {old_tags}
+        FROM document_contents c WHERE c.id = old.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS documents_fts_update AFTER UPDATE ON documents BEGIN
+        INSERT INTO documents_fts(rowid, title, content, tags)
+        SELECT new.rowid, new.title, decompress(c.data), {new_tags}
+        FROM document_contents c WHERE c.id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS document_contents_fts_ai AFTER INSERT ON document_contents BEGIN
+        INSERT INTO documents_fts(rowid, title, content, tags)
+        SELECT d.rowid, d.title, decompress(new.data), {FTS_TAGS_SQL.format("d")}
+        FROM documents d WHERE d.id = new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS document_contents_fts_bd BEFORE DELETE ON document_contents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, title, content, tags)
+        SELECT 'delete', d.rowid, d.title, decompress(old.data), {FTS_TAGS_SQL.format("d")}
+        FROM documents d WHERE d.id = old.id;
+    END;
+    ''')
+
+    if existing is None:
+        # 为已有文档补建全文索引
+        cursor.execute("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')")
+    conn.commit()
+    FTS_ENABLED = True
+
 def get_db_connection():
     """获取数据库连接"""
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    # INSERT OR REPLACE 删除旧行时需要触发删除触发器以同步全文索引
+    conn.execute('PRAGMA recursive_triggers = ON')
+    # 全文索引触发器与读取文档内容的查询都会用到
+    conn.create_function("decompress", 1, decompress_content, deterministic=True)
+    conn.create_function("tags_text", 1, tags_text, deterministic=True)
     return conn
 
+DOC_ID_PATTERN = re.compile(r"doc_(\d+)")
+
+def allocate_ids(conn: sqlite3.Connection, count: int, explicit_ids: List[str]) -> List[str]:
+    """
+    在当前写事务中分配 count 个文档 id（调用方需已执行 BEGIN IMMEDIATE）
+
+    同一批中显式指定的 doc_NNN 编号会推进序列，之后分配的 id 不会与之冲突。
+    """
+    floor = max((int(m.group(1)) for m in map(DOC_ID_PATTERN.fullmatch, explicit_ids) if m), default=0)
+    start = conn.execute("SELECT value FROM id_sequences WHERE name = 'documents'").fetchone()[0]
+    start = max(start, floor)
+    conn.execute("UPDATE id_sequences SET value = ? WHERE name = 'documents'", (start + count,))
+    return [f"doc_{n:03d}" for n in range(start + 1, start + count + 1)]
+
 def insert_document(doc: Document):
     """插入文档到向量数据库"""
+    insert_documents([doc])
+
+def insert_documents(docs: List[Document], dedup_policy: Optional[str] = None,
+                     duplicates: Optional[List[dict]] = None) -> List[str]:
+    """
+    批量写入文档：一个事务内分配 id 并 executemany 写入，提交后一次性更新检索索引
+
+    没有 id 的文档自动分配；同一批中 id 重复时以最后一个为准。返回写入的文档 id。
+    近重复文档按 dedup_policy（默认 DEDUP_POLICY）处理，检出的近重复记录追加到 duplicates。
+    """
+    signatures = [minhasher.signature(signature_text(doc.title, doc.content)) for doc in docs]
+    vectors = embedder.embed_batch([embedding_text(doc.title, doc.content, " ".join(doc.tags)) for doc in docs])
+    with index_write_lock:
+        conn = get_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            keep, merged, reports = resolve_duplicates(docs, signatures, dedup_policy or DEDUP_POLICY)
+            if merged:
+                merged_vectors = embedder.embed_batch([
+                    embedding_text(doc.title, doc.content, " ".join(doc.tags)) for doc in merged
+                ])
+                docs = [docs[i] for i in keep] + merged
+                signatures = [signatures[i] for i in keep] + [lsh_index.signature(doc.id) for doc in merged]
+                vectors = np.concatenate([vectors[keep].reshape(-1, VECTOR_DIM), merged_vectors])
+            elif len(keep) < len(docs):
+                docs = [docs[i] for i in keep]
+                signatures = [signatures[i] for i in keep]
+                vectors = vectors[keep]
+            missing = [doc for doc in docs if not doc.id]
+            explicit_ids = [doc.id for doc in docs if doc.id]
+            for doc, doc_id in zip(missing, allocate_ids(conn, len(missing), explicit_ids)):
+                doc.id = doc_id
+            latest = {doc.id: (doc, signature, vector) for doc, signature, vector in zip(docs, signatures, vectors)}
+            docs = [doc for doc, signature, vector in latest.values()]
+            signatures = [signature for doc, signature, vector in latest.values()]
+            vectors = np.array([vector for doc, signature, vector in latest.values()], dtype=np.float32).reshape(-1, VECTOR_DIM)
+            doc_ids = list(latest)
+            if duplicates is not None:
+                # 同批的文档此时才有 id（不写入的文档为 None）
+                duplicates.extend(
+                    dict(id=doc.id, **report, duplicate_of=target.id if isinstance(target, Document) else target)
+                    for report, doc, target in reports
+                )
+            if not doc_ids:
+                conn.rollback()
+                return []
+
+            log_change("upsert", doc_ids)
+            write_document_rows(conn, docs, vectors, signatures)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        add_texts([(doc.id, doc.title, doc.content, doc.tags, doc.category, doc.source) for doc in docs])
+        add_vectors(doc_ids, vectors, [doc.category for doc in docs])
+        for doc_id, signature in zip(doc_ids, signatures):
+            lsh_index.add(doc_id, signature)
+        corpus_changed()
+    # 只因合并了标签而重新写入的已有文档不计入
+    merged_ids = {doc.id for doc in merged}
+    return [doc_id for doc_id in doc_ids if doc_id not in merged_ids]
+
+def write_document_rows(conn: sqlite3.Connection, docs: List[Document], vectors: np.ndarray,
+                        signatures: List[np.ndarray]):
+    """在当前写事务中写入文档及其内容、向量、签名（docs 需已有 id）"""
+    conn.executemany('''
+    INSERT OR REPLACE INTO documents 
+    (id, title, content, category, tags, source, created_at, parent_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(
+        doc.id,
+        doc.title,
+        '',
+        doc.category,
+        json.dumps(doc.tags, ensure_ascii=False),
+        doc.source,
+        doc.created_at,
+        doc.parent_id
+    ) for doc in docs])
+    # 必须在 documents 之后写入（全文索引触发器依赖这一顺序）
+    conn.executemany(
+        'INSERT OR REPLACE INTO document_contents (id, data) VALUES (?, ?)',
+        [(doc.id, compress_content(doc.content)) for doc in docs]
+    )
+    conn.executemany(
+        'INSERT OR REPLACE INTO document_vectors (id, model, vector) VALUES (?, ?, ?)',
+        [(doc.id, embedder.model_name, vector.tobytes()) for doc, vector in zip(docs, vectors)]
+    )
+    conn.executemany(
+        'INSERT OR REPLACE INTO document_signatures (id, signature) VALUES (?, ?)',
+        [(doc.id, signature.tobytes()) for doc, signature in zip(docs, signatures)]
+    )
+
+def resolve_duplicates(docs: List[Document], signatures: List[np.ndarray],
+                       policy: str) -> Tuple[List[int], List[Document], List[Tuple[dict, Document, object]]]:
+    """
+    检出与已有文档或同批中之前的文档近重复的文档（调用方持有 index_write_lock）
+
+    返回 (需要写入的文档下标, 标签有变化、需要重新写入的已有文档, [(近重复记录, 近重复文档, 被重复的文档 id 或同批文档)])。
+    reject / merge 时近重复文档不写入；merge 时其标签并入被重复的文档。
+    """
+    if policy not in DEDUP_POLICIES:
+        raise ValueError(f"Unknown dedup policy: {policy}")
+    keep: List[int] = []
+    batch_index = LSHIndex(lsh_index.bands, lsh_index.rows)  # 同批中已保留的文档，键为下标
+    merged_tags: Dict[str, List[str]] = defaultdict(list)
+    reports = []
+    for i, (doc, signature) in enumerate(zip(docs, signatures)):
+        matches = lsh_index.query(signature, DEDUP_THRESHOLD, exclude=doc.id)
+        batch_matches = batch_index.query(signature, DEDUP_THRESHOLD)
+        target, score = None, 0.0
+        if matches:
+            target, score = matches[0]
+        if batch_matches and float(batch_matches[0][1]) > score:
+            target, score = docs[int(batch_matches[0][0])], batch_matches[0][1]
+        if target is None or policy == "keep":
+            keep.append(i)
+            batch_index.add(str(i), signature)
+        if target is None:
+            continue
+        if policy == "merge":
+            if isinstance(target, Document):
+                target.tags = list(dict.fromkeys(target.tags + doc.tags))
+            else:
+                merged_tags[target].extend(doc.tags)
+        action = {"keep": "kept", "reject": "rejected", "merge": "merged"}[policy]
+        reports.append(({"title": doc.title, "similarity": round(score, 4), "action": action}, doc, target))
+
+    merged = []
+    if merged_tags:
+        for existing in fetch_documents(list(merged_tags)):
+            tags = list(dict.fromkeys(existing.tags + merged_tags[existing.id]))
+            if tags != existing.tags:
+                existing.tags = tags
+                merged.append(existing)
+    return keep, merged, reports
+
+def parse_tags(tags_json: Optional[str]) -> List[str]:
+    return json.loads(tags_json) if tags_json else []
+
+def tags_text(tags_json: Optional[str]) -> str:
+    """将数据库中的标签 JSON 转为可检索的文本"""
+    return " ".join(parse_tags(tags_json))
+
+def row_to_document(row) -> Document:
+    return Document(
+        id=row['id'],
+        title=row['title'],
+        content=row['content'],
+        category=row['category'],
+        tags=parse_tags(row['tags']),
+        source=row['source'],
+        created_at=row['created_at'],
+        parent_id=row['parent_id']
+    )
+
+def fetch_documents(doc_ids: List[str]) -> List[Document]:
+    """按给定顺序读取文档（只解压这些文档的内容）"""
+    if not doc_ids:
+        return []
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute('''
-        INSERT OR REPLACE INTO documents 
-        (id, title, content, category, tags, source, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            doc.id,
-            doc.title,
-            doc.content,
-            doc.category,
-            json.dumps(doc.tags),
-            doc.source,
-            doc.created_at
-        ))
-        conn.commit()
+        placeholders = ",".join("?" * len(doc_ids))
+        cursor = conn.execute(f'''
+        SELECT d.id, d.title, decompress(c.data) AS content, d.category, d.tags, d.source, d.created_at, d.parent_id
+        FROM documents d LEFT JOIN document_contents c ON c.id = d.id
+        WHERE d.id IN ({placeholders})
+        ''', doc_ids)
+        docs = {row['id']: row_to_document(row) for row in cursor}
+    finally:
+        conn.close()
+    return [docs[doc_id] for doc_id in doc_ids if doc_id in docs]
+
+FETCH_BATCH_SIZE = 500  # 单条 SQL 的 IN 参数上限
+
+def fetch_documents_batch(id_lists: List[List[str]]) -> List[List[Document]]:
+    """批量读取多个查询的结果文档（去重后分块读取）"""
+    unique_ids = list(dict.fromkeys(doc_id for doc_ids in id_lists for doc_id in doc_ids))
+    docs: Dict[str, Document] = {}
+    for start in range(0, len(unique_ids), FETCH_BATCH_SIZE):
+        for doc in fetch_documents(unique_ids[start:start + FETCH_BATCH_SIZE]):
+            docs[doc.id] = doc
+    return [[docs[doc_id] for doc_id in doc_ids if doc_id in docs] for doc_ids in id_lists]
+
+# 分词词典：默认使用服务目录下的领域词典，多个文件以逗号分隔
+SEGMENT_DICT = os.getenv("RAG_SEGMENT_DICT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "domain_dict.txt"))
+
+def load_segmenter() -> Segmenter:
+    """从词典文件加载分词器（重建索引时重新读取，词典可在服务运行中修改）"""
+    return Segmenter.load(path.strip() for path in SEGMENT_DICT.split(",") if path.strip())
+
+segmenter = load_segmenter()
+
+# 倒排索引（启动时从 documents 表构建，增删文档时同步更新；蓝绿重建完成后整体切换为新一代）
+text_index = InvertedIndex(segmenter)
+index_generation = 1  # 当前一代索引的编号，每次切换加一
+# 写文档时持有：保证变更日志的 seq 与快照内容一致
+index_write_lock = threading.RLock()
+
+def build_index():
+    """从 documents 表重建倒排索引"""
+    start_time = time.time()
+    text_index.clear()
+    text_shards.clear()
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute('''
+        SELECT d.id, d.title, decompress(c.data) AS content, d.category, d.tags, d.source
+        FROM documents d LEFT JOIN document_contents c ON c.id = d.id
+        ORDER BY d.rowid
+        ''')
+        for row in cursor:
+            text_index.add(row['id'], row['title'], row['content'], parse_tags(row['tags']), row['category'], row['source'])
+    finally:
+        conn.close()
+    logger.info(f"倒排索引构建完成: {len(text_index)} 个文档, 耗时 {time.time() - start_time:.2f}s")
+
+# 分类分片：带分类过滤的检索只访问该分类的分片，常驻分片数超过上限时淘汰最久未用的
+RESIDENT_SHARDS = int(os.getenv("RAG_RESIDENT_SHARDS", "8"))  # 0 表示不使用分类分片，在全局索引上按分类过滤
+
+def load_category_shard(category: str) -> InvertedIndex:
+    """从 documents 表构建分类分片（按 rowid 顺序，与全局索引的入库顺序一致）"""
+    start_time = time.time()
+    shard = InvertedIndex(segmenter)
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute('''
+        SELECT d.id, d.title, decompress(c.data) AS content, d.category, d.tags, d.source
+        FROM documents d LEFT JOIN document_contents c ON c.id = d.id
+        WHERE d.category = ? ORDER BY d.rowid
+        ''', (category,))
+        shard.add_batch(
+            (row['id'], row['title'], row['content'], parse_tags(row['tags']), row['category'], row['source'])
+            for row in cursor
+        )
+    finally:
+        conn.close()
+    logger.info(f"分类分片加载完成: {category}, {len(shard)} 个文档, 耗时 {time.time() - start_time:.2f}s")
+    return shard
+
+text_shards = CategoryShards(load_category_shard, RESIDENT_SHARDS)
+
+def add_texts(docs: List[Tuple[str, str, str, List[str], str, str]]):
+    """写入倒排索引及常驻分类分片（调用方持有 index_write_lock）"""
+    text_index.add_batch(docs)
+    text_shards.add_batch(docs)
+
+def remove_text(doc_id: str):
+    text_index.remove(doc_id)
+    text_shards.remove(doc_id)
+
+def index_for(category: Optional[str]) -> InvertedIndex:
+    """带分类过滤时返回分类分片，否则返回全局索引"""
+    return text_shards.get(category) if category and RESIDENT_SHARDS > 0 else text_index
+
+def index_filter(index: InvertedIndex, category: Optional[str], where: Optional[FilterNode] = None) -> Optional[Bitmap]:
+    """
+    在 index_for(category) 返回的 index 上检索时允许的文档编号位图，不过滤时为 None
+
+    分类分片中的文档都属于该分类，只需按过滤表达式求位图；全局索引还要并上分类条件。
+    按 index_for 的选择条件判断而不比较对象：检索过程中索引可能已切换到新一代，index 仍是旧一代的全局索引。
+    """
+    node = where if category and RESIDENT_SHARDS > 0 else with_category(where, category)
+    return index.select(node) if node is not None else None
+
+def query_filter(query: "SearchQuery") -> Optional[FilterNode]:
+    """请求中的过滤表达式（语法树），未指定时为 None"""
+    return parse_filter(query.filter) if query.filter else None
+
+def filtered_doc_ids(category: Optional[str], where: FilterNode) -> List[str]:
+    """满足分类与过滤表达式的全部文档 id（按全局索引的位图求出，供向量检索限定范围）"""
+    index = text_index
+    return list(index.doc_ids(index.select(with_category(where, category)).to_array().tolist()).values())
+
+# 向量索引（启动时从 document_vectors 表加载，缺失的向量由后台任务批量生成）
+VECTOR_DIM = int(os.getenv("RAG_VECTOR_DIM", "512"))
+VECTOR_MIN_SCORE = 0.1  # 最低相似度，过滤不相关结果
+# 向量矩阵的存储精度：none 为 float32；int8 为逐行量化，内存约 1/4（document_vectors 表中仍是 float32 原始向量）
+VECTOR_QUANTIZATION = os.getenv("RAG_VECTOR_QUANTIZATION", "none")
+VECTOR_RERANK = int(os.getenv("RAG_VECTOR_RERANK", "4"))  # 量化存储时取 top_k 的该倍数作候选，用原始向量重排；0 表示不重排
+REEMBED_BATCH_SIZE = 256
+embedder = HashingEmbedder(VECTOR_DIM)
+vector_index = VectorIndex(VECTOR_DIM, max_cached_categories=RESIDENT_SHARDS, quantization=VECTOR_QUANTIZATION)
+
+def embedding_text(title: str, content: str, tags: str) -> str:
+    return f"{title}\n{tags}\n{content}"
+
+def add_vectors(doc_ids: List[str], vectors: np.ndarray, categories: List[str]):
+    """写入向量索引，已训练 ANN 索引时同时分配到簇"""
+    vector_index.add_batch(doc_ids, vectors, categories)
+    if ann_index is not None:
+        ann_index.add_batch(doc_ids, vectors)
+
+def remove_vectors(doc_id: str):
+    vector_index.remove(doc_id)
+    if ann_index is not None:
+        ann_index.remove(doc_id)
+
+def fetch_vectors(doc_ids: List[str]) -> Dict[str, np.ndarray]:
+    """从 document_vectors 表读取当前模型的 float32 原始向量"""
+    vectors: Dict[str, np.ndarray] = {}
+    conn = get_db_connection()
+    try:
+        for start in range(0, len(doc_ids), FETCH_BATCH_SIZE):
+            chunk = doc_ids[start:start + FETCH_BATCH_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            for row in conn.execute(f'''
+            SELECT id, vector FROM document_vectors WHERE model = ? AND id IN ({placeholders})
+            ''', [embedder.model_name] + chunk):
+                vectors[row['id']] = np.frombuffer(row['vector'], dtype=np.float32)
+    finally:
+        conn.close()
+    return vectors
+
+def rerank_limit(top_k: int) -> int:
+    """向量检索取的候选数：量化存储且开启重排时多取候选"""
+    return top_k * VECTOR_RERANK if vector_index.quantized and VECTOR_RERANK > 0 else top_k
+
+def rerank_exact(query_vectors: np.ndarray, hit_lists: List[List[Tuple[str, float]]],
+                 top_ks: List[int]) -> List[List[Tuple[str, float]]]:
+    """用 float32 原始向量为量化打分的候选重新打分（各查询的候选一次读取），不重排时只截断到 top_k"""
+    if rerank_limit(1) == 1:
+        return [hits[:top_k] for hits, top_k in zip(hit_lists, top_ks)]
+    vectors = fetch_vectors(list(dict.fromkeys(doc_id for hits in hit_lists for doc_id, _ in hits)))
+    reranked = []
+    for query_vector, hits, top_k in zip(query_vectors, hit_lists, top_ks):
+        query = vector_index.weight_query(query_vector)
+        scored = [(doc_id, float(vectors[doc_id] @ query)) for doc_id, _ in hits if doc_id in vectors]
+        reranked.append(sorted(scored, key=lambda hit: -hit[1])[:top_k])
+    return reranked
+
+def load_vectors():
+    """从 document_vectors 表加载当前模型的向量"""
+    start_time = time.time()
+    vector_index.clear()
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute('''
+        SELECT d.id, d.category, v.vector FROM documents d
+        JOIN document_vectors v ON v.id = d.id
+        WHERE v.model = ?
+        ORDER BY d.rowid
+        ''', (embedder.model_name,))
+        while True:
+            rows = cursor.fetchmany(REEMBED_BATCH_SIZE * 16)
+            if not rows:
+                break
+            vectors = np.frombuffer(b"".join(row['vector'] for row in rows), dtype=np.float32)
+            vector_index.add_batch(
+                [row['id'] for row in rows],
+                vectors.reshape(len(rows), VECTOR_DIM),
+                [row['category'] for row in rows]
+            )
+    finally:
+        conn.close()
+    logger.info(f"向量索引加载完成: {len(vector_index)} 个向量, 耗时 {time.time() - start_time:.2f}s")
+
+def reembed_documents(state: dict, full: bool = False):
+    """批量为文档生成向量（按 rowid 分批，每批一个事务）"""
+    missing_filter = '' if full else 'AND v.id IS NULL'
+    state["model"] = embedder.model_name
+    conn = get_db_connection()
+    try:
+        state["total"] = conn.execute(f'''
+        SELECT COUNT(*) FROM documents d
+        LEFT JOIN document_vectors v ON v.id = d.id AND v.model = ?
+        WHERE 1 = 1 {missing_filter}
+        ''', (embedder.model_name,)).fetchone()[0]
+        last_rowid = 0
+        while True:
+            rows = conn.execute(f'''
+            SELECT d.rowid, d.id, d.title, decompress(c.data) AS content, d.category, d.tags FROM documents d
+            LEFT JOIN document_contents c ON c.id = d.id
+            LEFT JOIN document_vectors v ON v.id = d.id AND v.model = ?
+            WHERE d.rowid > ? {missing_filter}
+            ORDER BY d.rowid LIMIT ?
+            ''', (embedder.model_name, last_rowid, REEMBED_BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+            vectors = embedder.embed_batch([
+                embedding_text(row['title'], row['content'], tags_text(row['tags'])) for row in rows
+            ])
+            doc_ids = [row['id'] for row in rows]
+            with index_write_lock:
+                log_change("upsert", doc_ids)
+                conn.executemany(
+                    'INSERT OR REPLACE INTO document_vectors (id, model, vector) VALUES (?, ?, ?)',
+                    [(row['id'], embedder.model_name, vector.tobytes()) for row, vector in zip(rows, vectors)]
+                )
+                conn.commit()
+                add_vectors(doc_ids, vectors, [row['category'] for row in rows])
+                corpus_changed()
+            state["processed"] += len(rows)
+            last_rowid = rows[-1]['rowid']
+    finally:
+        conn.close()
+
+reembed_job = BackgroundJob("reembed", reembed_documents)
+
+def quantization_report(state: dict, sample: int, top_k: int):
+    """
+    量化召回报告：抽样文档的标题作为查询，对比向量索引的 top_k 与 float32 原始向量暴力检索的 top_k
+
+    分别统计直接按索引打分与按 float32 重排后的 recall@k；原始向量从 document_vectors 表分批读取。
+    """
+    doc_ids = vector_index.ids()
+    rng = np.random.default_rng(0)
+    sampled = [doc_ids[i] for i in rng.choice(len(doc_ids), min(sample, len(doc_ids)), replace=False)]
+    docs = fetch_documents(sampled)
+    if not docs:
+        raise ValueError("No vectors to evaluate")
+    query_vectors = embedder.embed_batch([doc.title for doc in docs])
+    queries = np.stack([vector_index.weight_query(vector) for vector in query_vectors])
+    state.update(total=len(doc_ids), queries=len(docs), top_k=top_k)
+
+    # 精确 top_k：逐批计算得分，与各查询当前的 top_k 合并（候选以读取顺序编号）
+    seen_ids: List[str] = []
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    best_positions = np.empty((len(queries), 0), dtype=np.int64)
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(
+            'SELECT id, vector FROM document_vectors WHERE model = ? ORDER BY rowid', (embedder.model_name,)
+        )
+        while True:
+            batch = cursor.fetchmany(REEMBED_BATCH_SIZE * 16)
+            if not batch:
+                break
+            rows = [row for row in batch if row['id'] in vector_index]
+            if rows:
+                vectors = np.frombuffer(b"".join(row['vector'] for row in rows), dtype=np.float32)
+                positions = np.arange(len(seen_ids), len(seen_ids) + len(rows))
+                seen_ids.extend(row['id'] for row in rows)
+                scores = np.concatenate([best_scores, queries @ vectors.reshape(len(rows), VECTOR_DIM).T], axis=1)
+                positions = np.concatenate([best_positions, np.broadcast_to(positions, (len(queries), len(rows)))], axis=1)
+                keep = np.argsort(-scores, axis=1, kind="stable")[:, :top_k]
+                best_scores = np.take_along_axis(scores, keep, axis=1)
+                best_positions = np.take_along_axis(positions, keep, axis=1)
+            state["processed"] += len(rows)
+    finally:
+        conn.close()
+    exact_top = [{seen_ids[position] for position in positions} for positions in best_positions]
+
+    def recall(hit_lists: List[List[Tuple[str, float]]]) -> float:
+        total = sum(len(exact) for exact in exact_top)
+        found = sum(len(exact & {doc_id for doc_id, _ in hits}) for exact, hits in zip(exact_top, hit_lists))
+        return round(found / total, 4) if total else 1.0
+
+    limit = top_k * max(VECTOR_RERANK, 1)
+    candidates = vector_index.search_batch(query_vectors, limit)
+    exact_vectors = fetch_vectors(list(dict.fromkeys(doc_id for hits in candidates for doc_id, _ in hits)))
+    reranked = [
+        sorted(((doc_id, float(exact_vectors[doc_id] @ query)) for doc_id, _ in hits if doc_id in exact_vectors),
+               key=lambda hit: -hit[1])[:top_k]
+        for query, hits in zip(queries, candidates)
+    ]
+    state.update(
+        quantization=vector_index.quantization,
+        recall_at_k=recall([hits[:top_k] for hits in candidates]),
+        rerank_candidates=limit,
+        recall_at_k_reranked=recall(reranked),
+        memory_bytes=vector_index.nbytes,
+        float32_bytes=len(vector_index) * VECTOR_DIM * 4,
+    )
+
+quantization_report_job = BackgroundJob("quantization_report", quantization_report)
+
+# 近重复检测：签名持久化在 document_signatures，启动时载入 LSH 分桶索引（只在主进程维护）
+DEDUP_POLICIES = ("keep", "reject", "merge")  # keep: 照常写入; reject: 不写入; merge: 不写入，标签并入被重复的文档
+DEDUP_POLICY = os.getenv("RAG_DEDUP_POLICY", "keep")
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.8"))  # 估计 Jaccard 相似度达到该值视为近重复
+SIGNATURE_BATCH_SIZE = 1000
+minhasher = MinHasher()
+lsh_index = LSHIndex()
+
+def signature_text(title: str, content: str) -> str:
+    return f"{title}\n{content}"
+
+def load_signatures():
+    start_time = time.time()
+    lsh_index.clear()
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute('''
+        SELECT s.id, s.signature FROM documents d JOIN document_signatures s ON s.id = d.id
+        ''')
+        for row in cursor:
+            lsh_index.add(row['id'], np.frombuffer(row['signature'], dtype=np.uint32))
+    finally:
+        conn.close()
+    logger.info(f"近重复签名加载完成: {len(lsh_index)} 个文档, 耗时 {time.time() - start_time:.2f}s")
+
+def compute_signatures(state: dict):
+    """为尚无签名的文档（升级前写入的）批量计算签名"""
+    conn = get_db_connection()
+    try:
+        missing = '''
+        FROM documents d LEFT JOIN document_signatures s ON s.id = d.id
+        WHERE s.id IS NULL
+        '''
+        state["total"] = conn.execute(f'SELECT COUNT(*) {missing}').fetchone()[0]
+        last_rowid = 0
+        while True:
+            rows = conn.execute(f'''
+            SELECT d.rowid, d.id, d.title, (SELECT decompress(data) FROM document_contents WHERE id = d.id) AS content
+            {missing} AND d.rowid > ?
+            ORDER BY d.rowid LIMIT ?
+            ''', (last_rowid, SIGNATURE_BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+            signatures = [minhasher.signature(signature_text(row['title'], row['content'] or '')) for row in rows]
+            with index_write_lock:
+                # 计算期间被删除的文档不再写入；期间重新写入的文档已有新签名，不覆盖
+                written = [(row['id'], signature) for row, signature in zip(rows, signatures) if row['id'] in text_index and row['id'] not in lsh_index]
+                conn.executemany(
+                    'INSERT OR IGNORE INTO document_signatures (id, signature) VALUES (?, ?)',
+                    [(doc_id, signature.tobytes()) for doc_id, signature in written]
+                )
+                conn.commit()
+                for doc_id, signature in written:
+                    lsh_index.add(doc_id, signature)
+            state["processed"] += len(rows)
+            last_rowid = rows[-1]['rowid']
+    finally:
+        conn.close()
+
+signature_job = BackgroundJob("signatures", compute_signatures)
+
+# ANN（IVF）索引，持久化在 vector_store.db 旁边
+ANN_PATH = os.path.splitext(DB_PATH)[0] + ".ivf.npz"
+ANN_NPROBE = int(os.getenv("RAG_ANN_NPROBE", "8"))
+ANN_MIN_VECTORS = int(os.getenv("RAG_ANN_MIN_VECTORS", "50000"))  # 向量数少于该值时直接暴力检索
+ANN_TRAIN_SAMPLES_PER_LIST = 256
+ann_index: Optional[IVFIndex] = None
+
+def sync_ann_index(index: IVFIndex):
+    """为向量索引中尚未分配簇的文档补充分配"""
+    missing = [doc_id for doc_id in vector_index.ids() if doc_id not in index]
+    for start in range(0, len(missing), ASSIGN_BATCH_SIZE):
+        doc_ids = missing[start:start + ASSIGN_BATCH_SIZE]
+        index.add_batch(doc_ids, vector_index.get_vectors(doc_ids))
+
+def load_ann_index():
+    """加载已持久化的 IVF 索引（嵌入模型变化时丢弃）"""
+    global ann_index
+    if not os.path.exists(ANN_PATH):
+        return
+    try:
+        index = IVFIndex.load(ANN_PATH, ANN_NPROBE)
+    except Exception as e:
+        logger.warning(f"IVF 索引加载失败，将使用暴力检索: {str(e)}")
+        return
+    if index.model != embedder.model_name:
+        logger.info(f"IVF 索引模型 {index.model} 与当前嵌入模型不一致，需要重新训练")
+        return
+    sync_ann_index(index)
+    ann_index = index
+    logger.info(f"IVF 索引加载完成: nlist={index.nlist}, {len(index)} 个向量")
+
+def train_ann(state: dict, nlist: Optional[int] = None, iterations: int = 10):
+    """训练 IVF 索引：抽样训练簇中心，再分批分配全部向量，完成后原子替换并持久化"""
+    global ann_index
+    total = len(vector_index)
+    if total == 0:
+        raise ValueError("no vectors to train on")
+    nlist = nlist or max(1, int(4 * math.sqrt(total)))
+    sample = vector_index.sample(nlist * ANN_TRAIN_SAMPLES_PER_LIST)
+    state.update(nlist=nlist, total=total, stage="training")
+    index = IVFIndex(embedder.model_name, train_centroids(sample, nlist, iterations), ANN_NPROBE)
+
+    state["stage"] = "assigning"
+    for doc_ids, vectors in vector_index.iter_batches(ASSIGN_BATCH_SIZE):
+        index.add_batch(doc_ids, vectors)
+        state["processed"] += len(doc_ids)
+    ann_index = index
+    # 训练期间新增的文档
+    sync_ann_index(index)
+    corpus_changed()
+
+    state["stage"] = "saving"
+    index.save(ANN_PATH)
+
+ann_train_job = BackgroundJob("ann_train", train_ann)
+
+# 索引快照：倒排索引与向量 mmap 加载，快照之后的文档变更记录在 delta.log 中，启动时重放
+SNAPSHOT_DIR = os.path.join(os.path.dirname(DB_PATH), "index_snapshot")
+SNAPSHOT_DELTA_LIMIT = int(os.getenv("RAG_SNAPSHOT_DELTA_LIMIT", "10000"))  # 变更累计到该数量时自动生成新快照
+SNAPSHOT_VECTOR_HEADROOM = int(os.getenv("RAG_SNAPSHOT_VECTOR_HEADROOM", "4096"))  # 快照向量矩阵末尾预留的空行数
+REPLAY_BATCH_SIZE = 500
+delta_log: Optional[DeltaLog] = None
+# 数据库与内存索引都已更新的最后一条变更 seq，worker 进程检索前同步到该位置
+committed_seq = 0
+# 当前快照目录（主进程：最近生成或加载的快照；worker 进程：已挂载的快照）
+snapshot_path: Optional[str] = None
+
+def log_change(op: str, doc_ids: Optional[List[str]] = None):
+    """在写数据库之前记录变更（崩溃时重放会以数据库为准）"""
+    if delta_log is None:
+        return
+    delta_log.append(op, doc_ids)
+    # 重建期间不截断变更日志：新一代索引构建完成后要重放构建期间的变更
+    if delta_log.pending >= SNAPSHOT_DELTA_LIMIT:
+        start_snapshot_job()
+
+def save_snapshot(state: dict):
+    """生成索引快照：持锁冻结内存索引，释放锁后写文件，最后截断变更日志"""
+    with index_write_lock:
+        seq = delta_log.seq
+        segment = text_index.freeze()
+        fingerprint = text_index.segmenter.fingerprint
+        vectors = vector_index.export(SNAPSHOT_VECTOR_HEADROOM)
+    state.update(delta_seq=seq, documents=len(segment), vectors=len(vectors.doc_ids))
+
+    def writer(directory: str):
+        segment.save(directory)
+        vectors.save(directory)
+
+    name = write_snapshot(SNAPSHOT_DIR, seq, writer, {
+        "documents": len(segment),
+        "terms": len(segment.terms),
+        "vectors": len(vectors.doc_ids),
+        "embedding_model": embedder.model_name,
+        "vector_dim": VECTOR_DIM,
+        "vector_quantization": VECTOR_QUANTIZATION,
+        "segmenter": fingerprint,
+    })
+    global snapshot_path
+    snapshot_path = os.path.join(SNAPSHOT_DIR, name)
+    delta_log.truncate(seq)
+    state["snapshot"] = name
+
+snapshot_job = BackgroundJob("snapshot", save_snapshot)
+# 快照与重建互斥：快照会截断重建需要重放的变更日志。检查另一个任务是否在运行与启动任务须在这把锁内一起完成
+index_job_lock = threading.Lock()
+
+def start_snapshot_job() -> bool:
+    """启动快照任务；重建期间或已有快照在运行时不启动，返回 False"""
+    with index_job_lock:
+        return not rebuild_job.running and snapshot_job.start()
+
+def restore_from_snapshot(upto_seq: Optional[int] = None) -> bool:
+    """从快照 mmap 加载索引并重放变更日志（至 upto_seq），没有可用快照时返回 False"""
+    global snapshot_path, segmenter, text_index
+    start_time = time.time()
+    directory = current_snapshot(SNAPSHOT_DIR)
+    if directory is None:
+        return False
+    manifest = read_manifest(directory)
+    if manifest.get("segmenter") != segmenter.fingerprint:
+        reloaded = load_segmenter()
+        if manifest.get("segmenter") != reloaded.fingerprint:
+            # 分词词典已变更：快照中的词项与当前分词结果不一致
+            logger.info("分词词典已变更，将从数据库重建索引")
+            return False
+        # 快照由按修改后的词典重建的索引生成（worker 进程挂载主进程重建后的快照）
+        segmenter = reloaded
+        text_index = InvertedIndex(segmenter)
+    try:
+        text_index.load_base(FrozenSegment.load(directory))
+        vectors_loaded = (
+            manifest.get("embedding_model") == embedder.model_name and manifest.get("vector_dim") == VECTOR_DIM
+            and manifest.get("vector_quantization", "none") == VECTOR_QUANTIZATION
+        )
+        if vectors_loaded:
+            vector_index.load_snapshot(directory)
+    except Exception as e:
+        logger.warning(f"索引快照加载失败，将从数据库重建: {str(e)}")
+        text_index.clear()
+        vector_index.clear()
+        return False
+
+    snapshot_path = directory
+    delta_log.advance(manifest["delta_seq"])
+    replayed = replay_changes(manifest["delta_seq"], upto_seq)
+    if not vectors_loaded:
+        # 嵌入模型或存储精度已变更：快照中的向量不可用
+        load_vectors()
+    logger.info(
+        f"索引快照加载完成: {len(text_index)} 个文档, {len(vector_index)} 个向量, "
+        f"重放 {replayed} 条变更, 耗时 {time.time() - start_time:.2f}s"
+    )
+    return True
+
+def replay_changes(after_seq: int, upto_seq: Optional[int] = None, text: Optional[InvertedIndex] = None,
+                   vectors: Optional[VectorIndex] = None) -> int:
+    """
+    重放快照之后的变更：按文档合并为最终操作，再以数据库中的当前内容为准批量更新
+
+    text / vectors 默认为当前一代索引；重建索引时传入正在构建的新一代。
+    """
+    if text is None:
+        text = text_index
+    if vectors is None:
+        vectors = vector_index
+    changes: Dict[str, str] = {}
+    count = 0
+    for entry in delta_log.entries(after_seq, upto_seq):
+        count += 1
+        if entry["op"] == "clear":
+            changes.clear()
+            text.clear()
+            vectors.clear()
+        else:
+            changes.pop(entry["id"], None)
+            changes[entry["id"]] = entry["op"]
+
+    upserts = [doc_id for doc_id, op in changes.items() if op == "upsert"]
+    for doc_id, op in changes.items():
+        if op == "delete":
+            text.remove(doc_id)
+            vectors.remove(doc_id)
+
+    conn = get_db_connection()
+    try:
+        for start in range(0, len(upserts), REPLAY_BATCH_SIZE):
+            doc_ids = upserts[start:start + REPLAY_BATCH_SIZE]
+            placeholders = ",".join("?" * len(doc_ids))
+            rows = {row['id']: row for row in conn.execute(f'''
+            SELECT d.id, d.title, decompress(c.data) AS content, d.category, d.tags, d.source, v.vector FROM documents d
+            LEFT JOIN document_contents c ON c.id = d.id
+            LEFT JOIN document_vectors v ON v.id = d.id AND v.model = ?
+            WHERE d.id IN ({placeholders})
+            ''', [embedder.model_name] + doc_ids)}
+            for doc_id in doc_ids:
+                row = rows.get(doc_id)
+                if row is None:
+                    # 写数据库前崩溃，变更未生效
+                    text.remove(doc_id)
+                    vectors.remove(doc_id)
+                    continue
+                text.add(doc_id, row['title'], row['content'], parse_tags(row['tags']), row['category'], row['source'])
+                if row['vector'] is None:
+                    vectors.remove(doc_id)
+                else:
+                    vector = np.frombuffer(row['vector'], dtype=np.float32).reshape(1, -1)
+                    vectors.add_batch([doc_id], vector, [row['category']])
+    finally:
+        conn.close()
+    return count
+
+# 蓝绿重建：新一代索引在旁路构建，旧一代继续服务检索，构建完成后持锁原子切换
+REBUILD_BATCH_SIZE = int(os.getenv("RAG_REBUILD_BATCH_SIZE", "2000"))
+
+def swap_generation(text: InvertedIndex, vectors: VectorIndex, new_segmenter: Segmenter):
+    """
+    切换到新一代索引（调用方持有 index_write_lock）
+
+    正在执行的检索继续使用已取得的旧一代对象；之后的检索使用新一代。分类分片按需从新一代的分词器重新构建，
+    worker 进程在新快照生成之前不参与检索（调用方随后启动快照生成，worker 据此重新挂载）。
+    """
+    global segmenter, text_index, vector_index, index_generation, snapshot_path
+    segmenter, text_index, vector_index = new_segmenter, text, vectors
+    text_shards.clear()
+    index_generation += 1
+    snapshot_path = None
+    corpus_changed()
+
+def rebuild_index(state: dict, reload_dictionary: bool = False):
+    """
+    按数据库内容构建新一代倒排与向量索引并切换
+
+    构建期间的写入照常更新旧一代并记入变更日志；构建完成后先在锁外重放大部分变更，
+    再持锁重放剩余变更并切换，写入只在最后一小段时间内等待。
+    """
+    new_segmenter = load_segmenter() if reload_dictionary else segmenter
+    text = InvertedIndex(new_segmenter)
+    vectors = VectorIndex(VECTOR_DIM, max_cached_categories=RESIDENT_SHARDS, quantization=VECTOR_QUANTIZATION)
+    with index_write_lock:
+        start_seq = delta_log.seq
+    state.update(phase="build", generation=index_generation + 1, segmenter=new_segmenter.fingerprint,
+                 docs_per_second=0.0, replayed=0)
+    start_time = time.time()
+    conn = get_db_connection()
+    try:
+        # 只扫描开始时已有的行：之后写入（包括 INSERT OR REPLACE 换了 rowid）的文档都在变更日志中，由重放补上
+        total, max_rowid = conn.execute('SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM documents').fetchone()
+        state["total"] = total
+        last_rowid = 0
+        while True:
+            rows = conn.execute('''
+            SELECT d.rowid, d.id, d.title, decompress(c.data) AS content, d.category, d.tags, d.source, v.vector FROM documents d
+            LEFT JOIN document_contents c ON c.id = d.id
+            LEFT JOIN document_vectors v ON v.id = d.id AND v.model = ?
+            WHERE d.rowid > ? AND d.rowid <= ? ORDER BY d.rowid LIMIT ?
+            ''', (embedder.model_name, last_rowid, max_rowid, REBUILD_BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+            text.add_batch(
+                (row['id'], row['title'], row['content'], parse_tags(row['tags']), row['category'], row['source'])
+                for row in rows
+            )
+            embedded = [row for row in rows if row['vector'] is not None]
+            if embedded:
+                vectors.add_batch(
+                    [row['id'] for row in embedded],
+                    np.frombuffer(b"".join(row['vector'] for row in embedded), dtype=np.float32).reshape(len(embedded), VECTOR_DIM),
+                    [row['category'] for row in embedded]
+                )
+            state["processed"] += len(rows)
+            state["docs_per_second"] = round(state["processed"] / max(time.time() - start_time, 1e-6), 1)
+            last_rowid = rows[-1]['rowid']
+    finally:
+        conn.close()
+
+    state["phase"] = "catch_up"
+    with index_write_lock:
+        # 持锁读取 seq：此前的变更都已提交到数据库
+        seq = delta_log.seq
+    state["replayed"] = replay_changes(start_seq, seq, text, vectors)
+    with index_write_lock:
+        state["replayed"] += replay_changes(seq, None, text, vectors)
+        swap_generation(text, vectors, new_segmenter)
+        state.update(phase="swapped", documents=len(text), vectors=len(vectors))
+    snapshot_job.start()
+    state["seconds"] = round(time.time() - start_time, 3)
+    logger.info(
+        f"索引重建完成: 第 {index_generation} 代, {len(text)} 个文档, {len(vectors)} 个向量, "
+        f"重放 {state['replayed']} 条变更, 耗时 {state['seconds']:.2f}s"
+    )
+
+rebuild_job = BackgroundJob("rebuild", rebuild_index)
+
+def replace_documents(docs: List[Document]):
+    """
+    用 docs 替换全部文档（docs 需带 id）
+
+    新一代索引先在旁路构建，再持锁在一个事务内清空并写入数据库、切换索引；
+    此前的检索一直使用旧数据与旧一代索引，不会看到清空后或只写入了一部分的语料。
+    """
+    signatures = [minhasher.signature(signature_text(doc.title, doc.content)) for doc in docs]
+    vectors = embedder.embed_batch([embedding_text(doc.title, doc.content, " ".join(doc.tags)) for doc in docs])
+    doc_ids = [doc.id for doc in docs]
+    categories = [doc.category for doc in docs]
+    text = InvertedIndex(segmenter)
+    text.add_batch((doc.id, doc.title, doc.content, doc.tags, doc.category, doc.source) for doc in docs)
+    new_vectors = VectorIndex(VECTOR_DIM, max_cached_categories=RESIDENT_SHARDS, quantization=VECTOR_QUANTIZATION)
+    new_vectors.add_batch(doc_ids, vectors, categories)
+
+    with index_write_lock:
+        conn = get_db_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            log_change("clear")
+            log_change("upsert", doc_ids)
+            conn.execute('DELETE FROM documents')
+            # 推进 id 序列越过 docs 中显式的 doc_NNN，之后自动分配的 id 不会覆盖这些文档
+            allocate_ids(conn, 0, doc_ids)
+            write_document_rows(conn, docs, vectors, signatures)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        if ann_index is not None:
+            ann_index.clear()
+            ann_index.add_batch(doc_ids, vectors)
+        lsh_index.clear()
+        for doc_id, signature in zip(doc_ids, signatures):
+            lsh_index.add(doc_id, signature)
+        swap_generation(text, new_vectors, segmenter)
+    start_snapshot_job()
+
+def match_phrases(phrases: List[str], index: InvertedIndex, category: Optional[str] = None,
+                  where: Optional[FilterNode] = None) -> Dict[str, Dict[int, List[bool]]]:
+    """
+    查找包含完整短语的文档，返回 {短语: {docno: [标题包含, 内容包含, 标签包含]}}
+
+    index 为全局索引或 category 对应的分类分片，docno 是该索引内的编号；where 为过滤表达式。
+    短语本身就是一个词项时 posting 即为结果；其余短语需要用原文校验，全部待校验的短语编译为一个
+    Aho-Corasick 自动机，每个候选文档的各字段只扫描一遍。
+    """
+    results: Dict[str, Dict[int, List[bool]]] = {}
+    # 待校验的短语 -> 候选 docno（None 表示切分不出词项，无法使用索引，需扫描全部文档）
+    pending: Dict[str, Optional[Dict[int, List[bool]]]] = {}
+    for phrase in dict.fromkeys(phrases):
+        terms = index.phrase_terms(phrase)
+        if phrase in terms:
+            results[phrase] = index.phrase_candidates(phrase, index_filter(index, category, where))
+        elif not terms:
+            pending[phrase] = None
+        else:
+            # 多个词项：先求 posting 交集得到候选，再用原文校验
+            candidates = index.phrase_candidates(phrase, index_filter(index, category, where))
+            if candidates:
+                pending[phrase] = candidates
+            else:
+                results[phrase] = {}
+    if not pending:
+        return results
+    for phrase in pending:
+        results[phrase] = {}
+
+    conn = get_db_connection()
+    try:
+        if any(candidates is None for candidates in pending.values()):
+            # 退回数据库扫描
+            sql = '''
+            SELECT d.id, d.title, decompress(c.data) AS content, d.tags
+            FROM documents d LEFT JOIN document_contents c ON c.id = d.id
+            '''
+            params = []
+            node = with_category(where, category)
+            if node is not None:
+                condition, params = filter_sql(node)
+                sql += f' WHERE {condition}'
+            batches = [conn.execute(sql, params)]
+        else:
+            docnos = list(dict.fromkeys(docno for candidates in pending.values() for docno in candidates))
+            doc_ids = list(index.doc_ids(docnos).values())
+            batches = []
+            for start in range(0, len(doc_ids), FETCH_BATCH_SIZE):
+                chunk = doc_ids[start:start + FETCH_BATCH_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                batches.append(conn.execute(f'''
+                SELECT d.id, d.title, decompress(c.data) AS content, d.tags
+                FROM documents d LEFT JOIN document_contents c ON c.id = d.id
+                WHERE d.id IN ({placeholders})
+                ''', chunk))
+
+        matcher = KeywordMatcher(pending)
+        for rows in batches:
+            for row in rows:
+                docno = index.docno(row['id'])
+                if docno is None:
+                    continue
+                field_hits = (matcher.matched(row['title']), matcher.matched(row['content']),
+                              matcher.matched(tags_text(row['tags'])))
+                for phrase in set().union(*field_hits):
+                    candidates = pending[phrase]
+                    if candidates is None or docno in candidates:
+                        results[phrase][docno] = [phrase in hits for hits in field_hits]
+        return results
     finally:
         conn.close()
 
-def search_documents(query_text: str, top_k: int = 5, category: Optional[str] = None) -> List[Document]:
-    """从向量数据库搜索文档 - 使用词组匹配和语义相关性"""
+def search_documents(query_text: str, top_k: int = 5, category: Optional[str] = None,
+                     where: Optional[FilterNode] = None, index: Optional[InvertedIndex] = None,
+                     phrase_cache: Optional[Dict[str, Dict[int, List[bool]]]] = None) -> List[Document]:
+    """
+    从倒排索引搜索文档 - 使用词项匹配和语义相关性
+
+    批量检索时传入同一个 index 与 phrase_cache，多个查询共有的词项只查找一次。
+    """
     import sys
     print(f"🔍 [search_documents] 搜索开始: '{query_text}'", file=sys.stderr, flush=True)
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 中文分词（简单实现：按2-3字词组切分）
-    def extract_keywords(text):
-        """提取关键词（至少2个字的词组）"""
-        keywords = set()
-        # 1. 完整查询作为关键词
-        keywords.add(text.strip())
-        # 2. 按2字词组切分
-        for i in range(len(text) - 1):
-            keywords.add(text[i:i+2])
-        # 3. 按3字词组切分
-        for i in range(len(text) - 2):
-            keywords.add(text[i:i+3])
-        return keywords
-    
-    query_keywords = extract_keywords(query_text)
+    # 带分类过滤时只访问该分类的分片；查询用该索引的分词器切分（重建切换期间与索引保持同一代）
+    if index is None:
+        index = index_for(category)
+    query_keywords = index.segmenter.keywords(query_text)
     print(f"📝 [search_documents] 提取关键词: {query_keywords}", file=sys.stderr, flush=True)
     
     try:
-        if category:
-            sql = 'SELECT id, title, content, category, tags, source, created_at FROM documents WHERE category = ?'
-            params = [category]
-        else:
-            sql = 'SELECT id, title, content, category, tags, source, created_at FROM documents'
-            params = []
+        # 计算相关性分数（只访问查询词项对应的 posting list）
+        scores: Dict[int, int] = defaultdict(int)
+        matched_keywords: Dict[int, List[str]] = defaultdict(list)
+        MIN_SCORE_THRESHOLD = 30  # 最低分数阈值，过滤不相关结果
+        if phrase_cache is None:
+            phrase_cache = {}
         
-        cursor.execute(sql, params)
-        rows = cursor.fetchall()
+        # 查询文本与各词项一起查找（需要原文校验的短语只扫描一遍候选文档）
+        phrases = [query_text] + [keyword for keyword in query_keywords if len(keyword) >= 2]
+        missing = [phrase for phrase in phrases if phrase not in phrase_cache]
+        if missing:
+            phrase_cache.update(match_phrases(missing, index, category, where))
+        lookup = phrase_cache.__getitem__
         
-        print(f"📚 [search_documents] 数据库中找到 {len(rows)} 个文档", file=sys.stderr, flush=True)
+        # 1. 完全匹配查询文本（最高优先级）
+        for docno, (in_title, in_content, in_tags) in lookup(query_text).items():
+            if in_title:
+                scores[docno] += 200
+                matched_keywords[docno].append(f"标题完全匹配: {query_text}")
+            if in_content:
+                scores[docno] += 100
+                matched_keywords[docno].append(f"内容完全匹配: {query_text}")
+            if in_tags:
+                scores[docno] += 80
+                matched_keywords[docno].append(f"标签完全匹配: {query_text}")
         
-        # 计算相关性分数
-        scored_results = []
-        MIN_SCORE_THRESHOLD = 30  # 最低分数阈值，过滤不相关结果
+        # 2. 词项匹配（至少2字的词项才计分）
+        for keyword in query_keywords:
+            if len(keyword) < 2:  # 只匹配2字以上的词项
+                continue
+            for docno, (in_title, in_content, in_tags) in lookup(keyword).items():
+                if in_title:
+                    scores[docno] += 50
+                    matched_keywords[docno].append(f"标题包含: {keyword}")
+                elif in_content:
+                    scores[docno] += 20
+                    matched_keywords[docno].append(f"内容包含: {keyword}")
+                elif in_tags:
+                    scores[docno] += 30
+                    matched_keywords[docno].append(f"标签包含: {keyword}")
         
-        for row in rows:
-            title = row[1]
-            content = row[2]
-            tags_str = row[4] if row[4] else ""
-            full_text = f"{title} {content} {tags_str}".lower()
-            
-            score = 0
-            matched_keywords = []
-            
-            # 1. 完全匹配查询文本（最高优先级）
-            if query_text in title:
-                score += 200
-                matched_keywords.append(f"标题完全匹配: {query_text}")
-            if query_text in content:
-                score += 100
-                matched_keywords.append(f"内容完全匹配: {query_text}")
-            if query_text in tags_str:
-                score += 80
-                matched_keywords.append(f"标签完全匹配: {query_text}")
-            
-            # 2. 词组匹配（至少2字的词组才计分）
-            for keyword in query_keywords:
-                if len(keyword) >= 2:  # 只匹配2字以上的词组
-                    if keyword in title:
-                        score += 50
-                        matched_keywords.append(f"标题包含: {keyword}")
-                    elif keyword in content:
-                        score += 20
-                        matched_keywords.append(f"内容包含: {keyword}")
-                    elif keyword in tags_str:
-                        score += 30
-                        matched_keywords.append(f"标签包含: {keyword}")
-            
-            # 只返回分数达到阈值的文档
-            if score >= MIN_SCORE_THRESHOLD:
-                print(f"   ✅ '{title}': 分数={score}, 匹配: {matched_keywords[:3]}", file=sys.stderr, flush=True)
-                scored_results.append({
-                    'doc': Document(
-                        id=row[0],
-                        title=row[1],
-                        content=row[2],
-                        category=row[3],
-                        tags=json.loads(row[4]) if row[4] else [],
-                        source=row[5],
-                        created_at=row[6]
-                    ),
-                    'score': score,
-                    'matched_keywords': matched_keywords
-                })
-            else:
-                if score > 0:
-                    print(f"   ⚠️ '{title}': 分数={score} (低于阈值{MIN_SCORE_THRESHOLD}，跳过)", file=sys.stderr, flush=True)
+        print(f"📚 [search_documents] 索引命中 {len(scores)} 个候选文档", file=sys.stderr, flush=True)
         
-        # 按相关性分数排序
-        scored_results.sort(key=lambda x: x['score'], reverse=True)
+        # 只返回分数达到阈值的文档，按相关性分数排序（同分按入库顺序）
+        ranked = sorted(
+            (docno for docno, score in scores.items() if score >= MIN_SCORE_THRESHOLD),
+            key=lambda docno: (-scores[docno], docno)
+        )[:top_k]
+        # 检索期间被删除的文档不再返回
+        ranked_ids = index.doc_ids(ranked)
+        for docno, doc_id in ranked_ids.items():
+            print(f"   ✅ '{doc_id}': 分数={scores[docno]}, 匹配: {matched_keywords[docno][:3]}", file=sys.stderr, flush=True)
         
-        # 提取排序后的文档
-        results = [item['doc'] for item in scored_results[:top_k]]
+        results = fetch_documents(list(ranked_ids.values()))
         
         print(f"✅ [search_documents] 返回 {len(results)} 个相关结果", file=sys.stderr, flush=True)
-        
-        conn.close()
         return results
     except Exception as e:
         print(f"❌ [search_documents] 搜索失败: {str(e)}", file=sys.stderr, flush=True)
         import traceback
         traceback.print_exc(file=sys.stderr)
-        conn.close()
         return []
 
-def get_all_documents() -> List[Document]:
-    """获取所有文档"""
+# 最低 BM25 分数。BM25 得分随语料规模与词项分布变化，固定阈值在小语料上会滤掉只含常见词项的正常命中，
+# 默认不设阈值（只返回至少命中一个查询词项的文档）
+BM25_MIN_SCORE = float(os.getenv("RAG_BM25_MIN_SCORE", "0"))
+
+def rank_bm25(query_text: str, top_k: int = 5, category: Optional[str] = None,
+              where: Optional[FilterNode] = None) -> List[str]:
+    """BM25F 打分，返回按得分排序的文档 id"""
+    # 分类分片使用全局的 idf 与平均字段长度，得分与全局索引一致
+    index = index_for(category)
+    hits = index.search_bm25(
+        index.segmenter.tokenize(query_text), top_k, index_filter(index, category, where),
+        min_score=BM25_MIN_SCORE, stats=text_index
+    )
+    return list(index.doc_ids(docno for docno, score in hits).values())
+
+def search_documents_bm25(query_text: str, top_k: int = 5, category: Optional[str] = None,
+                          where: Optional[FilterNode] = None) -> List[Document]:
+    """BM25F 检索：基于倒排索引中预先维护的文档频率和字段长度打分"""
+    return fetch_documents(rank_bm25(query_text, top_k, category, where))
+
+def build_fts_query(query_text: str) -> str:
+    """将查询切分为3字词组，构造 FTS5 MATCH 表达式（OR 连接，由 bm25 排序）"""
+    text = query_text.strip()
+    grams = dict.fromkeys(text[i:i + 3] for i in range(len(text) - 2))
+    return " OR ".join('"' + gram.replace('"', '""') + '"' for gram in grams)
+
+def search_documents_fts(query_text: str, top_k: int = 5, category: Optional[str] = None,
+                         where: Optional[FilterNode] = None) -> List[Document]:
+    """使用 SQLite FTS5 检索，匹配与 bm25 排序都在 SQLite 内完成，只取回 top_k 行"""
+    query_text = normalize_query(query_text)
+    if not query_text:
+        # 空查询不匹配任何文档（否则 LIKE 模式退化为 '%%'），与其它检索模式一致
+        return []
+    match_expr = build_fts_query(query_text)
+    conn = get_db_connection()
+    try:
+        if match_expr:
+            weights = ", ".join(str(w) for w in FTS_FIELD_WEIGHTS)
+            sql = '''
+            SELECT d.id, d.title, decompress(c.data) AS content, d.category, d.tags, d.source, d.created_at, d.parent_id
+            FROM documents_fts JOIN documents d ON d.rowid = documents_fts.rowid
+            LEFT JOIN document_contents c ON c.id = d.id
+            WHERE documents_fts MATCH ?
+            '''
+            params = [match_expr]
+            order_by = f'bm25(documents_fts, {weights})'
+        else:
+            # trigram 分词无法匹配少于3个字的查询，退回 LIKE 子串匹配（无 bm25 排序）
+            escaped = query_text.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+            pattern = f'%{escaped}%'
+            sql = '''
+            SELECT d.id, d.title, decompress(c.data) AS content, d.category, d.tags, d.source, d.created_at, d.parent_id
+            FROM documents_fts JOIN documents d ON d.rowid = documents_fts.rowid
+            LEFT JOIN document_contents c ON c.id = d.id
+            WHERE (documents_fts.title LIKE ? ESCAPE '!' OR documents_fts.content LIKE ? ESCAPE '!'
+                   OR documents_fts.tags LIKE ? ESCAPE '!')
+            '''
+            params = [pattern, pattern, pattern]
+            order_by = 'd.rowid'
+        node = with_category(where, category)
+        if node is not None:
+            condition, filter_params = filter_sql(node)
+            sql += f' AND ({condition})'
+            params.extend(filter_params)
+        sql += f' ORDER BY {order_by} LIMIT ?'
+        params.append(top_k)
+        return [row_to_document(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+def rank_vector(query_text: str, top_k: int = 5, category: Optional[str] = None,
+                nprobe: Optional[int] = None, where: Optional[FilterNode] = None) -> List[str]:
+    """向量相似度打分，返回按相似度排序的文档 id"""
+    query_vector = embedder.embed(query_text)
+    limit = rerank_limit(top_k)
+    index = use_ann(nprobe)
+    if where is not None:
+        # 带过滤表达式时只在过滤后的文档中精确打分（代价与过滤后的集合大小成正比，也不会因簇内没有匹配文档而漏召回）
+        hits = vector_index.search_subset(query_vector, filtered_doc_ids(category, where), limit)
+    elif index is not None:
+        candidates = index.probe(vector_index.weight_query(query_vector), nprobe)
+        hits = vector_index.search_subset(query_vector, candidates, limit, category)
+    else:
+        hits = vector_index.search(query_vector, limit, category)
+    hits = rerank_exact(query_vector.reshape(1, -1), [hits], [top_k])[0]
+    return [doc_id for doc_id, score in hits if score >= VECTOR_MIN_SCORE]
+
+def search_documents_vector(query_text: str, top_k: int = 5, category: Optional[str] = None,
+                            nprobe: Optional[int] = None, where: Optional[FilterNode] = None) -> List[Document]:
+    """
+    向量相似度检索
+
+    语料较大（或请求指定了 nprobe）且 IVF 索引已训练时，只在最相近的 nprobe 个簇内打分；
+    否则一次矩阵乘法 + argpartition 暴力取 top_k。
+    """
+    return fetch_documents(rank_vector(query_text, top_k, category, nprobe, where))
+
+# 混合检索：BM25 与向量检索各取候选，按倒数排名融合（RRF）
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "50"))  # 每个检索器参与融合的候选数上限（不少于 top_k）
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))  # RRF 平滑常数，越大排名靠后的候选权重衰减越慢
+
+def hybrid_candidates(top_k: int) -> int:
+    return max(top_k, HYBRID_CANDIDATES)
+
+def reciprocal_rank_fusion(rankings: List[List[str]], top_k: int) -> List[str]:
+    """RRF：文档得分为各检索器中 1 / (RRF_K + 名次) 之和，同分时按首次出现的先后"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])[:top_k]
+
+def run_hybrid_retrievers(rank_lexical: Callable[[], list], rank_dense: Callable[[], list]) -> Tuple[list, list]:
+    """
+    两个检索器并行取候选：向量打分提交到 hybrid_pool，BM25 在当前线程执行
+
+    单个查询、批量查询与 worker 进程中的混合检索都经过这里，并行方式一致。
+    """
+    dense = hybrid_pool.submit(rank_dense)
+    return rank_lexical(), dense.result()
+
+def search_documents_hybrid(query_text: str, top_k: int = 5, category: Optional[str] = None,
+                            nprobe: Optional[int] = None, where: Optional[FilterNode] = None) -> List[Document]:
+    """混合检索：词项匹配命中精确的编号、代码，向量检索补充措辞不同的相近文档"""
+    limit = hybrid_candidates(top_k)
+    rankings = run_hybrid_retrievers(
+        lambda: rank_bm25(query_text, limit, category, where),
+        lambda: rank_vector(query_text, limit, category, nprobe, where),
+    )
+    return fetch_documents(reciprocal_rank_fusion(list(rankings), top_k))
+
+def use_ann(nprobe: Optional[int]) -> Optional[IVFIndex]:
+    """本次检索是否走 IVF 索引，是则返回该索引"""
+    index = ann_index
+    if index is not None and (nprobe is not None or len(vector_index) >= ANN_MIN_VECTORS):
+        return index
+    return None
+
+def search_documents_batch(query_texts: List[str], top_ks: List[int], category: Optional[str] = None,
+                           where: Optional[FilterNode] = None) -> List[List[Document]]:
+    """批量关键词检索：同一分类与过滤条件下的查询共享短语查找结果"""
+    index = index_for(category)
+    phrase_cache: Dict[str, Dict[int, List[bool]]] = {}
+    return [
+        search_documents(query_text, top_k, category, where, index, phrase_cache)
+        for query_text, top_k in zip(query_texts, top_ks)
+    ]
+
+def rank_bm25_batch(query_texts: List[str], top_ks: List[int], category: Optional[str] = None,
+                    where: Optional[FilterNode] = None) -> List[List[str]]:
+    index = index_for(category)
+    hits = index.search_bm25_batch(
+        [list(index.segmenter.tokenize(query_text)) for query_text in query_texts], top_ks, index_filter(index, category, where),
+        min_score=BM25_MIN_SCORE, stats=text_index
+    )
+    return [list(index.doc_ids(docno for docno, score in query_hits).values()) for query_hits in hits]
+
+def rank_vector_batch(query_texts: List[str], top_ks: List[int], category: Optional[str] = None,
+                      nprobe: Optional[int] = None, where: Optional[FilterNode] = None) -> List[List[str]]:
+    if where is None and use_ann(nprobe) is not None:
+        return [
+            rank_vector(query_text, top_k, category, nprobe)
+            for query_text, top_k in zip(query_texts, top_ks)
+        ]
+    query_vectors = embedder.embed_batch(query_texts)
+    limits = [rerank_limit(top_k) for top_k in top_ks]
+    if where is not None:
+        hits = vector_index.search_batch(query_vectors, max(limits), doc_ids=filtered_doc_ids(category, where))
+    else:
+        hits = vector_index.search_batch(query_vectors, max(limits), category)
+    hits = rerank_exact(query_vectors, [query_hits[:limit] for query_hits, limit in zip(hits, limits)], top_ks)
+    return [
+        [doc_id for doc_id, score in query_hits if score >= VECTOR_MIN_SCORE]
+        for query_hits in hits
+    ]
+
+def search_documents_bm25_batch(query_texts: List[str], top_ks: List[int], category: Optional[str] = None,
+                                where: Optional[FilterNode] = None) -> List[List[Document]]:
+    """批量 BM25 检索：所有查询的词项去重后各访问一次 posting list"""
+    return fetch_documents_batch(rank_bm25_batch(query_texts, top_ks, category, where))
+
+def search_documents_vector_batch(query_texts: List[str], top_ks: List[int], category: Optional[str] = None,
+                                  where: Optional[FilterNode] = None, nprobe: Optional[int] = None) -> List[List[Document]]:
+    """批量向量检索：全部查询向量一次矩阵乘法（走 IVF 时各查询探测的簇不同，逐个检索）"""
+    return fetch_documents_batch(rank_vector_batch(query_texts, top_ks, category, nprobe, where))
+
+def search_documents_hybrid_batch(query_texts: List[str], top_ks: List[int], category: Optional[str] = None,
+                                  where: Optional[FilterNode] = None, nprobe: Optional[int] = None) -> List[List[Document]]:
+    """批量混合检索：两个检索器并行地各自批量取候选，再逐个查询融合"""
+    limits = [hybrid_candidates(top_k) for top_k in top_ks]
+    lexical, dense = run_hybrid_retrievers(
+        lambda: rank_bm25_batch(query_texts, limits, category, where),
+        lambda: rank_vector_batch(query_texts, limits, category, nprobe, where),
+    )
+    return fetch_documents_batch([
+        reciprocal_rank_fusion(list(rankings), top_k)
+        for rankings, top_k in zip(zip(lexical, dense), top_ks)
+    ])
+
+DOCUMENT_FIELDS = ("id", "title", "content", "category", "tags", "source", "created_at", "parent_id")
+LIST_PAGE_SIZE = int(os.getenv("RAG_LIST_PAGE_SIZE", "100"))
+LIST_MAX_PAGE_SIZE = int(os.getenv("RAG_LIST_MAX_PAGE_SIZE", "1000"))
+EXPORT_BATCH_SIZE = 1000
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """解析字段投影参数（逗号分隔），id 总是返回；未指定时返回全部字段"""
+    if not fields:
+        return list(DOCUMENT_FIELDS)
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in DOCUMENT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return [name for name in DOCUMENT_FIELDS if name == "id" or name in names]
+
+def list_documents_page(fields: List[str], after_id: Optional[str] = None, category: Optional[str] = None,
+                        limit: int = LIST_PAGE_SIZE) -> List[dict]:
+    """
+    按 id 顺序读取一页文档（keyset 分页：id > after_id），只查询投影的列
+
+    逐行迭代游标，不 fetchall；每页单独打开连接，读完即关闭，流式导出时不跨线程持有连接。
+    未投影 content 时不读取压缩内容表。
+    """
+    columns = ", ".join("decompress(c.data) AS content" if name == "content" else f"d.{name}" for name in fields)
+    sql = f'SELECT {columns} FROM documents d'
+    if "content" in fields:
+        sql += ' LEFT JOIN document_contents c ON c.id = d.id'
+    conditions, params = [], []
+    if after_id is not None:
+        conditions.append('d.id > ?')
+        params.append(after_id)
+    if category:
+        conditions.append('d.category = ?')
+        params.append(category)
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY d.id LIMIT ?'
+    params.append(limit)
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute('SELECT id, title, content, category, tags, source, created_at FROM documents')
-        rows = cursor.fetchall()
-        
-        results = []
-        for row in rows:
-            doc = Document(
-                id=row['id'],
-                title=row['title'],
-                content=row['content'],
-                category=row['category'],
-                tags=json.loads(row['tags']) if row['tags'] else [],
-                source=row['source'],
-                created_at=row['created_at']
-            )
-            results.append(doc)
-        
-        return results
+        page = []
+        for row in conn.execute(sql, params):
+            doc = {name: row[name] for name in fields}
+            if "tags" in doc:
+                doc["tags"] = json.loads(doc["tags"]) if doc["tags"] else []
+            page.append(doc)
+        return page
+    finally:
+        conn.close()
+
+def count_documents(category: Optional[str] = None) -> int:
+    conn = get_db_connection()
+    try:
+        if category:
+            return conn.execute('SELECT COUNT(*) FROM documents WHERE category = ?', (category,)).fetchone()[0]
+        return conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
     finally:
         conn.close()
 
-# 初始化数据库
-init_db()
+def export_documents(fields: List[str], category: Optional[str] = None) -> Iterator[str]:
+    """逐批导出文档为 NDJSON，内存中最多保留一批"""
+    after_id = None
+    while True:
+        page = list_documents_page(fields, after_id, category, EXPORT_BATCH_SIZE)
+        if not page:
+            return
+        yield "".join(json.dumps(doc, ensure_ascii=False) + "\n" for doc in page)
+        if len(page) < EXPORT_BATCH_SIZE:
+            return
+        after_id = page[-1]["id"]
 
 # 知识库样本数据 - 企业多个业务环节
 SAMPLE_DOCUMENTS = [
@@ -471,28 +1876,185 @@ SAMPLE_DOCUMENTS = [
     ),
 ]
 
+# 检索结果缓存：文档增删、重建索引后语料版本号加一，旧缓存全部失效
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024"))  # 0 表示不缓存
+QUERY_CACHE_TTL = float(os.getenv("RAG_QUERY_CACHE_TTL", "300"))
+query_cache = QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+def corpus_changed():
+    """索引内容变化后调用（必须在数据库提交、索引更新完成之后）"""
+    global committed_seq
+    with index_write_lock:
+        # 写入方持有 index_write_lock 直到这里，此时日志中的变更都已提交
+        if delta_log is not None:
+            committed_seq = delta_log.seq
+        query_cache.bump_generation()
+
+# 检索模式 -> 检索函数
+SEARCH_MODES = {
+    "keyword": lambda q: search_documents(q.query, q.top_k, q.category, query_filter(q)),
+    "bm25": lambda q: search_documents_bm25(q.query, q.top_k, q.category, query_filter(q)),
+    "fts": lambda q: search_documents_fts(q.query, q.top_k, q.category, query_filter(q)),
+    "vector": lambda q: search_documents_vector(q.query, q.top_k, q.category, q.nprobe, query_filter(q)),
+    "hybrid": lambda q: search_documents_hybrid(q.query, q.top_k, q.category, q.nprobe, query_filter(q)),
+}
+
+# 批量检索模式 -> 检索函数 (query_texts, top_ks, category, where, nprobe)；fts 由 SQLite 逐条执行
+BATCH_SEARCH_MODES = {
+    "keyword": lambda texts, top_ks, category, where, nprobe: search_documents_batch(texts, top_ks, category, where),
+    "bm25": lambda texts, top_ks, category, where, nprobe: search_documents_bm25_batch(texts, top_ks, category, where),
+    "fts": lambda texts, top_ks, category, where, nprobe: [
+        search_documents_fts(text, top_k, category, where) for text, top_k in zip(texts, top_ks)
+    ],
+    "vector": search_documents_vector_batch,
+    "hybrid": search_documents_hybrid_batch,
+}
+MAX_BATCH_QUERIES = int(os.getenv("RAG_MAX_BATCH_QUERIES", "10000"))
+
+def search_groups(groups: List[Tuple[str, Optional[str], Optional[str], Optional[int], List[str], List[int]]]) -> List[Tuple[List[List[Document]], float]]:
+    """依次检索多个分组 (mode, category, 过滤表达式, nprobe, 查询文本, top_k)，返回每组的 (各查询结果, 耗时)"""
+    results = []
+    for mode, category, where, nprobe, query_texts, top_ks in groups:
+        group_start = time.time()
+        documents = BATCH_SEARCH_MODES[mode](query_texts, top_ks, category, parse_filter(where) if where else None, nprobe)
+        results.append((documents, time.time() - group_start))
+    return results
+
+def with_snippets(docs: List[Document], query_text: str, max_snippet_chars: int) -> List[Document]:
+    """把结果文档的全文替换为查询相关片段，预算在各文档间平分（返回副本，缓存中的结果不变）"""
+    if not docs:
+        return docs
+    budget = max_snippet_chars // len(docs)
+    matcher = query_matcher(query_text, segmenter)
+    return [
+        doc.model_copy(update={
+            "content": "",
+            "snippets": [
+                Snippet(text=doc.content[start:end], start=start, end=end)
+                for start, end in extract_snippets(doc.content, matcher, budget)
+            ]
+        })
+        for doc in docs
+    ]
+
+# 检索线程池：FTS 走 SQLite（I/O 为主），其余模式在内存索引上打分；两者分开，互不挤占
+SEARCH_WORKERS = int(os.getenv("RAG_SEARCH_WORKERS", "4"))
+SEARCH_QUEUE_LIMIT = int(os.getenv("RAG_SEARCH_QUEUE_LIMIT", "64"))
+SQLITE_WORKERS = int(os.getenv("RAG_SQLITE_WORKERS", "4"))
+SQLITE_QUEUE_LIMIT = int(os.getenv("RAG_SQLITE_QUEUE_LIMIT", "64"))
+SEARCH_RETRY_AFTER = int(os.getenv("RAG_SEARCH_RETRY_AFTER", "1"))  # 503 响应的 Retry-After（秒）
+search_executor = SearchExecutor("search", SEARCH_WORKERS, SEARCH_QUEUE_LIMIT, SEARCH_RETRY_AFTER)
+sqlite_executor = SearchExecutor("sqlite", SQLITE_WORKERS, SQLITE_QUEUE_LIMIT, SEARCH_RETRY_AFTER)
+# 混合检索中与 BM25 并行执行的向量打分（每个检索线程至多占用一个），任务不会再向该池提交，不会互相等待
+hybrid_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="hybrid")
+# 写入线程池：文档写入（SQLite 事务、分词、更新索引）同样移出事件循环，大批量导入不阻塞检索请求；
+# 索引更新在 index_write_lock 内串行执行，多个线程只重叠分词与数据库读写
+WRITE_WORKERS = int(os.getenv("RAG_WRITE_WORKERS", "2"))
+WRITE_QUEUE_LIMIT = int(os.getenv("RAG_WRITE_QUEUE_LIMIT", "16"))
+write_executor = SearchExecutor("write", WRITE_WORKERS, WRITE_QUEUE_LIMIT, SEARCH_RETRY_AFTER)
+# 多进程检索：大于 0 时启动该数量的 worker 进程，只读挂载索引快照执行关键词 / BM25 / 向量打分，
+# 不受 GIL 限制；快照在各进程间共享，内存不随进程数增长。0 表示只用本进程的线程池
+SEARCH_PROCESSES = int(os.getenv("RAG_SEARCH_PROCESSES", "0"))
+process_executor: Optional[SearchExecutor] = None
+
+def start_search_processes():
+    global process_executor
+    import search_worker
+    process_executor = SearchExecutor(
+        "search-process", SEARCH_PROCESSES, SEARCH_QUEUE_LIMIT, SEARCH_RETRY_AFTER,
+        processes=True, initializer=search_worker.attach
+    )
+
+def executor_for(mode: str, nprobe: Optional[int] = None) -> SearchExecutor:
+    if mode == "fts":
+        return sqlite_executor
+    # worker 进程只挂载快照中的倒排与向量索引；还没有快照或需要走 IVF 索引时在本进程检索
+    if process_executor is not None and snapshot_path is not None and not (mode in ("vector", "hybrid") and use_ann(nprobe)):
+        return process_executor
+    return search_executor
+
+async def run_search(executor: SearchExecutor, fn, *args):
+    """在检索（或写入）线程池中执行，线程池已满时返回 503"""
+    try:
+        return await executor.run(fn, *args)
+    except ExecutorSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service is busy: {str(e)}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+async def run_query(query: SearchQuery) -> List[Document]:
+    executor = executor_for(query.mode, query.nprobe)
+    if executor is process_executor:
+        import search_worker
+        return await run_search(executor, search_worker.search, query.mode, query, committed_seq, snapshot_path)
+    return await run_search(executor, SEARCH_MODES[query.mode], query)
+
+async def run_search_groups(executor: SearchExecutor, groups: List[tuple]) -> List[Tuple[List[List[Document]], float]]:
+    if executor is process_executor:
+        import search_worker
+        return await run_search(executor, search_worker.search_groups, groups, committed_seq, snapshot_path)
+    return await run_search(executor, search_groups, groups)
+
+@app.on_event("startup")
+async def startup_event():
+    global delta_log, committed_seq
+    init_db()
+    delta_log = DeltaLog(SNAPSHOT_DIR)
+    if not restore_from_snapshot():
+        build_index()
+        load_vectors()
+        snapshot_job.start()
+    elif delta_log.pending >= SNAPSHOT_DELTA_LIMIT:
+        snapshot_job.start()
+    committed_seq = delta_log.seq
+    if SEARCH_PROCESSES > 0:
+        start_search_processes()
+    load_ann_index()
+    load_signatures()
+    signature_job.start()
+    # 为尚无向量（或嵌入模型已变更）的文档在后台补生成向量
+    reembed_job.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    search_executor.shutdown()
+    sqlite_executor.shutdown()
+    write_executor.shutdown()
+    hybrid_pool.shutdown(wait=False, cancel_futures=True)
+    if process_executor is not None:
+        process_executor.shutdown()
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "rag_service_lite", "version": "2.0.0"}
+    return {
+        "status": "healthy",
+        "service": "rag_service_lite",
+        "version": "2.0.0",
+        "query_cache": query_cache.stats(),
+        "executors": {
+            "search": search_executor.stats(),
+            "sqlite": sqlite_executor.stats(),
+            "write": write_executor.stats(),
+            "process": process_executor.stats() if process_executor is not None else None
+        }
+    }
 
 @app.post("/api/rag/init")
 async def initialize_knowledge_base():
-    """初始化知识库 - 将样本数据写入向量数据库"""
+    """初始化知识库 - 用样本数据替换全部文档（新一代索引构建完成后与数据库一起切换）"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM documents')
-        conn.commit()
-        conn.close()
-        
-        for doc in SAMPLE_DOCUMENTS:
-            insert_document(doc)
+        await run_search(write_executor, replace_documents, SAMPLE_DOCUMENTS)
         
         return {
             "status": "success",
             "message": f"Successfully initialized {len(SAMPLE_DOCUMENTS)} documents",
-            "total": len(SAMPLE_DOCUMENTS)
+            "total": len(SAMPLE_DOCUMENTS),
+            "generation": index_generation
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to initialize: {str(e)}")
 
@@ -501,52 +2063,579 @@ async def search_knowledge_base(query: SearchQuery):
     """从向量数据库搜索文档"""
     start_time = time.time()
     
+    if query.mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported search mode: {query.mode}")
+    if query.mode == "fts" and not FTS_ENABLED:
+        raise HTTPException(status_code=400, detail="FTS5 search is not available")
+    if query.max_snippet_chars is not None and query.max_snippet_chars < 0:
+        raise HTTPException(status_code=400, detail="max_snippet_chars must be non-negative")
+    try:
+        query_filter(query)
+    except FilterSyntaxError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filter: {str(e)}")
+    
     try:
-        results = search_documents(query.query, query.top_k, query.category)
+        query.query = normalize_query(query.query)
+        cache_key = (query.query, query.top_k, query.category, query.filter, query.mode, query.nprobe)
+        results = query_cache.get(cache_key)
+        if results is None:
+            generation = query_cache.generation
+            # 检索在线程池（或 worker 进程）中执行，不阻塞事件循环
+            results = await run_query(query)
+            query_cache.put(cache_key, results, generation)
+        if query.max_snippet_chars is not None:
+            results = await run_search(search_executor, with_snippets, results, query.query, query.max_snippet_chars)
         search_time = time.time() - start_time
         
         # 如果没有找到结果，返回空列表而不是提示文档
         # QA Entry 会根据空结果决定是否调用 LLM
         return SearchResult(documents=results, total=len(results), search_time=search_time)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
+@app.post("/api/rag/search/batch", response_model=BatchSearchResult)
+async def search_knowledge_base_batch(request: BatchSearchRequest):
+    """
+    批量检索
+
+    各查询先查结果缓存；未命中的按 (mode, category, filter, nprobe) 分组，每组一起检索：
+    关键词 / BM25 模式共有的词项只访问一次索引，向量模式一次矩阵乘法。
+    """
+    start_time = time.time()
+    queries = request.queries
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"Too many queries: {len(queries)} > {MAX_BATCH_QUERIES}")
+    for i, query in enumerate(queries):
+        if query.mode not in BATCH_SEARCH_MODES:
+            raise HTTPException(status_code=400, detail=f"Unsupported search mode in query #{i}: {query.mode}")
+        if query.mode == "fts" and not FTS_ENABLED:
+            raise HTTPException(status_code=400, detail="FTS5 search is not available")
+        if query.max_snippet_chars is not None and query.max_snippet_chars < 0:
+            raise HTTPException(status_code=400, detail=f"max_snippet_chars must be non-negative in query #{i}")
+        try:
+            query_filter(query)
+        except FilterSyntaxError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid filter in query #{i}: {str(e)}")
+
+    try:
+        documents: List[Optional[List[Document]]] = [None] * len(queries)
+        search_times = [0.0] * len(queries)
+        groups: Dict[tuple, List[int]] = defaultdict(list)
+        for i, query in enumerate(queries):
+            query.query = normalize_query(query.query)
+            documents[i] = query_cache.get((query.query, query.top_k, query.category, query.filter, query.mode, query.nprobe))
+            if documents[i] is None:
+                groups[(query.mode, query.category, query.filter, query.nprobe)].append(i)
+
+        # 每个池只提交一个任务（依次检索分给它的分组），FTS 与内存打分并行执行
+        executor_groups: Dict[SearchExecutor, List[tuple]] = defaultdict(list)
+        for key in groups:
+            executor_groups[executor_for(key[0], key[3])].append(key)
+        generation = query_cache.generation
+        executor_results = await asyncio.gather(*[
+            run_search_groups(executor, [
+                key + ([queries[i].query for i in groups[key]], [queries[i].top_k for i in groups[key]])
+                for key in keys
+            ])
+            for executor, keys in executor_groups.items()
+        ])
+        for keys, group_results in zip(executor_groups.values(), executor_results):
+            for key, (results, group_time) in zip(keys, group_results):
+                for i, docs in zip(groups[key], results):
+                    query = queries[i]
+                    documents[i] = docs
+                    search_times[i] = group_time
+                    query_cache.put((query.query, query.top_k, query.category, query.filter, query.mode, query.nprobe), docs, generation)
+
+        snippet_queries = [i for i, query in enumerate(queries) if query.max_snippet_chars is not None]
+        if snippet_queries:
+            snippet_results = await run_search(search_executor, lambda: [
+                with_snippets(documents[i], queries[i].query, queries[i].max_snippet_chars) for i in snippet_queries
+            ])
+            for i, docs in zip(snippet_queries, snippet_results):
+                documents[i] = docs
+
+        return BatchSearchResult(
+            results=[
+                SearchResult(documents=docs, total=len(docs), search_time=search_time)
+                for docs, search_time in zip(documents, search_times)
+            ],
+            total=len(queries),
+            search_time=time.time() - start_time
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch search failed: {str(e)}")
+
+@app.post("/api/rag/vectors/reembed")
+async def reembed_vectors(request: ReembedRequest):
+    """启动后台批量向量生成任务"""
+    if not reembed_job.start(request.full):
+        raise HTTPException(status_code=409, detail="Re-embed job is already running")
+    return {"status": "started", "full": request.full, "model": embedder.model_name}
+
+def ann_status() -> dict:
+    index = ann_index
+    status = {"trained": index is not None, "path": ANN_PATH, "min_vectors": ANN_MIN_VECTORS, "job": ann_train_job.state}
+    if index is not None:
+        sizes = index.list_sizes()
+        status.update(nlist=index.nlist, nprobe=index.nprobe, vectors=len(index), max_list_size=max(sizes))
+    return status
+
+@app.get("/api/rag/vectors/status")
+async def vector_status():
+    """向量索引与生成任务状态"""
+    return {
+        "vectors": len(vector_index),
+        "dim": VECTOR_DIM,
+        "memory_bytes": vector_index.nbytes,
+        "job": reembed_job.state,
+        "ann": ann_status(),
+        "quantization": {
+            "mode": vector_index.quantization,
+            "rerank_factor": VECTOR_RERANK if vector_index.quantized else 0,
+            "report": quantization_report_job.state
+        }
+    }
+
+@app.post("/api/rag/vectors/quantization/report")
+async def start_quantization_report(request: QuantizationReportRequest):
+    """启动后台量化召回报告（结果见 /api/rag/vectors/status 的 quantization.report）"""
+    if len(vector_index) == 0:
+        raise HTTPException(status_code=400, detail="No vectors to evaluate")
+    if not quantization_report_job.start(request.sample, request.top_k):
+        raise HTTPException(status_code=409, detail="Quantization report is already running")
+    return {"status": "started", "quantization": vector_index.quantization, "sample": request.sample, "top_k": request.top_k}
+
+@app.post("/api/rag/vectors/ann/train")
+async def train_ann_index(request: AnnTrainRequest):
+    """启动后台 IVF 索引训练"""
+    if not ann_train_job.start(request.nlist, request.iterations):
+        raise HTTPException(status_code=409, detail="ANN training is already running")
+    return {"status": "started", "nlist": request.nlist, "iterations": request.iterations}
+
+@app.get("/api/rag/index/snapshot")
+async def snapshot_status():
+    """索引快照状态"""
+    directory = current_snapshot(SNAPSHOT_DIR)
+    return {
+        "snapshot": read_manifest(directory) if directory else None,
+        "delta_seq": delta_log.seq if delta_log else 0,
+        "pending_changes": delta_log.pending if delta_log else 0,
+        "delta_limit": SNAPSHOT_DELTA_LIMIT,
+        "job": snapshot_job.state
+    }
+
+@app.get("/api/rag/index/shards")
+async def shard_status():
+    """分类分片状态"""
+    return {"text": text_shards.stats(), "vector_cached_categories": vector_index.cached_categories()}
+
+@app.post("/api/rag/index/snapshot")
+async def create_snapshot():
+    """启动后台快照生成"""
+    with index_job_lock:
+        if rebuild_job.running:
+            raise HTTPException(status_code=409, detail="Index rebuild is in progress")
+        if not snapshot_job.start():
+            raise HTTPException(status_code=409, detail="Snapshot job is already running")
+    return {"status": "started", "delta_seq": delta_log.seq}
+
+@app.post("/api/rag/index/rebuild")
+async def start_rebuild(request: RebuildRequest):
+    """启动后台蓝绿重建：新一代索引构建完成前旧一代继续服务检索"""
+    with index_job_lock:
+        if snapshot_job.running:
+            raise HTTPException(status_code=409, detail="Snapshot job is running, retry after it finishes")
+        if not rebuild_job.start(request.reload_dictionary):
+            raise HTTPException(status_code=409, detail="Index rebuild is already running")
+    return {"status": "started", "generation": index_generation + 1, "reload_dictionary": request.reload_dictionary}
+
+@app.get("/api/rag/index/rebuild")
+async def rebuild_status():
+    """当前一代索引与重建任务进度（processed/total、docs_per_second、phase）"""
+    return {
+        "generation": index_generation,
+        "documents": len(text_index),
+        "vectors": len(vector_index),
+        "segmenter": {"fingerprint": segmenter.fingerprint, "words": len(segmenter)},
+        "job": rebuild_job.state
+    }
+
+# 批量导入：每批一个事务，索引每批更新一次
+BULK_BATCH_SIZE = int(os.getenv("RAG_BULK_BATCH_SIZE", "1000"))
+
+async def read_bulk_documents(request: Request):
+    """
+    逐个产出请求体中的 (序号, 文档 dict)
+
+    请求体以 '[' 开头时按 JSON 数组整体解析，否则按 NDJSON（每行一个文档）流式解析。
+    """
+    chunks: List[bytes] = []
+    buffer = b""
+    is_array = None
+    line_no = 0
+    async for chunk in request.stream():
+        if is_array is None:
+            stripped = (buffer + chunk).lstrip()
+            if stripped:
+                is_array = stripped.startswith(b"[")
+        if is_array:
+            chunks.append(buffer + chunk)
+            buffer = b""
+            continue
+        buffer += chunk
+        if is_array is None:
+            continue
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield line_no, json.loads(line)
+
+    if is_array:
+        items = json.loads(b"".join(chunks))
+        if not isinstance(items, list):
+            raise ValueError("JSON body must be an array of documents")
+        for i, item in enumerate(items, 1):
+            yield i, item
+    elif buffer.strip():
+        yield line_no + 1, json.loads(buffer)
+
+def check_dedup_policy(dedup: Optional[str]):
+    if dedup is not None and dedup not in DEDUP_POLICIES:
+        raise HTTPException(status_code=400, detail=f"dedup must be one of: {', '.join(DEDUP_POLICIES)}")
+
+@app.post("/api/rag/documents/bulk")
+async def bulk_add_documents(request: Request, dedup: Optional[str] = None):
+    """批量添加文档（JSON 数组或 NDJSON），每批一个事务；dedup 同单个添加，近重复文档在 duplicates 中列出"""
+    check_dedup_policy(dedup)
+    doc_ids: List[str] = []
+    duplicates: List[dict] = []
+    batch: List[Document] = []
+    batches = 0
+    try:
+        async for item_no, item in read_bulk_documents(request):
+            try:
+                batch.append(Document(**item))
+            except (TypeError, ValidationError) as e:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid document #{item_no}: {str(e)} ({len(doc_ids)} documents already inserted)"
+                )
+            if len(batch) >= BULK_BATCH_SIZE:
+                doc_ids.extend(await run_search(write_executor, insert_documents, batch, dedup, duplicates))
+                batches += 1
+                batch = []
+        if batch:
+            doc_ids.extend(await run_search(write_executor, insert_documents, batch, dedup, duplicates))
+            batches += 1
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid request body: {str(e)} ({len(doc_ids)} documents already inserted)"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to add documents: {str(e)} ({len(doc_ids)} documents already inserted)"
+        )
+    return {
+        "status": "success",
+        "inserted": len(doc_ids),
+        "batches": batches,
+        "ids": doc_ids,
+        "duplicates": duplicates
+    }
+
+# 分段导入：段落最大长度与相邻段落的重叠长度（字符数）
+PASSAGE_MAX_CHARS = int(os.getenv("RAG_PASSAGE_MAX_CHARS", "500"))
+PASSAGE_OVERLAP = int(os.getenv("RAG_PASSAGE_OVERLAP", "100"))
+
+def reserve_document_id() -> str:
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        doc_id = allocate_ids(conn, 1, [])[0]
+        conn.commit()
+        return doc_id
+    finally:
+        conn.close()
+
+def delete_passages(parent_id: str) -> int:
+    """删除原文档的全部段落（重新导入或删除原文档时）"""
+    conn = get_db_connection()
+    try:
+        doc_ids = [row['id'] for row in conn.execute('SELECT id FROM documents WHERE parent_id = ?', (parent_id,))]
+        if not doc_ids:
+            return 0
+        with index_write_lock:
+            log_change("delete", doc_ids)
+            conn.execute('DELETE FROM documents WHERE parent_id = ?', (parent_id,))
+            conn.commit()
+            for doc_id in doc_ids:
+                remove_text(doc_id)
+                remove_vectors(doc_id)
+                lsh_index.remove(doc_id)
+            corpus_changed()
+        return len(doc_ids)
+    finally:
+        conn.close()
+
+def save_parent_document(parent: Document, passages: int):
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+        INSERT OR REPLACE INTO parent_documents (id, title, category, tags, source, passages, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        ''', (
+            parent.id,
+            parent.title,
+            parent.category,
+            json.dumps(parent.tags, ensure_ascii=False),
+            parent.source,
+            passages,
+            parent.created_at
+        ))
+        conn.commit()
+    finally:
+        conn.close()
+
+class PassageIngest:
+    """把一个原文档的文本分段写入：段落 id 为 {原文档 id}#{序号}，按批写入，内存只保留一个批次"""
+
+    def __init__(self, parent: Document, max_chars: int, overlap: int, dedup_policy: Optional[str] = None,
+                 duplicates: Optional[List[dict]] = None):
+        if not parent.id:
+            parent.id = reserve_document_id()
+        self.parent = parent
+        self.splitter = PassageSplitter(max_chars, overlap)
+        self.batch: List[Document] = []
+        self.count = 0
+        self.dedup_policy = dedup_policy
+        self.duplicates = duplicates
+        delete_passages(parent.id)
+
+    def feed(self, text: str):
+        for passage in self.splitter.feed(text):
+            self._add(passage)
+
+    def finish(self) -> int:
+        for passage in self.splitter.flush():
+            self._add(passage)
+        self._write()
+        save_parent_document(self.parent, self.count)
+        return self.count
+
+    def _add(self, passage: str):
+        self.batch.append(Document(
+            id=f"{self.parent.id}#{self.count:04d}",
+            title=self.parent.title,
+            content=passage,
+            category=self.parent.category,
+            tags=self.parent.tags,
+            source=self.parent.source,
+            created_at=self.parent.created_at,
+            parent_id=self.parent.id
+        ))
+        self.count += 1
+        if len(self.batch) >= BULK_BATCH_SIZE:
+            self._write()
+
+    def _write(self):
+        if self.batch:
+            insert_documents(self.batch, self.dedup_policy, self.duplicates)
+            self.batch = []
+
+def ingest_parent(parent: Document, max_chars: int, overlap: int, dedup_policy: Optional[str],
+                  duplicates: List[dict]) -> int:
+    """分段写入一个完整的原文档，返回段落数"""
+    ingest = PassageIngest(parent, max_chars, overlap, dedup_policy, duplicates)
+    ingest.feed(parent.content)
+    return ingest.finish()
+
+@app.post("/api/rag/documents/ingest")
+async def ingest_documents(request: Request, id: Optional[str] = None, title: Optional[str] = None,
+                           category: Optional[str] = None, tags: Optional[str] = None, source: str = "internal",
+                           max_chars: int = PASSAGE_MAX_CHARS, overlap: int = PASSAGE_OVERLAP,
+                           dedup: Optional[str] = None):
+    """
+    流式分段导入
+
+    Content-Type 为 text/plain 时请求体是一个原文档的纯文本（id、title、category、tags 由查询参数给出，
+    tags 以逗号分隔）；否则按 NDJSON 解析，每行一个完整文档。每个原文档按句子边界切分为段落后入库。
+    dedup 为段落级的近重复处理策略，同单个添加。
+    """
+    try:
+        PassageSplitter(max_chars, overlap)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    check_dedup_policy(dedup)
+
+    parents = []
+    duplicates: List[dict] = []
+    try:
+        if request.headers.get("content-type", "").startswith("text/plain"):
+            if not title or not category:
+                raise HTTPException(status_code=400, detail="title and category are required for text/plain ingest")
+            parent = Document(id=id, title=title, content="", category=category, source=source,
+                              tags=[tag.strip() for tag in tags.split(",") if tag.strip()] if tags else [])
+            ingest = await run_search(write_executor, PassageIngest, parent, max_chars, overlap, dedup, duplicates)
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            async for chunk in request.stream():
+                await run_search(write_executor, ingest.feed, decoder.decode(chunk))
+            await run_search(write_executor, ingest.feed, decoder.decode(b"", final=True))
+            parents.append({"id": parent.id, "passages": await run_search(write_executor, ingest.finish)})
+        else:
+            async for item_no, item in read_bulk_documents(request):
+                try:
+                    parent = Document(**item)
+                except (TypeError, ValidationError) as e:
+                    raise HTTPException(status_code=400, detail=f"Invalid document #{item_no}: {str(e)}")
+                parents.append({
+                    "id": parent.id,
+                    "passages": await run_search(write_executor, ingest_parent, parent, max_chars, overlap, dedup, duplicates)
+                })
+    except HTTPException as e:
+        if parents:
+            e.detail = f"{e.detail} ({len(parents)} documents already ingested)"
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid request body: {str(e)} ({len(parents)} documents already ingested)")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to ingest documents: {str(e)} ({len(parents)} documents already ingested)")
+
+    return {
+        "status": "success",
+        "documents": len(parents),
+        "passages": sum(parent["passages"] for parent in parents),
+        "parents": parents,
+        "duplicates": duplicates
+    }
+
 @app.get("/api/rag/documents")
-async def list_documents():
-    """获取所有文档"""
+async def list_documents(limit: int = LIST_PAGE_SIZE, cursor: Optional[str] = None, fields: Optional[str] = None,
+                         category: Optional[str] = None):
+    """
+    分页获取文档
+
+    按 id 排序，cursor 为上一页返回的 next_cursor（最后一个文档的 id）；
+    fields 为逗号分隔的返回字段（如 id,title,category），省略时返回全部字段。
+    total 为符合条件的文档总数。
+    """
+    if not 1 <= limit <= LIST_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {LIST_MAX_PAGE_SIZE}")
     try:
-        docs = get_all_documents()
-        return {"documents": docs, "total": len(docs)}
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # 多取一条判断是否还有下一页
+        docs = await run_search(sqlite_executor, list_documents_page, columns, cursor, category, limit + 1)
+        total = await run_search(sqlite_executor, count_documents, category)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list documents: {str(e)}")
+    next_cursor = docs[limit - 1]["id"] if len(docs) > limit else None
+    return {"documents": docs[:limit], "total": total, "next_cursor": next_cursor}
+
+@app.get("/api/rag/documents/export")
+async def export_all_documents(fields: Optional[str] = None, category: Optional[str] = None):
+    """以 NDJSON 流式导出全部文档（每行一个文档），按 id 顺序逐批读取"""
+    try:
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(export_documents(columns, category), media_type="application/x-ndjson")
+
+@app.get("/api/rag/documents/duplicates")
+async def list_duplicates(threshold: float = DEDUP_THRESHOLD, limit: int = LIST_PAGE_SIZE):
+    """现有语料中的近重复簇（估计 Jaccard 相似度不低于 threshold），按簇大小降序"""
+    if not 0 < threshold <= 1:
+        raise HTTPException(status_code=400, detail="threshold must be in (0, 1]")
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    try:
+        clusters = await run_search(search_executor, lsh_index.clusters, threshold)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to find duplicates: {str(e)}")
+    return {
+        "clusters": [{"ids": ids, "size": len(ids)} for ids in clusters[:limit]],
+        "total": len(clusters),
+        "documents": sum(len(ids) for ids in clusters),
+        "signatures": len(lsh_index),
+        "job": signature_job.state
+    }
 
 @app.post("/api/rag/documents")
-async def add_document(doc: Document):
-    """添加新文档到向量数据库"""
-    try:
-        if not doc.id:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) as count FROM documents')
-            count = cursor.fetchone()['count']
-            conn.close()
-            doc.id = f"doc_{count + 1:03d}"
-        
-        insert_document(doc)
-        return {"status": "success", "id": doc.id, "message": "Document added successfully"}
+async def add_document(doc: Document, dedup: Optional[str] = None):
+    """
+    添加新文档到向量数据库
+
+    dedup 为近重复处理策略（keep / reject / merge，默认 RAG_DEDUP_POLICY）：
+    reject 时近重复文档返回 409；merge 时不写入，标签并入已有文档并返回其 id。
+    """
+    check_dedup_policy(dedup)
+    try:
+        duplicates: List[dict] = []
+        await run_search(write_executor, insert_documents, [doc], dedup, duplicates)
+        if duplicates and duplicates[0]["action"] == "rejected":
+            raise HTTPException(
+                status_code=409,
+                detail=f"Document is a near-duplicate of {duplicates[0]['duplicate_of']} "
+                       f"(similarity {duplicates[0]['similarity']})"
+            )
+        if duplicates and duplicates[0]["action"] == "merged":
+            return {
+                "status": "success",
+                "id": duplicates[0]["duplicate_of"],
+                "message": "Document merged into a near-duplicate",
+                "duplicate": duplicates[0]
+            }
+        return {
+            "status": "success",
+            "id": doc.id,
+            "message": "Document added successfully",
+            "duplicate": duplicates[0] if duplicates else None
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to add document: {str(e)}")
 
-@app.delete("/api/rag/documents/{doc_id}")
-async def delete_document(doc_id: str):
-    """删除文档"""
-    try:
+def remove_document(doc_id: str):
+    """删除文档及其段落，并同步倒排、向量与签名索引（在写入线程池中执行）"""
+    delete_passages(doc_id)
+    with index_write_lock:
+        log_change("delete", [doc_id])
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('DELETE FROM documents WHERE id = ?', (doc_id,))
+        cursor.execute('DELETE FROM parent_documents WHERE id = ?', (doc_id,))
         conn.commit()
         conn.close()
+        remove_text(doc_id)
+        remove_vectors(doc_id)
+        lsh_index.remove(doc_id)
+        corpus_changed()
+
+@app.delete("/api/rag/documents/{doc_id}")
+async def delete_document(doc_id: str):
+    """删除文档（删除分段导入的原文档时同时删除其全部段落）"""
+    try:
+        await run_search(write_executor, remove_document, doc_id)
         return {"status": "success", "message": f"Document {doc_id} deleted"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete document: {str(e)}")
 
@@ -0,0 +1,53 @@
+"""
+检索 worker 进程 - 只读挂载索引快照，在独立进程中执行检索打分
+
+主进程负责写入文档与生成快照；worker 进程 mmap 加载同一份快照，倒排基础段与向量矩阵
+由各进程共享页缓存，内存不随 worker 数增长，每个进程私有的只有快照之后的增量。
+每次检索前，worker 重放变更日志中主进程已提交、本进程尚未应用的部分；
+主进程生成了新快照（或日志已被新快照截断）时改为挂载新快照——重建切换后的新一代索引也由此挂载。
+"""
+from typing import List, Optional, Tuple
+
+import main
+from snapshot import DeltaLog, read_manifest
+
+# 本进程已应用到的变更 seq（None 表示尚未挂载快照）
+_applied_seq: Optional[int] = None
+# 主进程的当前快照与本进程挂载时的一致时，只需重放变更日志
+_snapshot: Optional[str] = None
+
+
+def attach():
+    """进程初始化：只读打开变更日志，关闭会复制索引内容的分类分片与分类向量缓存"""
+    main.RESIDENT_SHARDS = 0
+    main.vector_index.max_cached_categories = 0
+    main.delta_log = DeltaLog(main.SNAPSHOT_DIR, readonly=True)
+
+
+def sync(committed_seq: int, snapshot: Optional[str]):
+    """把索引同步到主进程已提交的 committed_seq（snapshot 为主进程的当前快照）"""
+    global _applied_seq, _snapshot
+    if _applied_seq is not None and snapshot == _snapshot:
+        if committed_seq <= _applied_seq:
+            return
+        first = next(main.delta_log.entries(_applied_seq, committed_seq), None)
+        if first is not None and first["seq"] == _applied_seq + 1:
+            main.replay_changes(_applied_seq, committed_seq)
+            _applied_seq = committed_seq
+            return
+        # 中间的变更已随新快照从日志中截断
+
+    if not main.restore_from_snapshot(committed_seq):
+        raise RuntimeError("No index snapshot to attach")
+    _applied_seq = max(committed_seq, read_manifest(main.snapshot_path)["delta_seq"])
+    _snapshot = snapshot
+
+
+def search(mode: str, query: "main.SearchQuery", committed_seq: int, snapshot: Optional[str]) -> List["main.Document"]:
+    sync(committed_seq, snapshot)
+    return main.SEARCH_MODES[mode](query)
+
+
+def search_groups(groups: List[Tuple], committed_seq: int, snapshot: Optional[str]) -> List[Tuple[List[List["main.Document"]], float]]:
+    sync(committed_seq, snapshot)
+    return main.search_groups(groups)
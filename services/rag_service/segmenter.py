@@ -0,0 +1,137 @@
+"""
+中文分词 - 基于领域词典的正向最大匹配
+
+索引与查询使用同一个分词器。文本分为连续的汉字、字母、数字三类片段（空白与标点是分隔）：
+- 汉字：trie 上从当前位置出发匹配最长的词典词；长词同时产生其中包含的较短词典词
+  （如"财务报表"同时产生"财务""报表"），查询较短的词也能命中。
+  词典没有覆盖的连续汉字视为一个未登录词：2~4 个字整体作为一个词项，更长的按 2 字切分；
+  单个字（的、了、和等）不作为词项。汉字词项不跨越片段边界；
+- 字母：整体作为一个词项（API、PostgreSQL）；
+- 数字：连同两侧紧邻的一个非空白字符按 2 字、3 字词组切分（"Q1"、"15%"、"(30"），
+  数字本身取值很多，带上单位、前缀才有区分度；截断的数字（"5000"中的"000"）仍可召回。
+
+词典为纯文本文件，每行一个词，# 开头为注释。词典变化后索引需要按新词典重建
+（快照记录词典指纹，不一致时启动会从数据库重建）。
+"""
+import hashlib
+import re
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+MIN_TERM_CHARS = 2
+# 未登录汉字串不超过该长度时整体作为一个词项，更长时按 OOV_NGRAM 字切分
+MAX_OOV_WORD_CHARS = 4
+OOV_NGRAM = 2
+# 数字片段（连同两侧各一个字符）切分的词组长度
+DIGIT_NGRAM_SIZES = (2, 3)
+# 切分规则变化时递增，计入指纹（旧规则建立的索引快照需要重建）
+SEGMENT_RULES_VERSION = 3
+# 片段：连续的字母、连续的数字、连续的其它文字（汉字等）；空白与标点是分隔
+_FRAGMENT = re.compile(r"[A-Za-z]+|\d+|[^\W\d_A-Za-z]+")
+_END = ""
+
+
+class Segmenter:
+    """不可变的分词器：词典在构造时编译为 trie"""
+
+    def __init__(self, words: Iterable[str] = ()):
+        self.words = sorted({word.strip() for word in words if len(word.strip()) >= MIN_TERM_CHARS})
+        self._trie: Dict = {}
+        for word in self.words:
+            node = self._trie
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[_END] = True
+        # 长词包含的较短词典词，构造时预先计算
+        self._subwords: Dict[str, Tuple[str, ...]] = {}
+        for word in self.words:
+            subwords = [
+                word[start:end] for start in range(len(word))
+                for end in self._match_ends(word, start) if end - start < len(word)
+            ]
+            if subwords:
+                self._subwords[word] = tuple(dict.fromkeys(subwords))
+        self.fingerprint = hashlib.sha1(
+            "\n".join([f"rules={SEGMENT_RULES_VERSION}"] + self.words).encode("utf-8")
+        ).hexdigest()
+
+    @classmethod
+    def load(cls, paths: Iterable[str]) -> "Segmenter":
+        """从词典文件加载（多个文件的词合并）"""
+        words: List[str] = []
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                words.extend(line.strip() for line in f if line.strip() and not line.lstrip().startswith("#"))
+        return cls(words)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def _match_ends(self, text: str, start: int) -> List[int]:
+        """从 start 出发能匹配到的全部词典词的结束位置（升序）"""
+        ends = []
+        node = self._trie
+        for i in range(start, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                break
+            if _END in node:
+                ends.append(i + 1)
+        return ends
+
+    def _segment_words(self, text: str) -> Iterator[str]:
+        """切分一段连续的汉字"""
+        unknown_start = None
+        i = 0
+        while i < len(text):
+            ends = self._match_ends(text, i)
+            if not ends:
+                if unknown_start is None:
+                    unknown_start = i
+                i += 1
+                continue
+            if unknown_start is not None:
+                yield from unknown_word(text[unknown_start:i])
+                unknown_start = None
+            word = text[i:ends[-1]]
+            yield word
+            yield from self._subwords.get(word, ())
+            i = ends[-1]
+        if unknown_start is not None:
+            yield from unknown_word(text[unknown_start:])
+
+    def tokenize(self, text: str) -> Iterator[str]:
+        """切分为词项（按出现顺序，可能重复）"""
+        for match in _FRAGMENT.finditer(text):
+            fragment = match.group()
+            if fragment.isdigit():
+                # 向两侧紧邻的字符（汉字、字母或标点）各延伸一个字
+                start, end = match.span()
+                start -= start > 0 and not text[start - 1].isspace()
+                end += end < len(text) and not text[end].isspace()
+                yield from ngrams(text[start:end], DIGIT_NGRAM_SIZES)
+            elif fragment.isascii():
+                if len(fragment) >= MIN_TERM_CHARS:
+                    yield fragment
+            else:
+                yield from self._segment_words(fragment)
+
+    def keywords(self, text: str) -> Set[str]:
+        """提取查询关键词：完整查询 + 切分得到的词项"""
+        keywords = set(self.tokenize(text))
+        keywords.add(text.strip())
+        return keywords
+
+
+def unknown_word(text: str) -> Iterator[str]:
+    """词典未覆盖的连续汉字：较短时整体作为一个词项，较长时切分为词组"""
+    if len(text) <= MAX_OOV_WORD_CHARS:
+        if len(text) >= MIN_TERM_CHARS:
+            yield text
+    else:
+        yield from ngrams(text, (OOV_NGRAM,))
+
+
+def ngrams(text: str, sizes: Tuple[int, ...]) -> Iterator[str]:
+    for n in sizes:
+        for i in range(len(text) - n + 1):
+            yield text[i:i + n]
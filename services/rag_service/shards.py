@@ -0,0 +1,120 @@
+"""
+分类分片 - 每个分类一个倒排索引分片
+
+带分类过滤的检索只访问该分类分片的 posting list，而不必在全局 posting 中逐个过滤。
+常用分类的分片常驻内存；其余分类在第一次被查询时从数据库按需构建，
+常驻分片数超过上限时淘汰最久未使用的分片。
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from inverted_index import InvertedIndex
+
+
+class CategoryShards:
+    """按分类划分的倒排索引分片（LRU 常驻）"""
+
+    def __init__(self, loader: Callable[[str], InvertedIndex], max_resident: int = 8):
+        """
+        loader(category) 从数据源构建分类分片。构建在锁外进行，不阻塞文档写入；
+        构建期间该分类的写入记录下来，登记分片前补上，因此不会漏掉并发写入。
+        """
+        self._loader = loader
+        self.max_resident = max_resident
+        self._lock = threading.RLock()
+        self._shards: "OrderedDict[str, InvertedIndex]" = OrderedDict()
+        # 正在构建的分类 -> 各构建者记录的写入 [(doc_id, doc)]，doc 为 None 表示删除
+        self._building: Dict[str, List[List[Tuple[str, Optional[tuple]]]]] = {}
+        # clear() 时递增，之前开始的构建不再登记
+        self._epoch = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def __contains__(self, category: str) -> bool:
+        return category in self._shards
+
+    def get(self, category: str) -> InvertedIndex:
+        """获取分类分片，不在内存中时按需构建"""
+        with self._lock:
+            shard = self._shards.get(category)
+            if shard is not None:
+                self._shards.move_to_end(category)
+                return shard
+            writes: List[Tuple[str, Optional[tuple]]] = []
+            self._building.setdefault(category, []).append(writes)
+            epoch = self._epoch
+
+        try:
+            shard = self._loader(category)
+        except BaseException:
+            with self._lock:
+                self._unregister(category, writes)
+            raise
+
+        with self._lock:
+            self._unregister(category, writes)
+            existing = self._shards.get(category)
+            if existing is not None:
+                # 其它线程已先登记了同一分类
+                self._shards.move_to_end(category)
+                return existing
+            for doc_id, doc in writes:
+                if doc is None:
+                    shard.remove(doc_id)
+                else:
+                    shard.add(*doc)
+            if epoch != self._epoch:
+                # 构建期间分片被清空（索引已切换到新一代），本次结果只用于当前检索
+                return shard
+            self._shards[category] = shard
+            self.loads += 1
+            while len(self._shards) > self.max_resident:
+                self._shards.popitem(last=False)
+                self.evictions += 1
+        return shard
+
+    def _unregister(self, category: str, writes: list):
+        builders = [other for other in self._building.get(category, []) if other is not writes]
+        if builders:
+            self._building[category] = builders
+        else:
+            self._building.pop(category, None)
+
+    def add_batch(self, docs: Iterable[Tuple[str, str, str, Sequence[str], str, str]]):
+        """同步 (doc_id, title, content, tags, category, source) 到常驻分片及正在构建的分片（调用方持有写锁）"""
+        docs = list(docs)
+        with self._lock:
+            for category, shard in self._shards.items():
+                for doc in docs:
+                    if doc[4] == category:
+                        shard.add(*doc)
+                    else:
+                        # 文档可能从该分类改到了其它分类
+                        shard.remove(doc[0])
+            for category, builders in self._building.items():
+                for writes in builders:
+                    writes.extend((doc[0], doc if doc[4] == category else None) for doc in docs)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            for shard in self._shards.values():
+                shard.remove(doc_id)
+            for builders in self._building.values():
+                for writes in builders:
+                    writes.append((doc_id, None))
+
+    def clear(self):
+        """清空全部分片（之后按需重新构建）"""
+        with self._lock:
+            self._shards.clear()
+            self._epoch += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "resident": {category: len(shard) for category, shard in self._shards.items()},
+                "max_resident": self.max_resident,
+                "loads": self.loads,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,156 @@
+"""
+索引快照 - 倒排索引与向量索引落盘，启动时 mmap 加载
+
+目录结构:
+    index_snapshot/
+        CURRENT              当前快照目录名（原子替换）
+        delta.log            快照之后的文档变更（NDJSON，每行 {"seq", "op", "id"}）
+        v2-<seq>-<时间戳>/   快照目录：manifest.json + 各 .npy 数组（倒排基础段、filter_* 过滤位图、向量矩阵）
+
+目录名前缀为格式版本 SNAPSHOT_FORMAT（v2 在 v1 基础上增加了过滤位图）；CURRENT 指向旧格式快照时不加载，
+由启动时重建索引并生成新格式快照，旧格式目录随旧快照一起清理。
+快照记录生成时的 delta_seq；启动时加载快照后，只需重放 delta.log 中 seq 更大的变更。
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+SNAPSHOT_FORMAT = 2
+CURRENT_FILE = "CURRENT"
+DELTA_FILE = "delta.log"
+MANIFEST_FILE = "manifest.json"
+
+
+def write_snapshot(root: str, delta_seq: int, writer, manifest: Dict) -> str:
+    """
+    写入新快照并切换 CURRENT
+
+    writer(directory) 负责写入数组文件；全部写完后才替换 CURRENT，
+    中途失败不会影响正在使用的旧快照。返回新快照目录名。
+    """
+    os.makedirs(root, exist_ok=True)
+    name = f"v{SNAPSHOT_FORMAT}-{delta_seq}-{int(time.time() * 1000)}"
+    tmp_dir = os.path.join(root, f".{name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        writer(tmp_dir)
+        manifest = dict(manifest, format=SNAPSHOT_FORMAT, delta_seq=delta_seq, created_at=time.time())
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_dir, os.path.join(root, name))
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    current_tmp = os.path.join(root, f"{CURRENT_FILE}.tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, os.path.join(root, CURRENT_FILE))
+    remove_stale_snapshots(root, keep=name)
+    return name
+
+
+def is_snapshot_dir(name: str) -> bool:
+    """任意格式版本的快照目录名 v<格式>-<seq>-<时间戳>"""
+    version, sep, _ = name.partition("-")
+    return bool(sep) and version[:1] == "v" and version[1:].isdigit()
+
+
+def remove_stale_snapshots(root: str, keep: str):
+    """删除旧快照目录，包括旧格式版本的快照（已 mmap 的进程仍持有文件句柄，删除不影响其读取）"""
+    for entry in os.listdir(root):
+        if entry != keep and (is_snapshot_dir(entry) or entry.endswith(".tmp")):
+            path = os.path.join(root, entry)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+
+def current_snapshot(root: str) -> Optional[str]:
+    """返回当前快照目录路径，不存在或格式不兼容时返回 None"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    directory = os.path.join(root, name)
+    manifest = read_manifest(directory)
+    if manifest is None or manifest.get("format") != SNAPSHOT_FORMAT:
+        return None
+    return directory
+
+
+def read_manifest(directory: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class DeltaLog:
+    """追加写的文档变更日志，seq 单调递增（readonly 时只读取，供检索 worker 进程使用）"""
+
+    def __init__(self, root: str, readonly: bool = False):
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, DELTA_FILE)
+        self._lock = threading.Lock()
+        self.seq = 0
+        self.pending = 0
+        for entry in self.entries():
+            self.seq = entry["seq"]
+            self.pending += 1
+        self._file = None if readonly else open(self.path, "a", encoding="utf-8")
+
+    def append(self, op: str, doc_ids: Optional[List[str]] = None) -> int:
+        """记录变更（op: upsert / delete / clear，clear 不带文档 id），返回最后一条的 seq"""
+        with self._lock:
+            lines = []
+            for doc_id in (doc_ids if doc_ids is not None else [None]):
+                self.seq += 1
+                lines.append(json.dumps({"seq": self.seq, "op": op, "id": doc_id}, ensure_ascii=False))
+            if lines:
+                self._file.write("\n".join(lines) + "\n")
+                self._file.flush()
+                self.pending += len(lines)
+            return self.seq
+
+    def entries(self, after_seq: int = 0, upto_seq: Optional[int] = None) -> Iterator[Dict]:
+        """遍历 seq 在 (after_seq, upto_seq] 内的变更（忽略崩溃时写了一半的最后一行）"""
+        try:
+            f = open(self.path, encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if upto_seq is not None and entry["seq"] > upto_seq:
+                    return
+                if entry["seq"] > after_seq:
+                    yield entry
+
+    def truncate(self, upto_seq: int):
+        """快照写入后，丢弃 seq <= upto_seq 的变更"""
+        with self._lock:
+            remaining = list(self.entries(upto_seq))
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in remaining:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+            self.pending = len(remaining)
+
+    def advance(self, seq: int):
+        """日志被截断后重启时，seq 需从快照记录的位置继续递增"""
+        with self._lock:
+            self.seq = max(self.seq, seq)
@@ -0,0 +1,84 @@
+"""
+查询相关片段 - 从命中文档的内容中截取与查询最相关的窗口
+
+只对最终返回的 top_k 文档计算：查询切分出的词项（与倒排索引相同的分词器）编译为一个多模式匹配器，
+每个文档的内容只扫描一遍；以覆盖不同词项最多的窗口作为片段，偏移量为片段在 content 中的字符下标 [start, end)。
+"""
+from collections import Counter
+from typing import List, Tuple
+
+from matcher import KeywordMatcher
+from segmenter import Segmenter
+
+SNIPPET_WINDOW_CHARS = 200  # 单个片段的最大长度
+MAX_SNIPPETS = 3  # 每个文档最多返回的片段数
+
+
+def query_matcher(query: str, segmenter: Segmenter) -> KeywordMatcher:
+    """查询词项的匹配器，同一查询的各结果文档共用"""
+    return KeywordMatcher(segmenter.tokenize(query))
+
+
+def _best_window(occurrences: List[Tuple[int, int, str]], width: int,
+                 taken: List[Tuple[int, int]]) -> Tuple[int, int, int]:
+    """
+    滑动窗口：以每个出现位置为窗口起点，统计窗口内完整包含的不同词项（按长度加权）
+
+    返回 (得分, 匹配起点, 匹配终点)，与已选窗口重叠的候选跳过。
+    """
+    best = (0, 0, 0)
+    terms: Counter = Counter()
+    score = 0
+    right = 0
+    for left, (start, _, _) in enumerate(occurrences):
+        while right < len(occurrences) and occurrences[right][1] <= start + width:
+            term = occurrences[right][2]
+            if terms[term] == 0:
+                score += len(term)
+            terms[term] += 1
+            right += 1
+        span_end = occurrences[right - 1][1] if right > left else start
+        if score > best[0] and not any(start < t_end and t_start < start + width for t_start, t_end in taken):
+            best = (score, start, span_end)
+        if right > left:
+            term = occurrences[left][2]
+            terms[term] -= 1
+            if terms[term] == 0:
+                score -= len(term)
+    return best
+
+
+def extract_snippets(content: str, matcher: KeywordMatcher, max_chars: int) -> List[Tuple[int, int]]:
+    """
+    在 max_chars 预算内截取最相关的片段，返回按位置排序的 [(start, end)]
+
+    内容不超过预算时返回全文；没有任何词项命中时返回开头部分。
+    """
+    if max_chars <= 0 or not content:
+        return []
+    if len(content) <= max_chars:
+        return [(0, len(content))]
+    width = min(max_chars, SNIPPET_WINDOW_CHARS)
+    count = min(MAX_SNIPPETS, max_chars // width)
+    occurrences = matcher.find_all(content)
+
+    windows: List[Tuple[int, int]] = []
+    for _ in range(count):
+        score, match_start, match_end = _best_window(occurrences, width, windows)
+        if score == 0:
+            break
+        # 匹配部分居中
+        start = max(0, match_start - (width - (match_end - match_start)) // 2)
+        start = min(start, len(content) - width)
+        windows.append((start, start + width))
+    if not windows:
+        return [(0, width)]
+    windows.sort()
+    # 合并相邻或重叠的窗口
+    merged = [windows[0]]
+    for start, end in windows[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
@@ -0,0 +1,86 @@
+"""
+索引持久化辅助 - 可 mmap 的数组与字符串表
+"""
+import os
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+
+def save_array(directory: str, name: str, array: np.ndarray):
+    np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+
+
+def load_array(directory: str, name: str, mmap_mode: Optional[str] = "r") -> np.ndarray:
+    """
+    加载数组，默认以只读方式 mmap，多个进程共享同一份页缓存
+
+    mmap_mode="c" 为写时复制（修改只影响当前进程），None 表示完整读入内存。
+    """
+    path = os.path.join(directory, f"{name}.npy")
+    if mmap_mode:
+        try:
+            return np.load(path, mmap_mode=mmap_mode, allow_pickle=False)
+        except ValueError:
+            # 空数组无法 mmap
+            pass
+    return np.load(path, allow_pickle=False)
+
+
+class StringTable:
+    """字符串表：UTF-8 字节拼接成一个 uint8 数组，另存偏移数组，支持 mmap"""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]) -> "StringTable":
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(data, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def raw(self, i: int) -> bytes:
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def __getitem__(self, i: int) -> str:
+        return self.raw(i).decode("utf-8")
+
+    def tolist(self) -> List[str]:
+        data = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(self))]
+
+    def find(self, s: str, order: Optional[np.ndarray] = None) -> Optional[int]:
+        """
+        二分查找字符串的下标
+
+        表本身按 UTF-8 字节序排列时 order 为 None；否则 order 为按字节序排列的下标排列。
+        """
+        key = s.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = int(order[mid]) if order is not None else mid
+            if self.raw(i) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(self):
+            return None
+        i = int(order[lo]) if order is not None else lo
+        return i if self.raw(i) == key else None
+
+    def save(self, directory: str, name: str):
+        save_array(directory, f"{name}.data", self.data)
+        save_array(directory, f"{name}.offsets", self.offsets)
+
+    @classmethod
+    def load(cls, directory: str, name: str, mmap_mode: Optional[str] = "r") -> "StringTable":
+        return cls(load_array(directory, f"{name}.data", mmap_mode), load_array(directory, f"{name}.offsets", mmap_mode))
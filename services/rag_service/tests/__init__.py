@@ -0,0 +1,46 @@
+"""
+rag_service 单元测试
+
+运行：cd services/rag_service && python -m pytest tests/（或 python -m unittest discover tests/ -v）
+测试使用临时目录下的数据库与索引快照，不影响 /app/data。
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+os.environ.setdefault("RAG_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="rag_test_"), "vector_store.db"))
+os.environ.setdefault("RAG_SEARCH_PROCESSES", "0")
+
+_client = None
+
+
+def service_client():
+    """
+    启动服务并返回客户端（整个测试进程共用）
+
+    直接执行启动事件而不进入 TestClient 上下文：退出上下文会执行关闭事件停止线程池，服务不能再次启动。
+    """
+    global _client
+    if _client is None:
+        import main
+        from fastapi.testclient import TestClient
+        asyncio.run(main.startup_event())
+        _client = TestClient(main.app)
+    return _client
+
+
+def wait_for_jobs(timeout: float = 30):
+    """等待后台任务（快照、重建、向量生成等）结束"""
+    import main
+    jobs = [main.snapshot_job, main.rebuild_job, main.reembed_job, main.signature_job]
+    deadline = time.time() + timeout
+    while any(job.running for job in jobs):
+        if time.time() > deadline:
+            raise TimeoutError("background jobs still running")
+        time.sleep(0.05)
@@ -0,0 +1,88 @@
+import heapq
+import random
+import unittest
+
+import tests  # noqa: F401
+from bitmap import Bitmap
+from inverted_index import InvertedIndex
+from segmenter import Segmenter
+
+WORDS = ["销售", "政策", "员工", "年假", "报告", "预算", "客户", "系统", "安全", "培训", "流程", "数据"]
+
+
+def exhaustive_top_k(index: InvertedIndex, terms, top_k, subset=None, min_score=0.0, stats=None):
+    """对全部命中文档完整打分后取 top_k（与 search_bm25 相同的同分规则）"""
+    scores = index.bm25_scores(terms, subset, stats)
+    return heapq.nlargest(top_k, ((d, s) for d, s in scores.items() if s >= min_score),
+                          key=lambda item: (item[1], -item[0]))
+
+
+class MaxScoreTest(unittest.TestCase):
+    """MaxScore 剪枝的结果须与完整打分一致"""
+
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(19)
+        cls.segmenter = Segmenter(WORDS)
+        # 词频分布不均，部分词项很常见，剪枝才会生效
+        weights = [1.0 / (i + 1) for i in range(len(WORDS))]
+
+        def text(n):
+            return "，".join(rng.choices(WORDS, weights, k=n))
+
+        docs = [(f"doc_{i:04d}", text(rng.randint(1, 4)), text(rng.randint(3, 40)), rng.sample(WORDS, 2),
+                 rng.choice(["hr", "sales", "tech"]), "") for i in range(600)]
+        cls.docs = {doc[0]: doc for doc in docs}
+        cls.index = InvertedIndex(cls.segmenter)
+        cls.index.add_batch(docs[:400])
+        # 基础段 + 增量部分 + 删除
+        cls.index = InvertedIndex(cls.segmenter, cls.index.freeze())
+        cls.index.add_batch(docs[400:])
+        for doc in rng.sample(docs, 50):
+            cls.index.remove(doc[0])
+        cls.queries = [rng.sample(WORDS, rng.randint(1, 6)) for _ in range(60)]
+
+    def assert_same(self, actual, expected):
+        self.assertEqual([docno for docno, _ in actual], [docno for docno, _ in expected])
+        for (_, a), (_, b) in zip(actual, expected):
+            self.assertAlmostEqual(a, b, places=9)
+
+    def test_matches_exhaustive(self):
+        for terms in self.queries:
+            for top_k in (1, 5, 20):
+                with self.subTest(terms=terms, top_k=top_k):
+                    self.assert_same(self.index.search_bm25(terms, top_k),
+                                     exhaustive_top_k(self.index, terms, top_k))
+
+    def test_with_subset_and_min_score(self):
+        subset = self.index.select(("eq", "category", "hr"))
+        for terms in self.queries[:20]:
+            with self.subTest(terms=terms):
+                self.assert_same(self.index.search_bm25(terms, 10, subset),
+                                 exhaustive_top_k(self.index, terms, 10, subset))
+                self.assert_same(self.index.search_bm25(terms, 10, min_score=1.5),
+                                 exhaustive_top_k(self.index, terms, 10, min_score=1.5))
+        self.assertEqual(self.index.search_bm25(WORDS, 10, Bitmap()), [])
+
+    def test_batch_matches_single(self):
+        top_ks = [3, 10] * (len(self.queries) // 2)
+        batch = self.index.search_bm25_batch(self.queries, top_ks)
+        for terms, top_k, hits in zip(self.queries, top_ks, batch):
+            self.assert_same(hits, self.index.search_bm25(terms, top_k))
+
+    def test_shard_uses_global_stats(self):
+        # 分类分片按全局的入库顺序构建，使用全局索引的 idf 与平均字段长度
+        shard = InvertedIndex(self.segmenter)
+        for docno in self.index.select(("eq", "category", "sales")).to_array().tolist():
+            shard.add(*self.docs[self.index.doc_id(docno)])
+        for terms in self.queries[:20]:
+            with self.subTest(terms=terms):
+                expected = exhaustive_top_k(self.index, terms, 10, self.index.select(("eq", "category", "sales")))
+                actual = shard.search_bm25(terms, 10, stats=self.index)
+                self.assertEqual([shard.doc_id(d) for d, _ in actual], [self.index.doc_id(d) for d, _ in expected])
+                for (_, a), (_, b) in zip(actual, expected):
+                    self.assertAlmostEqual(a, b, places=9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+import tests  # noqa: F401
+from chunking import PassageSplitter
+
+
+def split(pieces, max_chars, overlap):
+    splitter = PassageSplitter(max_chars, overlap)
+    passages = []
+    for piece in pieces:
+        passages.extend(splitter.feed(piece))
+    return passages + splitter.flush()
+
+
+class PassageSplitterTest(unittest.TestCase):
+    TEXT = "第一句话。第二句稍长一些！第三句？Fourth sentence.\n第五句在这里。最后一句没有结束符"
+
+    def test_sentence_boundaries_and_overlap(self):
+        text = "第一句话。第二句稍长一些！第三句？"
+        self.assertEqual(split([text], max_chars=14, overlap=8),
+                         ["第一句话。第二句稍长一些！", "第二句稍长一些！第三句？"])
+        # 末尾句子超过 overlap 时不重叠
+        self.assertEqual(split([text], max_chars=14, overlap=5),
+                         ["第一句话。第二句稍长一些！", "第三句？"])
+        # 重叠部分加新句子超长时丢弃重叠
+        self.assertEqual(split(["一二三四五。六七八九十一二。"], max_chars=10, overlap=6),
+                         ["一二三四五。", "六七八九十一二。"])
+
+    def test_limits(self):
+        for max_chars, overlap in [(12, 6), (20, 0), (30, 10), (500, 100)]:
+            with self.subTest(max_chars=max_chars, overlap=overlap):
+                passages = split([self.TEXT], max_chars, overlap)
+                self.assertTrue(all(0 < len(p) <= max_chars for p in passages))
+                # 每个句子都出现在某个段落中
+                for sentence in ["第一句话。", "第二句", "最后一句没有结束符"]:
+                    self.assertTrue(any(sentence in p for p in passages))
+
+    def test_no_overlap_covers_text_once(self):
+        text = self.TEXT.replace("\n", "")
+        passages = split([text], max_chars=20, overlap=0)
+        self.assertEqual("".join(passages), text)
+
+    def test_incremental_feed_matches_whole_text(self):
+        whole = split([self.TEXT], 15, 5)
+        for size in [1, 2, 3, 7]:
+            pieces = [self.TEXT[i:i + size] for i in range(0, len(self.TEXT), size)]
+            with self.subTest(size=size):
+                self.assertEqual(split(pieces, 15, 5), whole)
+
+    def test_long_run_without_boundary(self):
+        passages = split(["字" * 25], max_chars=10, overlap=0)
+        self.assertEqual(passages, ["字" * 10, "字" * 10, "字" * 5])
+
+    def test_short_and_empty(self):
+        self.assertEqual(split(["短文本"], 500, 100), ["短文本"])
+        self.assertEqual(split(["", "  \n"], 500, 100), [])
+
+    def test_invalid_arguments(self):
+        for max_chars, overlap in [(0, 0), (10, 10), (10, -1)]:
+            with self.assertRaises(ValueError):
+                PassageSplitter(max_chars, overlap)
+
+
+if __name__ == "__main__":
+    unittest.main()
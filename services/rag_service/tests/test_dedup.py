@@ -0,0 +1,118 @@
+import random
+import unittest
+
+from tests import service_client, wait_for_jobs
+from dedup import LSHIndex, MinHasher, similarity
+
+_CHARS = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可也你说年生产经营管理"
+
+
+def random_text(seed: int, length: int = 400) -> str:
+    rng = random.Random(seed)
+    return "".join(rng.choice(_CHARS) for _ in range(length))
+
+
+BASE_TEXT = random_text(18)
+
+
+def edited(text: str, count: int, seed: int) -> str:
+    """替换 count 个字符"""
+    rng = random.Random(seed)
+    chars = list(text)
+    for i in rng.sample(range(len(chars)), count):
+        chars[i] = "Ω"
+    return "".join(chars)
+
+
+class MinHashLSHTest(unittest.TestCase):
+    def setUp(self):
+        self.hasher = MinHasher()
+
+    def test_similarity_estimate(self):
+        base = self.hasher.signature(BASE_TEXT)
+        self.assertEqual(similarity(base, self.hasher.signature(BASE_TEXT)), 1.0)
+        # 空白不影响签名
+        self.assertEqual(similarity(base, self.hasher.signature(" \n".join(BASE_TEXT[i:i + 50] for i in range(0, 400, 50)))), 1.0)
+        self.assertGreater(similarity(base, self.hasher.signature(edited(BASE_TEXT, 3, 1))), 0.8)
+        self.assertLess(similarity(base, self.hasher.signature(BASE_TEXT[::-1])), 0.3)
+        self.assertEqual(similarity(base, self.hasher.signature("")), 0.0)
+
+    def test_lsh_query_and_clusters(self):
+        index = LSHIndex()
+        for doc_id, text in [("a", BASE_TEXT), ("b", edited(BASE_TEXT, 2, 2)), ("c", edited(BASE_TEXT, 2, 3)),
+                             ("x", BASE_TEXT[::-1]), ("y", "完全无关的另一篇文档内容" * 10)]:
+            index.add(doc_id, self.hasher.signature(text))
+        matches = index.query(self.hasher.signature(BASE_TEXT), 0.8, exclude="a")
+        self.assertEqual(sorted(doc_id for doc_id, _ in matches), ["b", "c"])
+        self.assertEqual(matches, sorted(matches, key=lambda m: (-m[1], m[0])))
+        self.assertEqual(index.clusters(0.8), [["a", "b", "c"]])
+        index.remove("b")
+        self.assertNotIn("b", index)
+        self.assertEqual(index.clusters(0.8), [["a", "c"]])
+
+
+class DedupPolicyTest(unittest.TestCase):
+    """写入时的近重复处理策略（keep / reject / merge）"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = service_client()
+        wait_for_jobs()
+        response = cls.client.post("/api/rag/documents", json={
+            "id": "dedup_original", "title": "去重测试原文", "content": BASE_TEXT, "category": "test", "tags": ["原文"]
+        })
+        assert response.status_code == 200, response.text
+
+    def add(self, doc_id: str, dedup: str, tags=("副本",), seed: int = 0):
+        return self.client.post(f"/api/rag/documents?dedup={dedup}", json={
+            "id": doc_id, "title": "去重测试原文", "content": edited(BASE_TEXT, 2, seed),
+            "category": "test", "tags": list(tags)
+        })
+
+    def exists(self, doc_id: str) -> bool:
+        ids = {doc["id"] for doc in self.client.get("/api/rag/documents?category=test").json()["documents"]}
+        return doc_id in ids
+
+    def test_keep(self):
+        response = self.add("dedup_keep", "keep", seed=11)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["duplicate"]["action"], "kept")
+        self.assertIn(response.json()["duplicate"]["duplicate_of"], ["dedup_original", "dedup_keep"])
+        self.assertTrue(self.exists("dedup_keep"))
+        self.client.delete("/api/rag/documents/dedup_keep")
+
+    def test_reject(self):
+        response = self.add("dedup_reject", "reject", seed=12)
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("dedup_original", response.json()["detail"])
+        self.assertFalse(self.exists("dedup_reject"))
+
+    def test_merge(self):
+        response = self.add("dedup_merge", "merge", tags=["合并标签"], seed=13)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], "dedup_original")
+        self.assertEqual(response.json()["duplicate"]["action"], "merged")
+        self.assertFalse(self.exists("dedup_merge"))
+        docs = {doc["id"]: doc for doc in self.client.get("/api/rag/documents?category=test").json()["documents"]}
+        self.assertEqual(docs["dedup_original"]["tags"], ["原文", "合并标签"])
+
+    def test_bulk_duplicates_within_batch(self):
+        other = random_text(99)
+        response = self.client.post("/api/rag/documents/bulk?dedup=reject", json=[
+            {"id": "dedup_bulk_1", "title": "批内文档", "content": other, "category": "test"},
+            {"id": "dedup_bulk_2", "title": "批内文档", "content": edited(other, 2, 5), "category": "test"},
+            {"id": "dedup_bulk_3", "title": "批内文档", "content": other[::-1], "category": "test"},
+        ])
+        self.assertEqual(response.status_code, 200, response.text)
+        body = response.json()
+        self.assertEqual([d["id"] for d in body["duplicates"]], ["dedup_bulk_2"])
+        self.assertEqual(body["duplicates"][0]["duplicate_of"], "dedup_bulk_1")
+        self.assertTrue(self.exists("dedup_bulk_1") and self.exists("dedup_bulk_3"))
+        self.assertFalse(self.exists("dedup_bulk_2"))
+
+    def test_unknown_policy(self):
+        self.assertEqual(self.add("dedup_bad", "drop").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import json
+import unittest
+import zlib
+
+from tests import service_client, wait_for_jobs
+
+
+class IdSequenceTest(unittest.TestCase):
+    def test_init_advances_id_sequence(self):
+        """初始化写入带显式 doc_NNN 的样本文档后，自动分配的 id 不会覆盖样本文档"""
+        import main
+        client = service_client()
+        wait_for_jobs()
+        # 与新建的数据库一样从 0 开始
+        conn = main.get_db_connection()
+        try:
+            conn.execute("UPDATE id_sequences SET value = 0 WHERE name = 'documents'")
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.assertEqual(client.post("/api/rag/init").status_code, 200)
+        sample_ids = {doc.id for doc in main.SAMPLE_DOCUMENTS}
+        new_ids = []
+        for i in range(3):
+            response = client.post("/api/rag/documents", json={
+                "title": f"初始化后新增的文档{i}", "content": f"编号分配回归测试 {i} " * 20, "category": "test"
+            })
+            self.assertEqual(response.status_code, 200, response.text)
+            new_ids.append(response.json()["id"])
+        self.assertFalse(sample_ids & set(new_ids))
+        self.assertEqual(len(set(new_ids)), 3)
+
+        ids = {doc["id"] for doc in client.get("/api/rag/documents?limit=1000").json()["documents"]}
+        self.assertTrue(sample_ids <= ids)
+        wait_for_jobs()
+
+
+class ContentCompressionTest(unittest.TestCase):
+    """正文压缩存储在 document_contents，各读取路径返回的内容与写入时逐字节一致"""
+
+    CONTENTS = {
+        "content_zip_1": "压缩往返测试：全角ＡＢＣ１２３、半角 abc 123，emoji 😀👍，组合字符 \u00e9 与 e\u0301。\r\n第二行\t制表符  ",
+        "content_zip_2": "压缩往返测试长文。" + "重复的段落内容，用于验证大文本压缩。" * 500 + "\n结尾\u3000",
+        "content_zip_3": "  压缩往返测试\x00控制字符\x1f与零宽\u200b字符\n\n",
+    }
+
+    def setUp(self):
+        self.client = service_client()
+        wait_for_jobs()
+
+    def test_content_round_trip(self):
+        import main
+        response = self.client.post("/api/rag/documents/bulk", json=[
+            {"id": doc_id, "title": f"压缩往返{doc_id}", "content": content, "category": "compress_test"}
+            for doc_id, content in self.CONTENTS.items()
+        ])
+        self.assertEqual(response.status_code, 200, response.text)
+
+        # 数据库中只保存压缩后的正文
+        conn = main.get_db_connection()
+        try:
+            for doc_id, content in self.CONTENTS.items():
+                row = conn.execute("SELECT content FROM documents WHERE id = ?", (doc_id,)).fetchone()
+                self.assertEqual(row["content"], "")
+                data = conn.execute("SELECT data FROM document_contents WHERE id = ?", (doc_id,)).fetchone()["data"]
+                self.assertEqual(zlib.decompress(data), content.encode("utf-8"))
+        finally:
+            conn.close()
+
+        listed = self.client.get("/api/rag/documents?fields=id,content&category=compress_test").json()["documents"]
+        self.assertEqual({doc["id"]: doc["content"] for doc in listed}, self.CONTENTS)
+
+        exported = [json.loads(line) for line in
+                    self.client.get("/api/rag/documents/export?category=compress_test").text.splitlines()]
+        self.assertEqual({doc["id"]: doc["content"] for doc in exported}, self.CONTENTS)
+
+        modes = ["keyword", "bm25", "vector"] + (["fts"] if main.FTS_ENABLED else [])
+        for mode in modes:
+            with self.subTest(mode=mode):
+                response = self.client.post("/api/rag/search", json={
+                    "query": "压缩往返测试", "mode": mode, "category": "compress_test", "top_k": 10
+                })
+                found = {doc["id"]: doc["content"] for doc in response.json()["documents"]}
+                self.assertTrue(found)
+                for doc_id, content in found.items():
+                    self.assertEqual(content.encode("utf-8"), self.CONTENTS[doc_id].encode("utf-8"))
+
+        for doc_id in self.CONTENTS:
+            self.assertEqual(self.client.delete(f"/api/rag/documents/{doc_id}").status_code, 200)
+        wait_for_jobs()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import json
+import random
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+
+import tests  # noqa: F401
+from bitmap import ARRAY_MAX_SIZE, Bitmap
+from filters import FilterIndex, FilterSyntaxError, document_values, filter_sql, parse_filter
+
+
+class BitmapTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        # 跨多个容器：稀疏的数组容器与稠密的位图容器
+        self.a = set(rng.sample(range(200000), 3000)) | set(range(70000, 70000 + ARRAY_MAX_SIZE + 100))
+        self.b = set(rng.sample(range(200000), 5000)) | set(range(72000, 80000))
+
+    def test_set_operations(self):
+        a, b = Bitmap.from_array(sorted(self.a)), Bitmap.from_array(sorted(self.b))
+        self.assertEqual(len(a), len(self.a))
+        self.assertEqual(a.to_array().tolist(), sorted(self.a))
+        self.assertEqual((a & b).to_array().tolist(), sorted(self.a & self.b))
+        self.assertEqual((a | b).to_array().tolist(), sorted(self.a | self.b))
+        self.assertEqual((a - b).to_array().tolist(), sorted(self.a - self.b))
+        probe = np.arange(0, 200000, 7)
+        self.assertEqual(a.contains_many(probe).tolist(), [int(v) in self.a for v in probe])
+
+    def test_add_discard(self):
+        bitmap = Bitmap()
+        values = list(range(0, 3 * ARRAY_MAX_SIZE, 2)) + [65536 * 3 + 1]
+        for value in values:
+            bitmap.add(value)
+        self.assertEqual(bitmap.to_array().tolist(), values)
+        for value in values[::2]:
+            bitmap.discard(value)
+        self.assertEqual(bitmap.to_array().tolist(), values[1::2])
+        self.assertIn(values[1], bitmap)
+        self.assertNotIn(values[0], bitmap)
+        for value in values[1::2]:
+            bitmap.discard(value)
+        self.assertFalse(bitmap)
+
+    def test_operands_unchanged(self):
+        a, b = Bitmap.from_array(sorted(self.a)), Bitmap.from_array(sorted(self.b))
+        c = a | b
+        c.add(199999)
+        c.discard(min(self.a))
+        self.assertEqual(a.to_array().tolist(), sorted(self.a))
+        self.assertEqual(b.to_array().tolist(), sorted(self.b))
+
+
+class FilterParserTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_filter("category = hr"), ("eq", "category", "hr"))
+        self.assertEqual(parse_filter("source != 'erp system'"), ("not", ("eq", "source", "erp system")))
+        self.assertEqual(
+            parse_filter("Category = hr AND (tag IN (政策, 待遇, 政策) OR NOT source = crm)"),
+            ("and", (("eq", "category", "hr"),
+                     ("or", (("in", "tag", ("政策", "待遇")), ("not", ("eq", "source", "crm")))))))
+        self.assertEqual(parse_filter("tag NOT IN ('it''s', \"a b\")"), ("not", ("in", "tag", ("it's", "a b"))))
+        # AND 优先于 OR
+        self.assertEqual(parse_filter("tag = a OR tag = b AND tag = c")[0], "or")
+
+    def test_syntax_errors(self):
+        for text in ["", "   ", "category", "category =", "title = x", "tag IN 政策", "tag IN (a, b",
+                     "(category = hr", "category = hr)", "category = hr AND", "category = hr hr",
+                     "tag = 'unterminated", "category == hr", "NOT"]:
+            with self.subTest(text=text):
+                with self.assertRaises(FilterSyntaxError):
+                    parse_filter(text)
+        with self.assertRaises(FilterSyntaxError):
+            parse_filter("tag IN (" + ", ".join(str(i) for i in range(100)) + ")")
+
+
+class FilterIndexTest(unittest.TestCase):
+    DOCS = [
+        ("hr", "hr_system", ["政策", "年假"]),
+        ("hr", "wiki", ["待遇"]),
+        ("sales", "erp", ["报告", "Q1"]),
+        ("sales", "crm", []),
+        ("tech", "wiki", ["政策"]),
+    ]
+    EXPRESSIONS = [
+        "category = hr",
+        "source = wiki AND tag = 政策",
+        "tag IN (政策, 待遇)",
+        "NOT category = sales",
+        "category = sales AND NOT tag = Q1",
+        "tag NOT IN (政策) OR source = wiki",
+        "category != tech AND source != crm",
+    ]
+
+    def build(self) -> FilterIndex:
+        index = FilterIndex()
+        for docno, (category, source, tags) in enumerate(self.DOCS):
+            index.add(docno, document_values(category, source, tags))
+        return index
+
+    def brute_force(self, text: str, docnos):
+        def match(node, doc):
+            category, source, tags = doc
+            op = node[0]
+            if op in ("eq", "in"):
+                values = {node[2]} if op == "eq" else set(node[2])
+                actual = set(tags) if node[1] == "tag" else {category if node[1] == "category" else source}
+                return bool(values & actual)
+            if op == "not":
+                return not match(node[1], doc)
+            results = [match(child, doc) for child in node[1]]
+            return all(results) if op == "and" else any(results)
+        node = parse_filter(text)
+        return [docno for docno in docnos if match(node, self.DOCS[docno])]
+
+    def test_evaluate(self):
+        index = self.build()
+        for text in self.EXPRESSIONS:
+            with self.subTest(text=text):
+                expected = self.brute_force(text, range(len(self.DOCS)))
+                self.assertEqual(index.evaluate(parse_filter(text)).to_array().tolist(), expected)
+
+    def test_remove_and_save_load(self):
+        index = self.build()
+        index.remove(0)
+        alive = range(1, len(self.DOCS))
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(directory)
+            loaded = FilterIndex.load(directory)
+            for text in self.EXPRESSIONS:
+                with self.subTest(text=text):
+                    expected = self.brute_force(text, alive)
+                    self.assertEqual(index.evaluate(parse_filter(text)).to_array().tolist(), expected)
+                    self.assertEqual(loaded.evaluate(parse_filter(text)).to_array().tolist(), expected)
+
+    def test_sql_matches_index(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE documents (id INTEGER, category TEXT, source TEXT, tags TEXT)")
+        conn.executemany("INSERT INTO documents VALUES (?, ?, ?, json(?))",
+                         [(docno, category, source, json.dumps(tags, ensure_ascii=False))
+                          for docno, (category, source, tags) in enumerate(self.DOCS)])
+        for text in self.EXPRESSIONS:
+            with self.subTest(text=text):
+                sql, params = filter_sql(parse_filter(text))
+                rows = conn.execute(f"SELECT id FROM documents d WHERE {sql} ORDER BY id", params).fetchall()
+                self.assertEqual([row[0] for row in rows], self.brute_force(text, range(len(self.DOCS))))
+
+
+if __name__ == "__main__":
+    unittest.main()
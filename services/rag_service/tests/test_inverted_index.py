@@ -0,0 +1,133 @@
+import tempfile
+import threading
+import unittest
+
+import tests  # noqa: F401
+from inverted_index import FrozenSegment, InvertedIndex
+from segmenter import Segmenter
+
+DOCS = [
+    ("doc_001", "Q1销售报告", "2024年Q1销售业绩：总销售额5000万元，同比增长15%。", ["销售", "报告"], "sales", "erp"),
+    ("doc_002", "员工福利政策", "员工享受年假、医疗保险和年度体检。", ["政策", "福利"], "hr", "hr_system"),
+    ("doc_003", "技术架构文档", "系统采用微服务架构，使用PostgreSQL存储。", ["技术"], "technical", "wiki"),
+    ("doc_004", "销售佣金政策", "销售人员佣金按季度结算。", ["销售", "政策"], "sales", "hr_system"),
+]
+
+
+def live_ids(index: InvertedIndex, term: str):
+    return sorted(index.doc_id(docno) for docno in index.postings(term))
+
+
+class InvertedIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.segmenter = Segmenter(["销售", "政策", "员工", "年假", "佣金", "架构"])
+
+    def build(self, docs=DOCS) -> InvertedIndex:
+        index = InvertedIndex(self.segmenter)
+        index.add_batch(docs)
+        return index
+
+    def check_lookups(self, index: InvertedIndex):
+        self.assertEqual(len(index), 4)
+        self.assertEqual(live_ids(index, "销售"), ["doc_001", "doc_004"])
+        self.assertEqual(live_ids(index, "政策"), ["doc_002", "doc_004"])
+        self.assertEqual(live_ids(index, "PostgreSQL"), ["doc_003"])
+        self.assertEqual(index.postings("不存在"), {})
+        docno = index.docno("doc_004")
+        self.assertEqual(index.doc_id(docno), "doc_004")
+        self.assertEqual(index.category(docno), "sales")
+        # (标题, 内容, 标签) 词频
+        self.assertEqual(index.postings("销售")[docno], (1, 1, 1))
+        self.assertEqual(index.document_frequency("销售"), 2)
+
+    def test_add_and_lookup(self):
+        self.check_lookups(self.build())
+
+    def test_remove_and_replace(self):
+        for frozen in (False, True):
+            with self.subTest(frozen=frozen):
+                index = self.build()
+                if frozen:
+                    index = InvertedIndex(self.segmenter, index.freeze())
+                self.assertTrue(index.remove("doc_004"))
+                self.assertFalse(index.remove("doc_004"))
+                self.assertNotIn("doc_004", index)
+                self.assertEqual(live_ids(index, "销售"), ["doc_001"])
+                # 替换：旧内容的词项不再指向该文档
+                index.add("doc_001", "市场报告", "品牌推广", [], "marketing")
+                self.assertEqual(live_ids(index, "销售"), [])
+                self.assertEqual(index.category(index.docno("doc_001")), "marketing")
+                self.assertEqual(len(index), 3)
+                self.assertEqual(index.select(("eq", "category", "sales")).to_array().tolist(), [])
+
+    def test_freeze_save_load(self):
+        index = self.build(DOCS[:2])
+        index = InvertedIndex(self.segmenter, index.freeze())
+        index.add_batch(DOCS[2:])
+        self.check_lookups(index)
+        with tempfile.TemporaryDirectory() as directory:
+            index.freeze().save(directory)
+            restored = InvertedIndex(self.segmenter, FrozenSegment.load(directory))
+            self.check_lookups(restored)
+            self.assertEqual(restored.average_field_lengths(), index.average_field_lengths())
+            self.assertEqual(
+                restored.select(("eq", "source", "hr_system")).to_array().tolist(),
+                sorted(restored.docno(doc_id) for doc_id in ["doc_002", "doc_004"])
+            )
+
+    def test_phrase_candidates(self):
+        index = self.build()
+        fields = {index.doc_id(docno): hit for docno, hit in index.phrase_candidates("销售").items()}
+        self.assertEqual(fields, {"doc_001": [True, True, True], "doc_004": [True, True, True]})
+        # 多词项短语：各词项都出现的文档（调用方再用原文校验）
+        candidates = index.phrase_candidates("佣金政策")
+        self.assertEqual([index.doc_id(docno) for docno in candidates], ["doc_004"])
+        self.assertEqual(index.phrase_candidates("年假佣金"), {})
+        self.assertEqual(index.phrase_candidates("的"), {})
+
+    def test_concurrent_writes_and_searches(self):
+        """检索与写入并发时读路径不出错，写入结束后结果与串行写入一致"""
+        for frozen in (False, True):
+            with self.subTest(frozen=frozen):
+                index = self.build()
+                if frozen:
+                    index = InvertedIndex(self.segmenter, index.freeze())
+                errors = []
+                done = threading.Event()
+
+                def write():
+                    try:
+                        for i in range(300):
+                            doc_id = f"new_{i % 40:03d}"
+                            if i % 3 == 2:
+                                index.remove(doc_id)
+                            else:
+                                index.add(doc_id, f"销售政策{i}", f"员工佣金与年假说明 {i}", ["销售"], "sales", "erp")
+                    except Exception as e:  # pragma: no cover - 失败时由断言报告
+                        errors.append(e)
+                    finally:
+                        done.set()
+
+                def search():
+                    try:
+                        while not done.is_set():
+                            for docno, _ in index.search_bm25(["销售", "政策", "佣金"], 5):
+                                index.doc_ids([docno])
+                            index.phrase_candidates("佣金政策")
+                            index.postings("销售")
+                            index.document_frequency("年假")
+                    except Exception as e:  # pragma: no cover
+                        errors.append(e)
+
+                threads = [threading.Thread(target=write)] + [threading.Thread(target=search) for _ in range(3)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(errors, [])
+                self.assertIn("doc_004", live_ids(index, "销售"))
+                self.assertEqual(index.document_frequency("销售"), len(index.postings("销售")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import os
+import unittest
+
+from tests import SERVICE_DIR
+from matcher import KeywordMatcher
+
+
+class KeywordMatcherTest(unittest.TestCase):
+    def test_overlapping_patterns(self):
+        matcher = KeywordMatcher(["年假", "年假政策", "政策", ""])
+        self.assertEqual(matcher.patterns, ["年假", "年假政策", "政策"])
+        self.assertEqual(matcher.matched("员工年假政策说明"), {"年假", "年假政策", "政策"})
+        self.assertEqual(matcher.matched("报销流程"), set())
+        self.assertEqual(matcher.find_all("年假政策"),
+                         [(0, 2, "年假"), (0, 4, "年假政策"), (2, 4, "政策")])
+
+    def test_web_ui_copy_in_sync(self):
+        """web_ui 镜像内使用同一份匹配器的副本，两处内容须一致"""
+        with open(os.path.join(SERVICE_DIR, "matcher.py"), "rb") as f:
+            original = f.read()
+        with open(os.path.join(SERVICE_DIR, "..", "web_ui", "matcher.py"), "rb") as f:
+            copy = f.read()
+        self.assertEqual(original, copy, "services/web_ui/matcher.py 与 services/rag_service/matcher.py 不一致")
+
+
+if __name__ == "__main__":
+    unittest.main()
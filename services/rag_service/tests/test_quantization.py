@@ -0,0 +1,113 @@
+import random
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from tests import service_client, wait_for_jobs
+from vector_store import HashingEmbedder, VectorIndex, quantize_int8
+
+# 召回下限：int8 直接打分与 float32 暴力检索的 recall@10，以及按 float32 重排候选后的 recall@10
+RECALL_FLOOR = 0.95
+RERANKED_RECALL_FLOOR = 0.99
+
+WORDS = ["销售", "客户", "合同", "报销", "审批", "预算", "库存", "采购", "招聘", "培训",
+         "服务器", "数据库", "接口", "部署", "监控", "季度", "增长", "市场", "产品", "风险"]
+
+
+def corpus(size: int, seed: int = 0):
+    rng = random.Random(seed)
+    return ["".join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))) for _ in range(size)]
+
+
+def recall(exact, hits, k):
+    return sum(len({d for d, _ in a[:k]} & {d for d, _ in b[:k]}) for a, b in zip(exact, hits)) / (k * len(exact))
+
+
+class QuantizeInt8Test(unittest.TestCase):
+    def test_round_trip_error(self):
+        vectors = np.random.default_rng(0).normal(size=(50, 64)).astype(np.float32)
+        vectors[:, :5] = 0
+        vectors[0, 5] = 1e-6  # 远小于缩放系数的非零分量
+        codes, scales = quantize_int8(vectors)
+        self.assertEqual(codes.dtype, np.int8)
+        error = np.abs(codes.astype(np.float32) * scales[:, None] - vectors)
+        # 四舍五入误差不超过半个缩放系数；强制量化为 ±1 的微小分量误差不超过一个缩放系数
+        rounded = np.abs(vectors) >= scales[:, None] / 2
+        self.assertTrue(np.all(error[rounded] <= np.broadcast_to(scales[:, None], error.shape)[rounded] * 0.5001))
+        self.assertTrue(np.all(error <= scales[:, None] * 1.0001))
+        # 非零分量不量化为 0，各维度文档频率不变
+        np.testing.assert_array_equal(codes != 0, vectors != 0)
+        codes, scales = quantize_int8(np.zeros((2, 4), dtype=np.float32))
+        self.assertFalse(codes.any())
+
+
+class QuantizedRecallTest(unittest.TestCase):
+    def test_recall_floor(self):
+        """int8 存储的 top-k 与 float32 相比不低于召回下限，内存约为 1/4"""
+        embedder = HashingEmbedder(256)
+        texts = corpus(1000)
+        ids = [f"q{i}" for i in range(len(texts))]
+        vectors = embedder.embed_batch(texts)
+        exact_index, quantized = VectorIndex(256), VectorIndex(256, quantization="int8")
+        for index in (exact_index, quantized):
+            index.add_batch(ids, vectors, ["test"] * len(ids))
+        self.assertLess(quantized.nbytes, exact_index.nbytes / 3)
+
+        queries = embedder.embed_batch(corpus(100, seed=1))
+        k = 10
+        exact = exact_index.search_batch(queries, k)
+        candidates = quantized.search_batch(queries, k * 4)
+        self.assertGreaterEqual(recall(exact, candidates, k), RECALL_FLOOR)
+
+        rows = dict(zip(ids, vectors))
+        reranked = [
+            sorted(((d, float(rows[d] @ exact_index.weight_query(query))) for d, _ in hits), key=lambda h: -h[1])
+            for query, hits in zip(queries, candidates)
+        ]
+        self.assertGreaterEqual(recall(exact, reranked, k), RERANKED_RECALL_FLOOR)
+
+
+class QuantizationReportTest(unittest.TestCase):
+    """量化召回报告接口：服务向量索引换成 int8 副本后，报告的召回不低于下限"""
+
+    def setUp(self):
+        self.client = service_client()
+        wait_for_jobs()
+
+    def test_report_recall_floor(self):
+        import main
+        texts = corpus(400, seed=2)
+        response = self.client.post("/api/rag/documents/bulk", json=[
+            {"id": f"quant_doc_{i}", "title": text[:12], "content": text, "category": "quant_test"}
+            for i, text in enumerate(texts)
+        ])
+        self.assertEqual(response.status_code, 200, response.text)
+        wait_for_jobs()
+
+        ids = main.vector_index.ids()
+        quantized = VectorIndex(main.VECTOR_DIM, quantization="int8")
+        quantized.add_batch(ids, main.vector_index.get_vectors(ids), ["quant_test"] * len(ids))
+        with mock.patch.object(main, "vector_index", quantized):
+            response = self.client.post("/api/rag/vectors/quantization/report", json={"sample": 100, "top_k": 10})
+            self.assertEqual(response.status_code, 200, response.text)
+            self.assertEqual(response.json()["quantization"], "int8")
+            deadline = time.time() + 30
+            while main.quantization_report_job.running and time.time() < deadline:
+                time.sleep(0.05)
+            report = self.client.get("/api/rag/vectors/status").json()["quantization"]["report"]
+
+        self.assertEqual(report["status"], "completed", report)
+        self.assertEqual(report["queries"], 100)
+        self.assertGreaterEqual(report["recall_at_k"], RECALL_FLOOR)
+        self.assertGreaterEqual(report["recall_at_k_reranked"], RERANKED_RECALL_FLOOR)
+        self.assertLess(report["memory_bytes"], report["float32_bytes"] / 3)
+
+        # 恢复样本文档
+        self.assertEqual(self.client.post("/api/rag/init").status_code, 200)
+        wait_for_jobs()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+from query_cache import QueryCache, normalize_query
+from tests import service_client, wait_for_jobs
+
+
+class QueryCacheTest(unittest.TestCase):
+    def test_generation_invalidates(self):
+        cache = QueryCache(max_size=4, ttl=60)
+        cache.put("q", ["a"], cache.generation)
+        self.assertEqual(cache.get("q"), ["a"])
+        cache.bump_generation()
+        self.assertIsNone(cache.get("q"))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+    def test_stale_result_not_stored(self):
+        """查询期间语料变化：查询开始时的版本号已过期，结果不写入缓存"""
+        cache = QueryCache(max_size=4, ttl=60)
+        generation = cache.generation
+        cache.bump_generation()
+        cache.put("q", ["old"], generation)
+        self.assertIsNone(cache.get("q"))
+
+    def test_lru_eviction(self):
+        cache = QueryCache(max_size=2, ttl=60)
+        for key in ("a", "b"):
+            cache.put(key, key, cache.generation)
+        cache.get("a")
+        cache.put("c", "c", cache.generation)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "a")
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query(" Ｑ１  销售　额 "), "Q1 销售 额")
+
+
+class QueryCacheServiceTest(unittest.TestCase):
+    """写入、删除文档后同一查询不再返回缓存中的旧结果"""
+
+    QUERY = {"query": "缓存失效回归", "mode": "keyword", "top_k": 5}
+
+    def setUp(self):
+        self.client = service_client()
+        wait_for_jobs()
+
+    def search_ids(self, **overrides):
+        response = self.client.post("/api/rag/search", json=dict(self.QUERY, **overrides))
+        self.assertEqual(response.status_code, 200, response.text)
+        return [doc["id"] for doc in response.json()["documents"]]
+
+    def test_write_invalidates_cache(self):
+        import main
+        self.assertEqual(self.search_ids(), [])
+        hits = main.query_cache.hits
+        self.assertEqual(self.search_ids(), [])
+        self.assertEqual(main.query_cache.hits, hits + 1)
+
+        response = self.client.post("/api/rag/documents", json={
+            "id": "cache_doc_1", "title": "缓存失效回归", "content": "缓存失效回归测试文档。" * 5, "category": "test"
+        })
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(self.search_ids(), ["cache_doc_1"])
+        # 全角、多余空白归一化后命中同一缓存项
+        hits = main.query_cache.hits
+        self.assertEqual(self.search_ids(query=" 缓存失效回归　"), ["cache_doc_1"])
+        self.assertEqual(main.query_cache.hits, hits + 1)
+
+        response = self.client.post("/api/rag/search/batch", json={"queries": [self.QUERY]})
+        self.assertEqual([doc["id"] for doc in response.json()["results"][0]["documents"]], ["cache_doc_1"])
+
+        self.assertEqual(self.client.delete("/api/rag/documents/cache_doc_1").status_code, 200)
+        self.assertEqual(self.search_ids(), [])
+        response = self.client.post("/api/rag/search/batch", json={"queries": [self.QUERY]})
+        self.assertEqual(response.json()["results"][0]["documents"], [])
+        wait_for_jobs()
+
+
+if __name__ == "__main__":
+    unittest.main()
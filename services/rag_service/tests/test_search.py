@@ -0,0 +1,55 @@
+import unittest
+
+from tests import service_client, wait_for_jobs
+
+
+class SearchValidationTest(unittest.TestCase):
+    def setUp(self):
+        self.client = service_client()
+        wait_for_jobs()
+
+    def test_top_k_must_be_positive(self):
+        import main
+        for top_k in (0, -1, main.SEARCH_MAX_TOP_K + 1):
+            with self.subTest(top_k=top_k):
+                response = self.client.post("/api/rag/search", json={"query": "销售", "top_k": top_k})
+                self.assertEqual(response.status_code, 422)
+                response = self.client.post("/api/rag/search/batch", json={"queries": [
+                    {"query": "销售"}, {"query": "政策", "top_k": top_k}
+                ]})
+                self.assertEqual(response.status_code, 422)
+        response = self.client.post("/api/rag/search", json={"query": "销售", "top_k": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(response.json()["total"], 1)
+
+    def test_blank_query_returns_nothing(self):
+        """空白查询在各模式下都不返回文档（fts 不退化为匹配全部文档的 LIKE '%%'）"""
+        import main
+        self.assertEqual(self.client.post("/api/rag/init").status_code, 200)
+        wait_for_jobs()
+        self.assertEqual(main.search_documents_fts("   \u3000", 5), [])
+        for mode in ("keyword", "bm25", "fts", "vector", "hybrid"):
+            with self.subTest(mode=mode):
+                response = self.client.post("/api/rag/search", json={"query": "  ", "mode": mode})
+                self.assertEqual(response.status_code, 200, response.text)
+                self.assertEqual(response.json()["documents"], [])
+        # 少于3个字的查询仍走 LIKE 子串匹配
+        response = self.client.post("/api/rag/search", json={"query": "销售", "mode": "fts"})
+        self.assertGreater(response.json()["total"], 0)
+
+    def test_hybrid_single_and_batch_agree(self):
+        """单个查询与批量查询的混合检索走同一条路径，结果一致"""
+        self.assertEqual(self.client.post("/api/rag/init").status_code, 200)
+        wait_for_jobs()
+        queries = [{"query": text, "mode": "hybrid", "top_k": 3} for text in ("Q1销售额", "年假几天", "系统架构")]
+        batch = self.client.post("/api/rag/search/batch", json={"queries": queries}).json()["results"]
+        for query, batch_result in zip(queries, batch):
+            with self.subTest(query=query["query"]):
+                # 批量请求已填充缓存，换一个 top_k 绕过缓存后取前 3 个比较
+                single = self.client.post("/api/rag/search", json=dict(query, top_k=4)).json()
+                self.assertEqual([doc["id"] for doc in single["documents"]][:3],
+                                 [doc["id"] for doc in batch_result["documents"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
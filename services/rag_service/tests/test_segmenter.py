@@ -0,0 +1,54 @@
+import unittest
+
+import tests  # noqa: F401
+from segmenter import Segmenter
+
+
+class SegmenterTest(unittest.TestCase):
+    def setUp(self):
+        self.segmenter = Segmenter(["销售", "销售额", "财务报表", "财务", "报表", "增长", "x"])
+
+    def terms(self, text):
+        return set(self.segmenter.tokenize(text))
+
+    def test_dictionary_words_and_subwords(self):
+        self.assertEqual(self.terms("财务报表"), {"财务报表", "财务", "报表"})
+        # 单字不入词典、不作为词项
+        self.assertNotIn("x", self.segmenter.words)
+        self.assertTrue(all(len(term) >= 2 for term in self.terms("销售额同比增长15%，x 年")))
+
+    def test_unknown_words(self):
+        # 词典未覆盖的 2~4 个字整体作为一个词项，单字丢弃，不产生跨越词典词的词组
+        self.assertEqual(self.terms("销售额同比增长"), {"销售额", "销售", "同比", "增长"})
+        self.assertEqual(self.terms("的销售额"), {"销售额", "销售"})
+        # 更长的未登录串按 2 字切分
+        self.assertEqual(self.terms("微服务架构方案"), {"微服", "服务", "务架", "架构", "构方", "方案"})
+        # 标点是分隔，不产生"额，"一类的词项
+        self.assertEqual(self.terms("销售额，增长"), {"销售额", "销售", "增长"})
+
+    def test_numbers_and_ascii(self):
+        terms = self.terms("总销售额5000万元，使用PostgreSQL")
+        self.assertTrue({"额5", "额50", "50", "500", "000", "00万", "0万", "PostgreSQL"} <= terms)
+        # 截断的数字仍能命中
+        self.assertTrue(self.terms("000万元") & terms)
+        self.assertEqual(self.terms("Q1"), {"Q1"})
+        self.assertEqual(self.terms("增长15%"), {"增长", "长1", "长15", "15", "15%", "5%"})
+        # 不跨空白，单个字母不作为词项
+        self.assertEqual(self.terms("a b"), set())
+        self.assertEqual(self.terms("1 2"), set())
+
+    def test_term_count_bounded(self):
+        """较长的问句只产生少量词项（原先的 2/3 字词组方式约为字数的 2 倍）"""
+        segmenter = Segmenter(["季度", "第一季度", "销售", "业绩", "完成", "年度", "销售目标", "目标", "怎么样", "没有"])
+        question = "第一季度的销售业绩怎么样，有没有完成年度的销售目标？"
+        terms = list(segmenter.tokenize(question))
+        self.assertLess(len(terms), len(question) // 2)
+        self.assertFalse({"的销", "度的", "样，"} & set(terms))
+
+    def test_fingerprint(self):
+        self.assertEqual(Segmenter(["销售", "财务"]).fingerprint, Segmenter(["财务", "销售", " 销售 "]).fingerprint)
+        self.assertNotEqual(Segmenter(["销售"]).fingerprint, Segmenter(["销售", "财务"]).fingerprint)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import threading
+import unittest
+
+import tests  # noqa: F401
+from inverted_index import InvertedIndex
+from segmenter import Segmenter
+from shards import CategoryShards
+
+
+def doc(doc_id: str, category: str, content: str = "年假政策"):
+    return (doc_id, doc_id, content, [], category, "")
+
+
+class CategoryShardsTest(unittest.TestCase):
+    def setUp(self):
+        self.segmenter = Segmenter(["年假", "政策"])
+        self.db = {"a": doc("a", "hr"), "b": doc("b", "hr"), "c": doc("c", "sales")}
+        self.loading = threading.Event()
+        self.release = threading.Event()
+        self.block = False
+
+    def loader(self, category: str) -> InvertedIndex:
+        shard = InvertedIndex(self.segmenter)
+        shard.add_batch(d for d in list(self.db.values()) if d[4] == category)
+        if self.block:
+            self.loading.set()
+            self.release.wait(5)
+        return shard
+
+    def write(self, shards: CategoryShards, *docs):
+        for d in docs:
+            self.db[d[0]] = d
+        shards.add_batch(docs)
+
+    def delete(self, shards: CategoryShards, doc_id: str):
+        del self.db[doc_id]
+        shards.remove(doc_id)
+
+    def test_lru(self):
+        shards = CategoryShards(self.loader, max_resident=1)
+        self.assertEqual(len(shards.get("hr")), 2)
+        self.assertIs(shards.get("hr"), shards.get("hr"))
+        self.assertEqual(len(shards.get("sales")), 1)
+        self.assertNotIn("hr", shards)
+        self.assertEqual(shards.stats()["loads"], 2)
+        self.assertEqual(shards.stats()["evictions"], 1)
+
+    def test_resident_shards_follow_writes(self):
+        shards = CategoryShards(self.loader)
+        hr = shards.get("hr")
+        self.write(shards, doc("d", "hr"), doc("a", "sales"))
+        self.delete(shards, "b")
+        self.assertEqual(sorted(d for d in ["a", "b", "c", "d"] if d in hr), ["d"])
+
+    def test_writes_during_build_not_lost(self):
+        """构建不持写锁：构建期间的写入在登记前补到分片上"""
+        shards = CategoryShards(self.loader)
+        self.block = True
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(shard=shards.get("hr")))
+        thread.start()
+        self.assertTrue(self.loading.wait(5))
+        # 分片已读完数据源、尚未登记时写入
+        self.write(shards, doc("d", "hr"), doc("a", "sales"))
+        self.delete(shards, "b")
+        self.release.set()
+        thread.join(5)
+        shard = result["shard"]
+        self.assertIs(shards.get("hr"), shard)
+        self.assertEqual(sorted(d for d in ["a", "b", "c", "d"] if d in shard), ["d"])
+
+    def test_clear_during_build(self):
+        shards = CategoryShards(self.loader)
+        self.block = True
+        thread = threading.Thread(target=shards.get, args=("hr",))
+        thread.start()
+        self.assertTrue(self.loading.wait(5))
+        shards.clear()
+        self.release.set()
+        thread.join(5)
+        self.assertNotIn("hr", shards)
+
+
+if __name__ == "__main__":
+    unittest.main()
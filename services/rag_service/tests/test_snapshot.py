@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+
+from tests import service_client, wait_for_jobs
+from snapshot import SNAPSHOT_FORMAT, DeltaLog, current_snapshot, write_snapshot
+
+
+class SnapshotFilesTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_write_switches_current_and_removes_stale(self):
+        # 旧格式快照、被中断的临时目录与其它文件
+        for name in ["v1-10-1700000000000", f"v{SNAPSHOT_FORMAT}-12-1700000000001", ".v2-13-1.tmp"]:
+            os.makedirs(os.path.join(self.root, name))
+        os.makedirs(os.path.join(self.root, "vendor"))
+
+        name = write_snapshot(self.root, 20, lambda directory: None, {"documents": 0})
+        self.assertTrue(name.startswith(f"v{SNAPSHOT_FORMAT}-20-"))
+        self.assertEqual(current_snapshot(self.root), os.path.join(self.root, name))
+        self.assertEqual(sorted(os.listdir(self.root)), sorted(["CURRENT", name, "vendor"]))
+
+    def test_old_format_not_loaded(self):
+        name = write_snapshot(self.root, 1, lambda directory: None, {})
+        with open(os.path.join(self.root, name, "manifest.json"), "w", encoding="utf-8") as f:
+            f.write('{"format": 1, "delta_seq": 1}')
+        self.assertIsNone(current_snapshot(self.root))
+
+
+class DeltaLogTest(unittest.TestCase):
+    def test_append_truncate_reopen(self):
+        with tempfile.TemporaryDirectory() as root:
+            log = DeltaLog(root)
+            self.assertEqual(log.append("upsert", ["a", "b"]), 2)
+            self.assertEqual(log.append("clear"), 3)
+            self.assertEqual(log.append("delete", ["a"]), 4)
+            self.assertEqual([(e["seq"], e["op"], e["id"]) for e in log.entries(1, 3)],
+                             [(2, "upsert", "b"), (3, "clear", None)])
+            log.truncate(3)
+            self.assertEqual([e["seq"] for e in log.entries()], [4])
+            self.assertEqual(log.pending, 1)
+            # 崩溃时写了一半的最后一行被忽略
+            with open(log.path, "a", encoding="utf-8") as f:
+                f.write('{"seq": 5, "op": "ups')
+            reopened = DeltaLog(root, readonly=True)
+            self.assertEqual((reopened.seq, reopened.pending), (4, 1))
+            # 日志已截断为空时，seq 从快照记录的位置继续
+            log.truncate(4)
+            reopened = DeltaLog(root)
+            reopened.advance(4)
+            self.assertEqual(reopened.append("upsert", ["c"]), 5)
+
+
+def index_state(main):
+    """全局索引的内容：文档及其分类、各词项的文档集合"""
+    index = main.text_index
+    docs = {}
+    for doc in main.SAMPLE_DOCUMENTS + [main.Document(id="snap_new", title="", content="", category="")]:
+        docno = index.docno(doc.id)
+        if docno is not None:
+            docs[doc.id] = index.category(docno)
+    terms = {term: sorted(index.doc_id(docno) for docno in index.postings(term))
+             for term in ["年假", "销售", "政策", "快照重放", "微服务"]}
+    return len(index), len(main.vector_index), docs, terms
+
+
+class SnapshotRestoreTest(unittest.TestCase):
+    """快照 + 变更日志重放恢复出的索引与写入后的内存索引一致"""
+
+    def test_restore_replays_changes(self):
+        import main
+        client = service_client()
+        self.assertEqual(client.post("/api/rag/init").status_code, 200)
+        wait_for_jobs()
+        main.save_snapshot({})
+        snapshot_seq = main.delta_log.seq
+
+        sample = main.SAMPLE_DOCUMENTS
+        client.post("/api/rag/documents", json={"id": "snap_new", "title": "快照重放测试", "content": "年假 快照重放",
+                                                "category": "hr", "tags": ["快照重放"]})
+        client.post("/api/rag/documents", json={"id": sample[0].id, "title": "改写的文档", "content": "快照重放后的内容",
+                                                "category": "operations", "tags": []})
+        client.delete(f"/api/rag/documents/{sample[1].id}")
+        wait_for_jobs()
+        self.assertGreater(main.delta_log.seq, snapshot_seq)
+        expected = index_state(main)
+        self.assertIn("snap_new", expected[2])
+        self.assertNotIn(sample[1].id, expected[2])
+
+        # 模拟重启：清空内存索引，从快照加载并重放快照之后的变更
+        with main.index_write_lock:
+            main.text_index.clear()
+            main.text_shards.clear()
+            main.vector_index.clear()
+            self.assertTrue(main.restore_from_snapshot())
+        self.assertEqual(main.snapshot_path, current_snapshot(main.SNAPSHOT_DIR))
+        self.assertEqual(index_state(main), expected)
+
+        # 与从数据库完整重建的结果一致
+        with main.index_write_lock:
+            main.build_index()
+            main.load_vectors()
+        self.assertEqual(index_state(main), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
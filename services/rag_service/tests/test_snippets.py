@@ -0,0 +1,93 @@
+import unittest
+
+import tests  # noqa: F401
+from segmenter import Segmenter
+from snippets import SNIPPET_WINDOW_CHARS, extract_snippets, query_matcher
+from tests import service_client, wait_for_jobs
+
+FILLER = "这一段是与查询无关的填充内容。"
+
+
+class ExtractSnippetsTest(unittest.TestCase):
+    def setUp(self):
+        self.matcher = query_matcher("报销流程", Segmenter(["报销", "流程", "报销流程"]))
+
+    def test_short_content_returned_whole(self):
+        self.assertEqual(extract_snippets("报销流程说明", self.matcher, 100), [(0, 6)])
+        self.assertEqual(extract_snippets("报销流程说明", self.matcher, 0), [])
+
+    def test_no_match_returns_beginning(self):
+        content = FILLER * 50
+        self.assertEqual(extract_snippets(content, self.matcher, 50), [(0, 50)])
+
+    def test_windows_cover_matches_within_budget(self):
+        content = FILLER * 40 + "报销流程" + FILLER * 40 + "报销" + FILLER * 40
+        for budget in (30, 100, 2 * SNIPPET_WINDOW_CHARS, len(content) - 1):
+            with self.subTest(budget=budget):
+                windows = extract_snippets(content, self.matcher, budget)
+                self.assertLessEqual(sum(end - start for start, end in windows), budget)
+                self.assertEqual(windows, sorted(windows))
+                for (_, end), (start, _) in zip(windows, windows[1:]):
+                    self.assertLess(end, start)
+                self.assertIn("报销", content[windows[0][0]:windows[0][1]])
+                self.assertTrue(all(0 <= start < end <= len(content) for start, end in windows))
+
+
+class SnippetServiceTest(unittest.TestCase):
+    """检索返回的片段偏移量切回原文恰好是片段文本，片段总长不超过预算"""
+
+    CONTENTS = {
+        "snippet_doc_1": FILLER * 30 + "差旅报销流程：先提交申请，再由主管审批。" + FILLER * 30,
+        "snippet_doc_2": "报销流程概述。" + FILLER * 60 + "报销需附发票，😀 表情与\r\n换行不影响偏移。" + FILLER * 10,
+        "snippet_doc_3": "简短的报销流程说明。",
+    }
+
+    def setUp(self):
+        self.client = service_client()
+        wait_for_jobs()
+
+    def check_snippets(self, documents, budget):
+        self.assertTrue(documents)
+        total = 0
+        for doc in documents:
+            content = self.CONTENTS[doc["id"]]
+            self.assertEqual(doc["content"], "")
+            self.assertTrue(doc["snippets"])
+            for snippet in doc["snippets"]:
+                self.assertEqual(content[snippet["start"]:snippet["end"]], snippet["text"])
+                total += len(snippet["text"])
+            self.assertTrue(any("报销" in snippet["text"] for snippet in doc["snippets"]))
+        self.assertLessEqual(total, budget)
+
+    def test_snippet_offsets(self):
+        response = self.client.post("/api/rag/documents/bulk", json=[
+            {"id": doc_id, "title": "片段测试", "content": content, "category": "snippet_test"}
+            for doc_id, content in self.CONTENTS.items()
+        ])
+        self.assertEqual(response.status_code, 200, response.text)
+        query = {"query": "报销流程", "mode": "bm25", "category": "snippet_test", "top_k": 3}
+
+        for budget in (90, 300, 2000):
+            with self.subTest(budget=budget):
+                response = self.client.post("/api/rag/search", json=dict(query, max_snippet_chars=budget))
+                self.assertEqual(response.status_code, 200, response.text)
+                self.check_snippets(response.json()["documents"], budget)
+
+        response = self.client.post("/api/rag/search/batch", json={"queries": [
+            dict(query, max_snippet_chars=120), query
+        ]})
+        with_snippets, full = response.json()["results"]
+        self.check_snippets(with_snippets["documents"], 120)
+        # 片段替换不影响缓存中的结果：不指定预算时仍返回全文
+        for doc in full["documents"]:
+            self.assertIsNone(doc["snippets"])
+            self.assertEqual(doc["content"], self.CONTENTS[doc["id"]])
+
+        self.assertEqual(self.client.post("/api/rag/search", json=dict(query, max_snippet_chars=-1)).status_code, 400)
+        for doc_id in self.CONTENTS:
+            self.assertEqual(self.client.delete(f"/api/rag/documents/{doc_id}").status_code, 200)
+        wait_for_jobs()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,452 @@
+"""
+向量检索 - 本地哈希嵌入 + NumPy 矩阵 top-k
+
+嵌入完全离线：字符 1-3 gram 经哈希投影到固定维度（sublinear tf，L2 归一化），
+查询时再按各维度的文档频率加权（idf）。所有文档向量保存在一个连续的矩阵中，
+一次查询就是一次矩阵乘法加 argpartition。
+
+矩阵默认为 float32；quantization="int8" 时逐行对称量化为 int8 + 每行一个 float32 缩放系数，
+内存约为 float32 的 1/4。打分时按 DEQUANT_BLOCK_ROWS 行一块还原为 float32（块常驻 CPU 缓存）再做矩阵乘法，
+查询向量保持 float32 不量化。
+"""
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from storage import StringTable, load_array, save_array
+
+DEFAULT_DIM = 512
+QUANTIZATION_MODES = ("none", "int8")
+DEQUANT_BLOCK_ROWS = 256
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    逐行对称量化：scale = max|x| / 127，code = round(x / scale)
+
+    非零分量至少量化为 ±1，各维度的非零文档数（idf）与 float32 存储时一致。
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0)
+    safe = np.where(scales > 0, scales, 1.0)
+    codes = np.rint(vectors / safe[:, None])
+    codes = np.where((codes == 0) & (vectors != 0), np.sign(vectors), codes)
+    return codes.astype(np.int8), scales.astype(np.float32)
+
+
+class HashingEmbedder:
+    """字符 n-gram 哈希嵌入"""
+
+    def __init__(self, dim: int = DEFAULT_DIM, ngram_range: Tuple[int, int] = (1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    @property
+    def model_name(self) -> str:
+        low, high = self.ngram_range
+        return f"hash-ngram-{low}{high}-{self.dim}"
+
+    def _embed_into(self, text: str, out: np.ndarray):
+        text = text.lower()
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                gram = text[i:i + n]
+                if gram.isspace():
+                    continue
+                h = zlib.crc32(gram.encode("utf-8"))
+                # 低位选维度，最高位决定符号，减少哈希冲突带来的偏差
+                out[h % self.dim] += -1.0 if h & 0x80000000 else 1.0
+
+        nonzero = out != 0
+        out[nonzero] = np.sign(out[nonzero]) * (1.0 + np.log(np.abs(out[nonzero])))
+        norm = np.linalg.norm(out)
+        if norm > 0:
+            out /= norm
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        self._embed_into(text, vector)
+        return vector
+
+    def embed_batch(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            self._embed_into(text, matrix[i])
+        return matrix
+
+
+class VectorSnapshot:
+    """
+    向量索引快照：doc_ids、向量矩阵、分类编号与名称、各维度文档频率（矩阵与分类编号末尾可有预留空行）
+
+    int8 量化存储时另有每行的缩放系数 scales（与矩阵等长），float32 存储时 scales 为 None。
+    """
+
+    def __init__(self, doc_ids: List[str], matrix: np.ndarray, category_codes: np.ndarray,
+                 category_names: List[str], df: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.doc_ids = doc_ids
+        self.matrix = matrix
+        self.category_codes = category_codes
+        self.category_names = category_names
+        self.df = df
+        self.scales = scales
+
+    def save(self, directory: str):
+        StringTable.from_strings(self.doc_ids).save(directory, "vector_ids")
+        save_array(directory, "vectors", self.matrix)
+        save_array(directory, "vector_categories", self.category_codes)
+        StringTable.from_strings(self.category_names).save(directory, "vector_category_names")
+        save_array(directory, "vector_df", self.df)
+        if self.scales is not None:
+            save_array(directory, "vector_scales", self.scales)
+
+    @classmethod
+    def load(cls, directory: str) -> "VectorSnapshot":
+        matrix = load_array(directory, "vectors", "c")
+        return cls(
+            StringTable.load(directory, "vector_ids", None).tolist(),
+            matrix,
+            load_array(directory, "vector_categories", None),
+            StringTable.load(directory, "vector_category_names", None).tolist(),
+            load_array(directory, "vector_df", None),
+            load_array(directory, "vector_scales", "c") if matrix.dtype == np.int8 else None,
+        )
+
+
+class VectorIndex:
+    """连续矩阵存储的向量索引（float32 或 int8 量化），删除时用最后一行填补空位"""
+
+    def __init__(self, dim: int = DEFAULT_DIM, initial_capacity: int = 1024, max_cached_categories: int = 8,
+                 quantization: str = "none"):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATION_MODES}")
+        self.dim = dim
+        self.max_cached_categories = max_cached_categories
+        self.quantization = quantization
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((initial_capacity, dim), dtype=self._dtype)
+        # 量化存储时每行的缩放系数（float32 存储时为 None）
+        self._scales = np.zeros(initial_capacity, dtype=np.float32) if self.quantized else None
+        self._size = 0
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._category_codes = np.zeros(initial_capacity, dtype=np.int32)
+        self._category_names: Dict[str, int] = {}
+        # 每个维度上非零的文档数，用于查询时的 idf 加权
+        self._df = np.zeros(dim, dtype=np.int64)
+        # 分类分片：分类编号 -> (行号, 该分类向量的连续矩阵, 缩放系数)，LRU 常驻，分类内容变化时失效
+        self._category_cache: "OrderedDict[int, Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]]" = OrderedDict()
+
+    @property
+    def quantized(self) -> bool:
+        return self.quantization == "int8"
+
+    @property
+    def _dtype(self):
+        return np.int8 if self.quantized else np.float32
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._rows
+
+    @property
+    def nbytes(self) -> int:
+        scales = self._scales[:self._size].nbytes if self._scales is not None else 0
+        return self._matrix[:self._size].nbytes + scales
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._ids.clear()
+            self._rows.clear()
+            self._df[:] = 0
+            self._category_cache.clear()
+
+    def _category_code(self, category: str) -> int:
+        return self._category_names.setdefault(category, len(self._category_names))
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self._matrix):
+            return
+        new_capacity = max(capacity, len(self._matrix) * 2)
+        matrix = np.zeros((new_capacity, self.dim), dtype=self._dtype)
+        matrix[:self._size] = self._matrix[:self._size]
+        codes = np.zeros(new_capacity, dtype=np.int32)
+        codes[:self._size] = self._category_codes[:self._size]
+        if self._scales is not None:
+            scales = np.zeros(new_capacity, dtype=np.float32)
+            scales[:self._size] = self._scales[:self._size]
+            self._scales = scales
+        self._matrix = matrix
+        self._category_codes = codes
+
+    def add_batch(self, doc_ids: Sequence[str], vectors: np.ndarray, categories: Sequence[str]):
+        """批量添加（或替换）向量"""
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove_locked(doc_id)
+            self._reserve(self._size + len(doc_ids))
+            start = self._size
+            end = start + len(doc_ids)
+            if self.quantized:
+                self._matrix[start:end], self._scales[start:end] = quantize_int8(vectors)
+            else:
+                self._matrix[start:end] = vectors
+            codes = [self._category_code(c) for c in categories]
+            self._category_codes[start:end] = codes
+            self._invalidate(codes)
+            for offset, doc_id in enumerate(doc_ids):
+                self._rows[doc_id] = start + offset
+            self._ids.extend(doc_ids)
+            self._df += np.count_nonzero(vectors, axis=0)
+            self._size = end
+
+    def add(self, doc_id: str, vector: np.ndarray, category: str):
+        self.add_batch([doc_id], vector.reshape(1, -1), [category])
+
+    def remove(self, doc_id: str) -> bool:
+        with self._lock:
+            return self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: str) -> bool:
+        row = self._rows.pop(doc_id, None)
+        if row is None:
+            return False
+        self._df -= self._matrix[row] != 0
+        last = self._size - 1
+        # 被删除行与被移动行所在分类的行号都会变化
+        self._invalidate((self._category_codes[row], self._category_codes[last]))
+        if row != last:
+            moved_id = self._ids[last]
+            self._matrix[row] = self._matrix[last]
+            if self._scales is not None:
+                self._scales[row] = self._scales[last]
+            self._category_codes[row] = self._category_codes[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+        self._ids.pop()
+        self._size = last
+        return True
+
+    def idf(self) -> np.ndarray:
+        return (np.log((self._size + 1) / (self._df + 1)) + 1.0).astype(np.float32)
+
+    def weight_query(self, query_vector: np.ndarray) -> np.ndarray:
+        """按 idf 加权并归一化查询向量"""
+        weighted = query_vector * self.idf()
+        norm = np.linalg.norm(weighted)
+        return weighted / norm if norm > 0 else weighted
+
+    @staticmethod
+    def _dot(matrix: np.ndarray, scales: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+        """
+        矩阵各行与查询的内积：queries 为 (dim,) 时返回 (rows,)，为 (n, dim) 时返回 (n, rows)
+
+        量化矩阵分块还原为 float32 后走 BLAS，最后乘以各行的缩放系数。
+        """
+        if scales is None:
+            return matrix @ queries if queries.ndim == 1 else queries @ matrix.T
+        scores = np.empty(queries.shape[:-1] + (len(matrix),), dtype=np.float32)
+        for start in range(0, len(matrix), DEQUANT_BLOCK_ROWS):
+            block = matrix[start:start + DEQUANT_BLOCK_ROWS].astype(np.float32)
+            scores[..., start:start + len(block)] = block @ queries if queries.ndim == 1 else queries @ block.T
+        scores *= scales
+        return scores
+
+    def _scales_of(self, rows) -> Optional[np.ndarray]:
+        return self._scales[rows] if self._scales is not None else None
+
+    def search(self, query_vector: np.ndarray, top_k: int = 5,
+               category: Optional[str] = None) -> List[Tuple[str, float]]:
+        """返回 [(doc_id, score)]，按相似度降序"""
+        with self._lock:
+            if self._size == 0 or top_k <= 0:
+                return []
+            query = self.weight_query(query_vector)
+            if category is None:
+                rows = None
+                scores = self._dot(self._matrix[:self._size], self._scales_of(slice(0, self._size)), query)
+            else:
+                code = self._category_names.get(category)
+                if code is None:
+                    return []
+                rows, matrix, scales = self._category_shard(code)
+                if matrix is not None:
+                    scores = self._dot(matrix, scales, query)
+                else:
+                    scores = self._dot(self._matrix[:self._size], self._scales_of(slice(0, self._size)), query)[rows]
+            return self._top_k(scores, rows, top_k)
+
+    def _category_shard(self, code: int) -> Tuple[np.ndarray, Optional[np.ndarray], Optional[np.ndarray]]:
+        """返回该分类的 (行号, 子矩阵, 缩放系数)；不缓存分类时子矩阵为 None，由调用方按行号取用"""
+        if self.max_cached_categories <= 0:
+            # 多个进程共享 mmap 矩阵时不复制子矩阵，否则内存随进程数增长
+            return np.flatnonzero(self._category_codes[:self._size] == code), None, None
+        shard = self._category_cache.get(code)
+        if shard is None:
+            rows = np.flatnonzero(self._category_codes[:self._size] == code)
+            shard = (rows, self._matrix[rows], self._scales_of(rows))
+            self._category_cache[code] = shard
+            while len(self._category_cache) > self.max_cached_categories:
+                self._category_cache.popitem(last=False)
+        else:
+            self._category_cache.move_to_end(code)
+        return shard
+
+    def cached_categories(self) -> List[str]:
+        with self._lock:
+            names = {code: name for name, code in self._category_names.items()}
+            return [names[code] for code in self._category_cache]
+
+    def _invalidate(self, codes):
+        for code in set(int(c) for c in codes):
+            self._category_cache.pop(code, None)
+
+    def search_batch(self, query_vectors: np.ndarray, top_k: int = 5, category: Optional[str] = None,
+                     doc_ids: Optional[Sequence[str]] = None) -> List[List[Tuple[str, float]]]:
+        """多个查询一次矩阵乘法打分，返回每个查询的 [(doc_id, score)]；指定 doc_ids 时只在这些文档中打分"""
+        with self._lock:
+            if self._size == 0 or top_k <= 0:
+                return [[] for _ in range(len(query_vectors))]
+            weighted = query_vectors * self.idf()
+            norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            queries = weighted / norms
+            if doc_ids is not None:
+                rows = np.fromiter((self._rows[d] for d in doc_ids if d in self._rows), dtype=np.int64)
+                if category is not None:
+                    code = self._category_names.get(category)
+                    rows = rows[self._category_codes[rows] == code] if code is not None else rows[:0]
+                if len(rows) == 0:
+                    return [[] for _ in range(len(query_vectors))]
+                matrix, scales = self._matrix[rows], self._scales_of(rows)
+            elif category is None:
+                rows = None
+                matrix, scales = self._matrix[:self._size], self._scales_of(slice(0, self._size))
+            else:
+                code = self._category_names.get(category)
+                if code is None:
+                    return [[] for _ in range(len(query_vectors))]
+                rows, matrix, scales = self._category_shard(code)
+            if matrix is not None:
+                scores = self._dot(matrix, scales, queries)
+            else:
+                scores = self._dot(self._matrix[:self._size], self._scales_of(slice(0, self._size)), queries)[:, rows]
+            return [self._top_k(query_scores, rows, top_k) for query_scores in scores]
+
+    def search_subset(self, query_vector: np.ndarray, doc_ids: Sequence[str], top_k: int = 5,
+                      category: Optional[str] = None) -> List[Tuple[str, float]]:
+        """只在给定的候选文档中打分（供 ANN 索引与过滤表达式使用）"""
+        with self._lock:
+            if top_k <= 0:
+                return []
+            rows = np.fromiter((self._rows[d] for d in doc_ids if d in self._rows), dtype=np.int64)
+            if category is not None:
+                code = self._category_names.get(category)
+                if code is None:
+                    return []
+                rows = rows[self._category_codes[rows] == code]
+            if len(rows) == 0:
+                return []
+            scores = self._dot(self._matrix[rows], self._scales_of(rows), self.weight_query(query_vector))
+            return self._top_k(scores, rows, top_k)
+
+    def _vectors(self, rows) -> np.ndarray:
+        """取出若干行的 float32 向量（拷贝；量化存储时为还原后的近似值）"""
+        if self._scales is None:
+            return self._matrix[rows].copy()
+        return self._matrix[rows].astype(np.float32) * self._scales[rows][:, None]
+
+    def sample(self, size: int, seed: int = 0) -> np.ndarray:
+        """随机抽样向量（拷贝），用于训练聚类中心"""
+        with self._lock:
+            size = min(size, self._size)
+            rows = np.random.default_rng(seed).choice(self._size, size, replace=False)
+            return self._vectors(np.sort(rows))
+
+    def iter_batches(self, batch_size: int) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """分批遍历 (doc_ids, 向量拷贝)，每批单独加锁，不阻塞并发写入"""
+        start = 0
+        while True:
+            with self._lock:
+                if start >= self._size:
+                    return
+                end = min(start + batch_size, self._size)
+                batch = (self._ids[start:end], self._vectors(slice(start, end)))
+            yield batch
+            start = end
+
+    def get_vectors(self, doc_ids: Sequence[str]) -> np.ndarray:
+        with self._lock:
+            return self._vectors([self._rows[d] for d in doc_ids])
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._ids)
+
+    def export(self, headroom: int = 0) -> "VectorSnapshot":
+        """
+        导出当前内容的拷贝，供后台写快照使用
+
+        headroom 为矩阵末尾预留的空行数：加载快照后新增的向量写入预留行（写时复制只复制被写的页），
+        预留行用完之前不必把整个 mmap 矩阵复制到进程私有内存。
+        """
+        with self._lock:
+            matrix = np.zeros((self._size + headroom, self.dim), dtype=self._dtype)
+            matrix[:self._size] = self._matrix[:self._size]
+            category_codes = np.zeros(self._size + headroom, dtype=np.int32)
+            category_codes[:self._size] = self._category_codes[:self._size]
+            scales = None
+            if self._scales is not None:
+                scales = np.zeros(self._size + headroom, dtype=np.float32)
+                scales[:self._size] = self._scales[:self._size]
+            return VectorSnapshot(
+                list(self._ids),
+                matrix,
+                category_codes,
+                sorted(self._category_names, key=self._category_names.get),
+                self._df.copy(),
+                scales,
+            )
+
+    def load_snapshot(self, directory: str):
+        """
+        从快照加载向量
+
+        矩阵以写时复制方式 mmap：不修改的页直接共享页缓存，删除时的行移动只复制被写的页。
+        """
+        snapshot = VectorSnapshot.load(directory)
+        if snapshot.matrix.shape[1:] != (self.dim,):
+            raise ValueError(f"Vector snapshot has shape {snapshot.matrix.shape}, expected dim {self.dim}")
+        if snapshot.matrix.dtype != self._dtype:
+            raise ValueError(f"Vector snapshot has dtype {snapshot.matrix.dtype}, expected {np.dtype(self._dtype)}")
+        with self._lock:
+            self._size = len(snapshot.doc_ids)
+            if len(snapshot.matrix):
+                self._matrix = snapshot.matrix
+                self._scales = snapshot.scales
+                self._category_codes = np.array(snapshot.category_codes, dtype=np.int32)
+            else:
+                self._matrix = np.zeros((1024, self.dim), dtype=self._dtype)
+                self._scales = np.zeros(1024, dtype=np.float32) if self.quantized else None
+                self._category_codes = np.zeros(1024, dtype=np.int32)
+            self._ids = snapshot.doc_ids
+            self._rows = {doc_id: row for row, doc_id in enumerate(snapshot.doc_ids)}
+            self._category_names = {name: code for code, name in enumerate(snapshot.category_names)}
+            self._category_cache.clear()
+            self._df = np.array(snapshot.df, dtype=np.int64)
+
+    def _top_k(self, scores: np.ndarray, rows: Optional[np.ndarray], top_k: int) -> List[Tuple[str, float]]:
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        if rows is not None:
+            return [(self._ids[rows[i]], float(scores[i])) for i in best]
+        return [(self._ids[i], float(scores[i])) for i in best]
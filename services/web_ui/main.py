@@ -22,6 +22,8 @@ import logging
 import uuid
 import sys
 
+from matcher import KeywordMatcher
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -1182,35 +1184,35 @@ def search_local_knowledge(query: str) -> list:
             keywords.add(text[i:i+3])
         return keywords
     
-    query_keywords = extract_keywords(query)
+    query_keywords = {keyword for keyword in extract_keywords(query) if len(keyword) >= 2}
     MIN_SCORE_THRESHOLD = 30  # 最低分数阈值
+    # 查询文本与全部词组编译为一个自动机，每个字段只扫描一遍
+    matcher = KeywordMatcher(query_keywords | {query})
     
     results = []
     for row in rows:
-        title = row['title']
-        content = row['content']
-        tags = row['tags'] or ''
-        full_text = f"{title} {content} {tags}"
+        title_hits = matcher.matched(row['title'])
+        content_hits = matcher.matched(row['content'])
+        tags_hits = matcher.matched(row['tags'] or '')
         
         score = 0
         
-        # 1. 完全匹配查询文本（最高优先级）
-        if query in title:
+        # 1. 完全匹配查询文本（最高优先级；空查询视为处处匹配）
+        if not query or query in title_hits:
             score += 200
-        if query in content:
+        if not query or query in content_hits:
             score += 100
-        if query in tags:
+        if not query or query in tags_hits:
             score += 80
         
-        # 2. 词组匹配（至少2字的词组才计分）
-        for keyword in query_keywords:
-            if len(keyword) >= 2:
-                if keyword in title:
-                    score += 50
-                elif keyword in content:
-                    score += 20
-                elif keyword in tags:
-                    score += 30
+        # 2. 词组匹配（至少2字的词组才计分），只遍历命中的词组
+        for keyword in (title_hits | content_hits | tags_hits) & query_keywords:
+            if keyword in title_hits:
+                score += 50
+            elif keyword in content_hits:
+                score += 20
+            elif keyword in tags_hits:
+                score += 30
         
         # 只返回分数达到阈值的文档
         if score >= MIN_SCORE_THRESHOLD:
@@ -1230,12 +1232,13 @@ def search_local_knowledge(query: str) -> list:
     return results[:10]
 
 @app.get("/api/rag/documents")
-async def get_documents():
-    """获取知识库文档"""
+async def get_documents(request: Request):
+    """获取知识库文档（分页参数 limit / cursor / fields / category 原样转发给 RAG 服务）"""
     try:
         async with aiohttp.ClientSession() as session:
             async with session.get(
                 f"{RAG_SERVICE_URL}/api/rag/documents",
+                params=dict(request.query_params),
                 timeout=aiohttp.ClientTimeout(total=5)
             ) as resp:
                 if resp.status == 200:
@@ -0,0 +1,77 @@
+"""
+多模式匹配 - Aho-Corasick 自动机
+
+把查询的全部关键词编译为一个自动机，每段文本只扫描一遍即可找出所有关键词的全部出现位置，
+扫描代价只与文本长度（和命中数）有关，不随关键词数量增长。
+失败指针在构建时展开为完整的状态转移表（DFA），扫描时每个字符只查一次字典。
+
+rag_service 与 web_ui 各自独立构建镜像，web_ui/matcher.py 是本文件的副本，两处须同步修改
+（rag_service/tests/test_matcher.py 检查两份内容一致）。
+"""
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class KeywordMatcher:
+    """编译后的关键词集合；空字符串不参与匹配"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = sorted({pattern for pattern in patterns if pattern})
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[str]] = [[]]
+        for pattern in self.patterns:
+            state = 0
+            for ch in pattern:
+                next_state = goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][ch] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(pattern)
+
+        # 按 BFS 顺序计算失败指针，同时把转移补全为 DFA：
+        # 状态 s 在字符 ch 上没有 trie 边时，转移等于其失败状态在 ch 上的转移
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])]
+        delta.extend({} for _ in range(len(goto) - 1))
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            transitions = dict(delta[fail[state]])
+            for ch, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(ch, 0)
+                transitions[ch] = child
+                queue.append(child)
+            delta[state] = transitions
+            # 失败状态更浅、先出队，其输出已包含更短的后缀匹配
+            outputs[state] = outputs[state] + outputs[fail[state]]
+        self._delta = delta
+        self._outputs: List[Tuple[str, ...]] = [tuple(output) for output in outputs]
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """全部出现位置 [(start, end, 关键词)]（包括互相重叠的），按 (start, end) 排序"""
+        delta, outputs = self._delta, self._outputs
+        hits = []
+        state = 0
+        for i, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            for pattern in outputs[state]:
+                hits.append((i + 1 - len(pattern), i + 1, pattern))
+        hits.sort()
+        return hits
+
+    def matched(self, text: str) -> Set[str]:
+        """文本中出现过的关键词"""
+        delta, outputs = self._delta, self._outputs
+        found: Set[str] = set()
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found